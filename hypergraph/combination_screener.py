@@ -0,0 +1,446 @@
+import pandas as pd
+import numpy as np
+import heapq
+import itertools
+import os
+from math import comb
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from fileIO import readXLSX, read_KGML, read_cloneID_to_orf_table
+from drug_data import Drug_Data
+from kegg_network import KEGG_Network
+from gene_index import Gene_Index
+from l1_scores import L1_scores, combination_scores
+
+# per process state of the pool workers, set by _init_worker
+_worker_state = {}
+
+
+class Combination_Screener:
+
+    """Screens every k-drug combination from Drug_Data.drug_list against a network
+
+    A drug contributes the significant values of all of its replicate cols,
+    so the score of a drug combination is the L1 score (see
+    L1_scores.compute_L1) over the union of its drugs' replicate cols.
+
+    Attributes
+    ----------
+    drug_data : Drug_Data
+        Custom Drug Data object that holds DE data
+    drug_level_values : 2d array
+        (network gene x drug) significant values summed over each drug's
+        replicate cols, insignificant values count as 0
+    drug_list : list
+        names of the drugs, combinations are indices into this list
+    l1_scores : L1_scores
+        scorer used to resolve the network genes and significance mask
+    network : KEGG_Network
+        network whose genes are scored
+    """
+
+    def __init__(self, drug_data, network, clone_ORF_lookup=None, gene_index=None):
+        self.drug_data = drug_data
+        self.network = network
+        self.drug_list = drug_data.drug_list
+        self.l1_scores = L1_scores(drug_data, gene_index)
+
+        genes_in_network_index_list = self.l1_scores.get_network_gene_indices(
+            network, clone_ORF_lookup
+        )
+        sig_values = self.l1_scores.create_sig_values_in_network(
+            genes_in_network_index_list
+        )
+        self.drug_level_values = self.create_drug_level_values(sig_values)
+
+    def create_drug_level_values(self, sig_values):
+        """Sums the replicate cols of each drug
+
+        Parameters
+        ----------
+        sig_values : 2d array
+            (network gene x drug col) significant values, from
+            L1_scores.create_sig_values_in_network
+
+        Returns
+        -------
+        2d array
+            (network gene x drug) values
+        """
+        drug_level_values = np.zeros((sig_values.shape[0], len(self.drug_list)))
+        for drug, cols in enumerate(self.drug_data.drug_column_indices):
+            for col in cols:
+                drug_level_values[:, drug] += sig_values[:, col]
+        return drug_level_values
+
+    def get_max_score(self, k):
+        """Upper bound on the score of any k-drug combination
+
+        Each gene contributes at most the sum of its k largest absolute values
+        """
+        abs_values = np.sort(np.abs(self.drug_level_values), axis=1)
+        if abs_values.shape[1] == 0:
+            return 0.0
+        return abs_values[:, -k:].sum()
+
+    def iter_combination_chunks(self, k, chunk_size):
+        """Yields every k-drug combination in lexicographic order, in chunks
+
+        Returns
+        -------
+        generator
+            yields 2d arrays of ints, each row is one combination
+        """
+        combinations = itertools.combinations(range(len(self.drug_list)), k)
+        while True:
+            chunk = np.fromiter(
+                itertools.chain.from_iterable(
+                    itertools.islice(combinations, chunk_size)
+                ),
+                dtype=np.intp,
+            )
+            if len(chunk) == 0:
+                return
+            yield chunk.reshape(-1, k)
+
+    def iter_screen(
+        self, k, top_k=100, n_workers=None, chunk_size=10000, histogram_bins=None
+    ):
+        """Scores all k-drug combinations, yielding each chunk's result as
+        soon as it is done
+
+        Chunks are handed to a process pool, at most two per worker are in
+        flight at any time, so memory stays bounded no matter how many
+        combinations there are.
+
+        Parameters
+        ----------
+        k : int
+            number of drugs per combination
+        top_k : int, optional
+            number of best combinations kept per chunk
+        n_workers : int, optional
+            size of the process pool, defaults to the cpu count, 1 scores
+            the chunks in this process
+        chunk_size : int, optional
+            number of combinations per chunk
+        histogram_bins : int or 1d array, optional
+            bin edges (or number of equal bins from 0 to get_max_score) of a
+            histogram of all scores, None for no histogram
+
+        Returns
+        -------
+        generator
+            yields (Top_K, histogram counts or None, number scored) per chunk,
+            in the order the chunks finish
+        """
+        histogram_edges = self.get_histogram_edges(k, histogram_bins)
+        chunks = self.iter_combination_chunks(k, chunk_size)
+        init_args = (self.drug_level_values, top_k, histogram_edges)
+
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        if n_workers <= 1:
+            _init_worker(*init_args)
+            for chunk in chunks:
+                yield _screen_chunk(chunk)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=n_workers, initializer=_init_worker, initargs=init_args
+        ) as executor:
+            pending = set()
+            for chunk in chunks:
+                pending.add(executor.submit(_screen_chunk, chunk))
+                if len(pending) >= 2 * n_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    def screen(
+        self, k, top_k=100, n_workers=None, chunk_size=10000, histogram_bins=None
+    ):
+        """Finds the top_k highest scoring k-drug combinations
+
+        Chunk results are merged as they stream out of iter_screen, only the
+        best top_k combinations are ever held. Ties are broken in favor of
+        the lexicographically smaller combination.
+
+        Parameters
+        ----------
+        k, top_k, n_workers, chunk_size, histogram_bins
+            see iter_screen
+
+        Returns
+        -------
+        dataframe
+            cols are: drug_combination (tuple of indices into drug_list),
+            drugs (tuple of drug names), L1_score, best score first
+        1d array or None
+            histogram counts of all scores (with the bin edges from
+            get_histogram_edges), None if histogram_bins is None
+        """
+        best = Top_K(top_k)
+        histogram = None
+        for chunk_best, chunk_histogram, _ in self.iter_screen(
+            k, top_k, n_workers, chunk_size, histogram_bins
+        ):
+            best.merge(chunk_best)
+            if chunk_histogram is not None:
+                if histogram is None:
+                    histogram = chunk_histogram
+                else:
+                    histogram = histogram + chunk_histogram
+
+        return self.create_result_table(best), histogram
+
+    def search(self, k, top_k=100):
+        """Finds the top_k highest scoring k-drug combinations by branch and
+        bound, without scoring every combination
+
+        Combinations are built one drug at a time. For a partial combination
+        with row sums p and m drugs still to pick from the drugs after the
+        last one picked, each gene's final row sum lies between p - N and
+        p + P, where P (N) is the sum of the m largest positive (negative)
+        values of that gene among those drugs. So the score of every
+        completion is at most sum(max(|p + P|, |p - N|)), and partial
+        combinations whose bound is below the current top_k threshold are
+        dropped along with all of their completions.
+
+        Returns exactly the same top_k as screen (leaves are scored with the
+        same kernel), ties are broken the same way.
+
+        Parameters
+        ----------
+        k : int
+            number of drugs per combination
+        top_k : int, optional
+            number of best combinations to find
+
+        Returns
+        -------
+        dataframe
+            same format as screen
+        int
+            number of combinations that were pruned (never scored)
+        """
+        num_drugs = len(self.drug_list)
+        best = Top_K(top_k)
+        if k < 1 or k > num_drugs:
+            return self.create_result_table(best), 0
+
+        values = self.drug_level_values
+        drug_major_values = np.ascontiguousarray(values.T)
+        positive_bounds, negative_bounds = self.create_suffix_bounds(k)
+        num_pruned = 0
+
+        def branch(prefix, row_sums):
+            nonlocal num_pruned
+            depth = len(prefix)
+            first = prefix[-1] + 1 if prefix else 0
+            # the next drug must leave room for the remaining picks
+            candidates = np.arange(first, num_drugs - (k - depth) + 1)
+
+            # one pick left: score every completion with the batched kernel
+            if depth == k - 1:
+                combos = np.empty((len(candidates), k), dtype=np.intp)
+                combos[:, :depth] = prefix
+                combos[:, depth] = candidates
+                best.push_many(combination_scores(values, combos), combos)
+                return
+
+            remaining = k - depth - 1
+            if row_sums is None:
+                child_sums = drug_major_values[candidates]
+            else:
+                child_sums = row_sums + drug_major_values[candidates]
+            child_bounds = np.maximum(
+                np.abs(child_sums + positive_bounds[candidates + 1, remaining]),
+                np.abs(child_sums - negative_bounds[candidates + 1, remaining]),
+            ).sum(axis=1)
+
+            # most promising first, so the threshold rises quickly
+            for i in np.argsort(-child_bounds, kind="stable"):
+                threshold = best.get_threshold()
+                slack = 1e-9 * max(1.0, abs(threshold))
+                if child_bounds[i] < threshold - slack:
+                    num_pruned += comb(num_drugs - candidates[i] - 1, remaining)
+                    continue
+                branch(prefix + [int(candidates[i])], child_sums[i])
+
+        branch([], None)
+        return self.create_result_table(best), num_pruned
+
+    def create_suffix_bounds(self, k):
+        """Sums of the largest positive/negative values over drug suffixes
+
+        Returns
+        -------
+        3d array
+            [j, m, gene] sum of the m largest positive values of the gene
+            among drugs j, j + 1, ... (0 if there are fewer than m)
+        3d array
+            same for the magnitudes of the negative values
+        """
+        num_genes, num_drugs = self.drug_level_values.shape
+        positive_bounds = np.zeros((num_drugs + 1, k + 1, num_genes))
+        negative_bounds = np.zeros((num_drugs + 1, k + 1, num_genes))
+        positive = np.maximum(self.drug_level_values, 0)
+        negative = np.maximum(-self.drug_level_values, 0)
+        for j in range(num_drugs):
+            # largest first, per gene
+            sorted_positive = -np.sort(-positive[:, j:], axis=1)
+            sorted_negative = -np.sort(-negative[:, j:], axis=1)
+            for m in range(1, k + 1):
+                positive_bounds[j, m] = sorted_positive[:, :m].sum(axis=1)
+                negative_bounds[j, m] = sorted_negative[:, :m].sum(axis=1)
+        return positive_bounds, negative_bounds
+
+    def get_histogram_edges(self, k, histogram_bins):
+        """Turns histogram_bins into bin edges, see iter_screen"""
+        if histogram_bins is None:
+            return None
+        if np.ndim(histogram_bins) == 0:
+            max_score = self.get_max_score(k)
+            return np.linspace(0, max(max_score, 1e-12), int(histogram_bins) + 1)
+        return np.asarray(histogram_bins, dtype=np.float64)
+
+    def create_result_table(self, best):
+        """Creates the result dataframe of a Top_K, best score first"""
+        items = best.get_items()
+        combinations = [combo for score, combo in items]
+        return pd.DataFrame(
+            {
+                "drug_combination": combinations,
+                "drugs": [tuple(self.drug_list[i] for i in c) for c in combinations],
+                "L1_score": [score for score, combo in items],
+            },
+            columns=["drug_combination", "drugs", "L1_score"],
+        )
+
+
+class Top_K:
+
+    """Keeps the k best scoring combinations seen so far
+
+    Ties are broken in favor of the lexicographically smaller combination,
+    so the result doesn't depend on the order combinations are pushed in.
+
+    Attributes
+    ----------
+    heap : list
+        min heap of (score, negated combination, combination), the worst
+        kept combination is at heap[0]
+    k : int
+        number of combinations to keep
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+
+    def is_full(self):
+        return len(self.heap) >= self.k
+
+    def get_threshold(self):
+        """Score a new combination must reach to be kept, -inf if not full"""
+        if self.k == 0:
+            return np.inf
+        if not self.is_full():
+            return -np.inf
+        return self.heap[0][0]
+
+    def push(self, score, combination):
+        """Offers one combination, returns True if it was kept"""
+        combination = tuple(int(i) for i in combination)
+        item = (float(score), tuple(-i for i in combination), combination)
+        if not self.is_full():
+            if self.k == 0:
+                return False
+            heapq.heappush(self.heap, item)
+            return True
+        if item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+            return True
+        return False
+
+    def push_many(self, scores, combinations):
+        """Offers many combinations, only candidates that can make it in are
+        looked at one by one"""
+        scores = np.asarray(scores)
+        if len(scores) == 0 or self.k == 0:
+            return
+        # the k-th best score of the batch, ties with it are all kept
+        if len(scores) > self.k:
+            kth_score = np.partition(scores, len(scores) - self.k)[-self.k]
+            candidates = np.flatnonzero(scores >= kth_score)
+        else:
+            candidates = np.arange(len(scores))
+        candidates = candidates[scores[candidates] >= self.get_threshold()]
+        for i in candidates:
+            self.push(scores[i], combinations[i])
+
+    def merge(self, other):
+        """Offers every combination kept by another Top_K"""
+        for score, _, combination in other.heap:
+            self.push(score, combination)
+
+    def get_items(self):
+        """Returns (score, combination) pairs, best first"""
+        return [
+            (score, combination)
+            for score, _, combination in sorted(self.heap, reverse=True)
+        ]
+
+
+def _init_worker(drug_level_values, top_k, histogram_edges):
+    """Stores the screening inputs once per worker process"""
+    _worker_state["drug_level_values"] = drug_level_values
+    _worker_state["top_k"] = top_k
+    _worker_state["histogram_edges"] = histogram_edges
+
+
+def _screen_chunk(combinations):
+    """Scores one chunk of combinations in a worker
+
+    Returns
+    -------
+    tuple
+        (Top_K of the chunk, histogram counts or None, number scored)
+    """
+    scores = combination_scores(_worker_state["drug_level_values"], combinations)
+
+    best = Top_K(_worker_state["top_k"])
+    best.push_many(scores, combinations)
+
+    histogram = None
+    if _worker_state["histogram_edges"] is not None:
+        histogram = np.histogram(scores, bins=_worker_state["histogram_edges"])[0]
+
+    return best, histogram, len(scores)
+
+
+if __name__ == "__main__":
+    absolutePath = os.path.abspath(__file__)
+    fileDirectory = os.path.dirname(absolutePath)
+    parentDirectory = os.path.dirname(fileDirectory)
+    path_drug_data = os.path.join(
+        parentDirectory, "input_files/Multidrug_6hr_Responses.xlsx"
+    )
+
+    path_KEGG = os.path.join(parentDirectory, "input_files/KEGG_data/")
+    path_network = path_KEGG + "mtu01200.xml"
+    path_cloneID_ORF = os.path.join(parentDirectory, "input_files/clone_to_orf.csv")
+
+    drug_data = Drug_Data(readXLSX(path_drug_data))
+    network = KEGG_Network(read_KGML(path_network))
+    clone_ORF_lookup = read_cloneID_to_orf_table(path_cloneID_ORF)
+    gene_index = Gene_Index(clone_ORF_lookup, clone_ids=drug_data.gene_ids)
+
+    screener = Combination_Screener(drug_data, network, gene_index=gene_index)
+    best, histogram = screener.screen(4, top_k=20, histogram_bins=20)
+    print(best)
+    print(histogram)
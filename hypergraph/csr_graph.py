@@ -0,0 +1,286 @@
+import numpy as np
+import pandas as pd
+import hashlib
+import networkx as nx
+import os
+from fileIO import read_KGML
+from kegg_network import KEGG_Network
+
+
+class CSR_Graph:
+
+    """Directed graph stored as compressed sparse row (CSR) arrays
+
+    A light replacement for building a networkx DiGraph one edge at a time.
+    Nodes are numbered in order of first appearance and repeated edges are
+    merged, keeping the position of the first and the label of the last,
+    so the graph matches the DiGraph that nx.add_edge would build (see
+    to_networkx).
+
+    Attributes
+    ----------
+    nodes : list
+        node labels, node i is nodes[i]
+    node_index : pd index
+        hashed lookup from node label to node number
+    edge_sources : 1d array
+        source node number of each edge, edges are in insertion order
+    edge_targets : 1d array
+        target node number of each edge
+    edge_labels : list
+        label of each edge, None if the graph has no labels
+    edge_rows : 1d array
+        position of the first input edge that each edge came from, eg: the
+        row of the edge dataframe
+    out_indptr : 1d array
+        successors of node i are out_indices[out_indptr[i]:out_indptr[i + 1]]
+    out_indices : 1d array
+        target node numbers, grouped by source, in insertion order
+    out_edges : 1d array
+        edge numbers in the same order as out_indices
+    in_indptr : 1d array
+        predecessors of node i are in_indices[in_indptr[i]:in_indptr[i + 1]]
+    in_indices : 1d array
+        source node numbers, grouped by target, in insertion order
+    in_edges : 1d array
+        edge numbers in the same order as in_indices
+    """
+
+    def __init__(self, sources, targets, labels=None):
+        """Builds the graph from parallel arrays of edges in one step
+
+        Parameters
+        ----------
+        sources : array like
+            source node of each edge
+        targets : array like
+            target node of each edge
+        labels : array like, optional
+            label of each edge (eg: the reaction type)
+        """
+        sources = np.asarray(sources, dtype=object)
+        targets = np.asarray(targets, dtype=object)
+        num_edges = len(sources)
+
+        # number the nodes in order of first appearance, source before target
+        endpoints = np.empty(2 * num_edges, dtype=object)
+        endpoints[0::2] = sources
+        endpoints[1::2] = targets
+        codes, uniques = pd.factorize(endpoints, sort=False)
+        self.nodes = list(uniques)
+        self.node_index = pd.Index(uniques, dtype=object)
+        num_nodes = len(self.nodes)
+
+        # merge repeated edges: first position, last label
+        edge_keys = codes[0::2].astype(np.int64) * num_nodes + codes[1::2]
+        _, first = np.unique(edge_keys, return_index=True)
+        _, last = np.unique(edge_keys[::-1], return_index=True)
+        last = num_edges - 1 - last
+        order = np.argsort(first, kind="stable")
+        first = first[order]
+        last = last[order]
+
+        self.edge_rows = first
+        self.edge_sources = codes[0::2][first].astype(np.intp)
+        self.edge_targets = codes[1::2][first].astype(np.intp)
+        if labels is None:
+            self.edge_labels = None
+        else:
+            self.edge_labels = np.asarray(labels, dtype=object)[last].tolist()
+
+        (self.out_indptr, self.out_indices, self.out_edges) = create_csr(
+            self.edge_sources, self.edge_targets, num_nodes
+        )
+        (self.in_indptr, self.in_indices, self.in_edges) = create_csr(
+            self.edge_targets, self.edge_sources, num_nodes
+        )
+
+    @classmethod
+    def from_edge_df(cls, edge_df, source_col=0, target_col=1, label_col=None):
+        """Builds the graph from the cols of an edge dataframe
+
+        Parameters
+        ----------
+        edge_df : dataframe
+            one row per edge, eg: KEGG_Visualizer.expanded_reaction_df
+        source_col : int
+            position of the source node col
+        target_col : int
+            position of the target node col
+        label_col : int, optional
+            position of the edge label col
+
+        Returns
+        -------
+        CSR_Graph
+            graph with an edge for every row of edge_df
+        """
+        labels = None
+        if label_col is not None:
+            labels = edge_df.iloc[:, label_col].to_numpy(dtype=object)
+        return cls(
+            edge_df.iloc[:, source_col].to_numpy(dtype=object),
+            edge_df.iloc[:, target_col].to_numpy(dtype=object),
+            labels,
+        )
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return len(self.edge_sources)
+
+    def get_node_id(self, node):
+        """Looks up the number of a node label, raises KeyError if missing"""
+        return self.node_index.get_loc(node)
+
+    def successors(self, node):
+        """Lists the successors of a node, in edge insertion order"""
+        i = self.get_node_id(node)
+        ids = self.out_indices[self.out_indptr[i] : self.out_indptr[i + 1]]
+        return [self.nodes[j] for j in ids]
+
+    def predecessors(self, node):
+        """Lists the predecessors of a node, in edge insertion order"""
+        i = self.get_node_id(node)
+        ids = self.in_indices[self.in_indptr[i] : self.in_indptr[i + 1]]
+        return [self.nodes[j] for j in ids]
+
+    def out_degree(self, node=None):
+        """Out degree of a node, or an array of every node's out degree"""
+        degrees = np.diff(self.out_indptr)
+        if node is None:
+            return degrees
+        return int(degrees[self.get_node_id(node)])
+
+    def in_degree(self, node=None):
+        """In degree of a node, or an array of every node's in degree"""
+        degrees = np.diff(self.in_indptr)
+        if node is None:
+            return degrees
+        return int(degrees[self.get_node_id(node)])
+
+    def edges(self):
+        """Lists the edges as (source, target) tuples
+
+        The order is the same as networkx DiGraph.edges: grouped by source
+        node, then in insertion order
+        """
+        return [
+            (self.nodes[self.edge_sources[e]], self.nodes[self.edge_targets[e]])
+            for e in self.out_edges
+        ]
+
+    def bfs(self, source, reverse=False):
+        """Breadth first search from a node, one frontier at a time
+
+        Parameters
+        ----------
+        source : node label
+            node to start from
+        reverse : bool
+            follow edges backwards (predecessors) instead of forwards
+
+        Returns
+        -------
+        list
+            reachable nodes in the order they are discovered (the same order
+            as nx.bfs_tree), starting with source
+        """
+        if reverse:
+            indptr, indices = self.in_indptr, self.in_indices
+        else:
+            indptr, indices = self.out_indptr, self.out_indices
+
+        visited = np.zeros(len(self.nodes), dtype=bool)
+        frontier = np.array([self.get_node_id(source)], dtype=np.intp)
+        visited[frontier] = True
+        order = [frontier]
+        while len(frontier) > 0:
+            neighbors = gather_neighbors(indptr, indices, frontier)
+            neighbors = neighbors[~visited[neighbors]]
+            # keep the first discovery of each node
+            _, first = np.unique(neighbors, return_index=True)
+            frontier = neighbors[np.sort(first)]
+            visited[frontier] = True
+            order.append(frontier)
+        return [self.nodes[i] for i in np.concatenate(order)]
+
+    def structure_hash(self):
+        """Hashes the nodes and edges (not the labels) of the graph
+
+        Two graphs with the same nodes and edges, added in the same order,
+        have the same hash, eg: to key cached layouts
+
+        Returns
+        -------
+        string
+            hex sha256 digest
+        """
+        digest = hashlib.sha256()
+        for node in self.nodes:
+            digest.update(repr(node).encode())
+            digest.update(b"\0")
+        digest.update(np.asarray(self.edge_sources, dtype=np.int64).tobytes())
+        digest.update(np.asarray(self.edge_targets, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def to_networkx(self):
+        """Exports the graph to a networkx DiGraph, eg: for plotting
+
+        Nodes, edges and edge labels (stored as the 'label' attribute) come
+        out in the same order as adding the original edges one at a time
+        """
+        G = nx.DiGraph()
+        G.add_nodes_from(self.nodes)
+        sources = [self.nodes[i] for i in self.edge_sources]
+        targets = [self.nodes[i] for i in self.edge_targets]
+        if self.edge_labels is None:
+            G.add_edges_from(zip(sources, targets))
+        else:
+            G.add_edges_from(
+                (u, v, {"label": label})
+                for u, v, label in zip(sources, targets, self.edge_labels)
+            )
+        return G
+
+
+def create_csr(rows, cols, num_rows):
+    """Groups edges by row, keeping the edge order within each row
+
+    Returns
+    -------
+    1d array
+        indptr, the cols of row i are indices[indptr[i]:indptr[i + 1]]
+    1d array
+        indices, the cols grouped by row
+    1d array
+        the edge number of each entry of indices
+    """
+    edges = np.argsort(rows, kind="stable")
+    indptr = np.zeros(num_rows + 1, dtype=np.intp)
+    np.cumsum(np.bincount(rows, minlength=num_rows), out=indptr[1:])
+    return indptr, cols[edges], edges
+
+
+def gather_neighbors(indptr, indices, nodes):
+    """Concatenates the CSR rows of `nodes`, in order"""
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return indices[offsets + np.arange(counts.sum())]
+
+
+if __name__ == "__main__":
+    from kegg_visualizer import KEGG_Visualizer
+
+    absolutePath = os.path.abspath(__file__)
+    fileDirectory = os.path.dirname(absolutePath)
+    parentDirectory = os.path.dirname(fileDirectory)
+    path = os.path.join(parentDirectory, "input_files/KEGG_data/rn01100.xml")
+
+    network = KEGG_Network(read_KGML(path))
+    net_vis = KEGG_Visualizer(network, {})
+    graph = net_vis.reaction_csr_graph
+    print(graph.number_of_nodes(), graph.number_of_edges())
+    print(len(graph.bfs(graph.nodes[0])))
@@ -1,14 +1,17 @@
 import pandas as pd
+import numpy as np
 import os
 from drug_data import Drug_Data
 from kegg_network import KEGG_Network
 from fileIO import readXLSX, read_KGML, read_cloneID_to_orf_table
+from gene_index import Gene_Index
+from l1_scores import combination_row_sums, group_combinations_by_size
 
 
 class Determining_Uberedges:
 
     """Class for determining which edges should be uber edges
-    
+
     Attributes
     ----------
     clone_ORF_lookup : dataframe
@@ -17,28 +20,46 @@ class Determining_Uberedges:
         Custom Drug Data object that holds DE data
     gene_drug_effect_dict : dictionary
         dictionary to map gene to drug effect
+    gene_index : Gene_Index
+        hashed lookups between genes, well ids and drug_table rows
     genes_to_reactions_dict : dictionary
         dictionary to map genes to corresponding reactions
     network : KEGG Network
         Custom KEGG Network object, holds general network info
     reaction_drug_effect_dict : dictionary
         dictionary to map reaction name to drug effect
+    reaction_gene_matrix : scipy.sparse.csr_matrix
+        (reactions x genes) part of network.reaction_gene_matrix, rows
+        follow reaction_list, cols follow gene_rows (see
+        create_reaction_gene_matrix)
+    reaction_list : list
+        names of the reactions (network.S_reaction_names) with at least one
+        gene that has drug data
+    gene_rows : 1d array
+        drug_values row of each col of reaction_gene_matrix
     reactions_to_genes_dict : dictionary
         dictionary to map reactions to genes
     well_id_in_network_list : list
         gives the index of genes in network iin the well id
     """
 
-    def __init__(self, drug_data, clone_ORF_lookup, network):
+    def __init__(self, drug_data, clone_ORF_lookup, network, gene_index=None):
         self.drug_data = drug_data
         self.network = network
         self.clone_ORF_lookup = clone_ORF_lookup
+        if gene_index is None:
+            gene_index = Gene_Index(clone_ORF_lookup, clone_ids=drug_data.gene_ids)
+        self.gene_index = gene_index
 
         self.genes_to_reactions_dict = self.genes_to_reactions()
         self.reactions_to_genes_dict = self.reactions_to_genes()
 
         self.well_id_in_network_list = self.generate_well_ids_of_genes_in_network()
 
+        self.reaction_gene_matrix = None
+        self.reaction_list = None
+        self.gene_rows = None
+
     def genes_to_reactions(self):
         # creates a dictionary where key is gene name
         # and values are lists of reactions that are effected
@@ -66,29 +87,28 @@ class Determining_Uberedges:
         for key in self.genes_to_reactions_dict.keys():
             genes_in_network.append(key)
 
-        well_id_in_network_list = []
-        for gene in genes_in_network:
-            try:
-                # gene is prefixed by mtu:, clone_ORF_lookup excludes this prefix
-                index = self.clone_ORF_lookup.iloc[:, 1].tolist().index(gene[4:])
-                well_id_in_network_list.append(self.clone_ORF_lookup.iloc[index, 0])
-            except ValueError:
-                pass
+        # genes without a well id are skipped
+        well_id_in_network_list = self.gene_index.well_ids_of_genes(genes_in_network)
 
         return well_id_in_network_list
 
     def generate_reaction_drug_effect_dict(self, drug_combo):
-        drug_table = drug_data.drug_table
+        # drug_combo indexes drug_table cols, col 0 of the drug_table is the
+        # clone id, so drug_values (no clone id col) is shifted by one
+        drug_values = self.drug_data.drug_values
+        drug_value_cols = self.get_drug_value_cols(drug_combo)
         gene_drug_effect_dict = {}
         # generate a dictionary that maps the drug effect to
         # to the well id to gene name (in tb)
         for well_id in self.well_id_in_network_list:
-            reverse_index = self.clone_ORF_lookup.iloc[:, 0].tolist().index(well_id)
-            gene = self.clone_ORF_lookup.iloc[reverse_index, 1]
+            gene = self.gene_index.gene_of_well_id(well_id)
+
+            index_of_well_in_drug_table = self.gene_index.row_of_well_id(well_id)
+            if index_of_well_in_drug_table is None:
+                # the well has no drug data
+                continue
+            drug_effects = drug_values[index_of_well_in_drug_table, drug_value_cols]
 
-            index_of_well_in_drug_table = drug_table.iloc[:, 0].tolist().index(well_id)
-            drug_effects = drug_table.iloc[index_of_well_in_drug_table, drug_combo]
-            
             summed_drug_effect = sum(drug_effects)
             gene_drug_effect_dict[gene] = summed_drug_effect
 
@@ -104,11 +124,160 @@ class Determining_Uberedges:
             reactions = self.genes_to_reactions_dict[new_key]
             for reaction in reactions:
                 reaction_drug_effect_dict[reaction] = drug_effect
-        
+
         self.reaction_drug_effect_dict = reaction_drug_effect_dict
 
         return self.reaction_drug_effect_dict
 
+    def create_reaction_gene_matrix(self):
+        """Selects the part of network.reaction_gene_matrix with drug data
+
+        Starts from KEGG_Network.reaction_gene_matrix (S matrix cols x
+        network.gene_list) and keeps one row per reaction name, skipping
+        the reversed S matrix cols and repeated names (their genes are the
+        same), and the cols of the genes that have a drug_table row.
+        Reactions without such a gene are dropped.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            (reactions x genes) 1 where a gene catalyzes a reaction, rows
+            follow reaction_list and cols follow gene_rows
+        """
+        network_matrix = self.network.reaction_gene_matrix
+        reaction_names = self.network.S_reaction_names
+        reversed_cols = np.asarray(self.network.S_reversed, dtype=bool)
+
+        # a gene repeated in gene_list only has its first col filled
+        gene_cols = []
+        gene_rows = []
+        seen_genes = set()
+        for col, gene in enumerate(self.network.gene_list):
+            if gene in seen_genes:
+                continue
+            seen_genes.add(gene)
+            well_id = self.gene_index.well_id_of_gene(gene)
+            if well_id is None:
+                continue
+            row = self.gene_index.row_of_well_id(well_id)
+            if row is not None:
+                gene_cols.append(col)
+                gene_rows.append(row)
+
+        matrix = network_matrix[:, gene_cols].tocsr()
+        has_gene = np.diff(matrix.indptr) > 0
+        reaction_rows = []
+        seen_names = set()
+        for row, name in enumerate(reaction_names):
+            if reversed_cols[row] or not has_gene[row] or name in seen_names:
+                continue
+            seen_names.add(name)
+            reaction_rows.append(row)
+
+        self.reaction_gene_matrix = matrix[reaction_rows]
+        self.reaction_list = [reaction_names[row] for row in reaction_rows]
+        self.gene_rows = np.array(gene_rows, dtype=np.intp)
+
+        return self.reaction_gene_matrix
+
+    def get_drug_value_cols(self, drug_combo):
+        """Maps drug_table cols to drug_values cols
+
+        Parameters
+        ----------
+        drug_combo : list
+            drug_table cols, col 0 is the clone id so drug cols start at 1
+
+        Returns
+        -------
+        list
+            drug_values cols (drug_table cols shifted by one)
+
+        Raises
+        ------
+        ValueError
+            when a col is not a drug col of the drug_table
+        """
+        num_drug_cols = self.drug_data.drug_values.shape[1]
+        bad_cols = [col for col in drug_combo if not 1 <= col <= num_drug_cols]
+        if bad_cols:
+            raise ValueError(
+                "drug_table cols must be between 1 and "
+                + str(num_drug_cols)
+                + ", got "
+                + str(bad_cols)
+            )
+        return [col - 1 for col in drug_combo]
+
+    def generate_gene_drug_effect_matrix(self, drug_combos):
+        """Summed drug effects of the genes of reaction_gene_matrix
+
+        Parameters
+        ----------
+        drug_combos : list
+            drug combinations, each a list of drug_table cols like the
+            drug_combo of generate_reaction_drug_effect_dict
+
+        Returns
+        -------
+        2d array
+            (genes x drug combos) effects, cols follow gene_rows, NaN when
+            any drug of a combo is NaN for the gene
+        """
+        value_combos = [self.get_drug_value_cols(combo) for combo in drug_combos]
+        if self.reaction_gene_matrix is None:
+            self.create_reaction_gene_matrix()
+        gene_values = self.drug_data.drug_values[self.gene_rows]
+
+        gene_effects = np.empty((len(self.gene_rows), len(drug_combos)))
+        for positions, combos in group_combinations_by_size(value_combos):
+            gene_effects[:, positions] = combination_row_sums(gene_values, combos).T
+
+        return gene_effects
+
+    def generate_reaction_drug_effect_matrix(self, drug_combos, aggregation="sum"):
+        """Drug effects of every reaction for many drug combinations at once
+
+        Parameters
+        ----------
+        drug_combos : list
+            drug combinations, each a list of drug_table cols like the
+            drug_combo of generate_reaction_drug_effect_dict
+        aggregation : string
+            how the effects of the genes of a reaction are combined: 'sum',
+            'mean' or 'max-abs' (the effect with the largest magnitude)
+
+        Returns
+        -------
+        pandas DataFrame
+            (reactions x drug combos) effects, indexed by reaction_list, a
+            NaN effect of a gene makes its reactions NaN
+        """
+        if aggregation not in ("sum", "mean", "max-abs"):
+            raise ValueError("unknown aggregation: " + str(aggregation))
+        gene_effects = self.generate_gene_drug_effect_matrix(drug_combos)
+        matrix = self.reaction_gene_matrix
+
+        if aggregation == "sum":
+            reaction_effects = matrix @ gene_effects
+        elif aggregation == "mean":
+            num_genes = np.diff(matrix.indptr)[:, None]
+            reaction_effects = (matrix @ gene_effects) / num_genes
+        elif len(matrix.indptr) == 1:
+            reaction_effects = np.zeros((0, len(drug_combos)))
+        else:
+            # every row has at least one gene, so the csr indices group the
+            # gene effects by reaction
+            pair_effects = gene_effects[matrix.indices]
+            starts = matrix.indptr[:-1]
+            largest = np.maximum.reduceat(pair_effects, starts, axis=0)
+            smallest = np.minimum.reduceat(pair_effects, starts, axis=0)
+            reaction_effects = np.where(
+                np.abs(smallest) > np.abs(largest), smallest, largest
+            )
+
+        return pd.DataFrame(np.asarray(reaction_effects), index=self.reaction_list)
+
 
 if __name__ == "__main__":
     absolutePath = os.path.abspath(__file__)
@@ -138,9 +307,13 @@ if __name__ == "__main__":
     drug_combo = [10, 14, 17, 24]
 
     reac_drug_effect = d_u.generate_reaction_drug_effect_dict(drug_combo)
-    
+
     print(d_u.gene_drug_effect_dict)
-    print('###########################################')
+    print("###########################################")
     # it may be easier to get stay at the gene level
     # (for integration into other classes)
     print(d_u.reaction_drug_effect_dict)
+    print("###########################################")
+    # every combination at once, one col per combination
+    drug_combos = [[10, 14, 17, 24], [10, 14], [3, 5, 7]]
+    print(d_u.generate_reaction_drug_effect_matrix(drug_combos, aggregation="max-abs"))
@@ -2,27 +2,186 @@ import pandas as pd
 import os
 from fileIO import readXLSX
 import numpy as np
-import functools
+import json
+from functools import cached_property
+
+# numeric arrays written by Drug_Data.export_memmap, one .npy file each
+MEMMAP_ARRAYS = ["drug_tensor", "drug_values", "significance_mask"]
+MEMMAP_SIDECAR = "drug_data.json"
 
 
 class Drug_Data:
-    def __init__(self, excel_df_dict):
+    def __init__(self, excel_df_dict, dtype=np.float64):
         self.raw_dataframe_dict = excel_df_dict
         self.sheet_names = self.raw_dataframe_dict.keys()
 
-        self.drug_table = self.create_drug_table()
         self.drug_list = self.get_drug_list()
         self.num_drugs = len(self.drug_list)
         self.num_replicates = self.get_num_replicates()
-        self.average_drug_table = self.create_average_drug_table()
+
+        # every sheet is aligned to one ID_REF index in a single pass, values
+        # are held in a (gene x drug x replicate) tensor, drugs with fewer
+        # replicates are padded with NaN (see self.replicate_mask)
+        (
+            self.gene_ids,
+            self.drug_tensor,
+            self.replicate_mask,
+        ) = self.create_drug_tensor(dtype)
+        self.column_names = self.get_column_names()
+        self.drug_column_indices = self.get_drug_column_indices()
+        # (gene x replicate col) values, cols in the order of self.drug_table
+        self.drug_values = self.drug_tensor[:, self.replicate_mask]
 
         # TODO: ############################
         default_sig_level = 1
-        self.significance_filters = self.create_significance_filters(
-            self.drug_table, default_sig_level
-        )
+        self.significance_level = default_sig_level
+        # (gene x replicate col) True where the value is significant
+        self.significance_mask = np.abs(self.drug_values) >= default_sig_level
         ##############################
 
+    # the tables are derived from the arrays above on first use, so a
+    # Drug_Data reopened with load_memmap only pays for the ones it reads
+    @cached_property
+    def drug_table(self):
+        return self.create_drug_table()
+
+    @cached_property
+    def average_drug_table(self):
+        return self.create_average_drug_table()
+
+    @cached_property
+    def significance_filters(self):
+        significance_filters = pd.DataFrame(
+            self.significance_mask, columns=self.column_names
+        )
+        significance_filters.insert(0, "ID_REF", self.gene_ids.to_numpy())
+        return significance_filters
+
+    def export_memmap(self, directory):
+        """Writes the numeric arrays to .npy files that can be memory mapped
+
+        Every array in MEMMAP_ARRAYS gets its own .npy file in `directory`,
+        the gene ids, drug names and column names go to a json sidecar.
+        Reopen with Drug_Data.load_memmap, eg: in worker processes so they
+        all share one physical copy of the data.
+
+        Parameters
+        ----------
+        directory : string
+            path to the folder to write to, created if it doesn't exist
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in MEMMAP_ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+        sidecar = {
+            "gene_ids": self.gene_ids.tolist(),
+            "drug_list": self.drug_list,
+            "column_names": self.column_names,
+            "num_replicates": self.num_replicates,
+            "replicate_mask": self.replicate_mask.tolist(),
+            "significance_level": self.significance_level,
+        }
+        # the sidecar is written last, so it marks a complete export
+        with open(os.path.join(directory, MEMMAP_SIDECAR), "w") as file:
+            json.dump(sidecar, file)
+
+    @classmethod
+    def load_memmap(cls, directory):
+        """Reopens arrays written by export_memmap, read only and zero copy
+
+        Parameters
+        ----------
+        directory : string
+            path to the folder export_memmap wrote to
+
+        Returns
+        -------
+        Drug_Data
+            the arrays are read only np.memmaps, the tables are built from
+            them on first use, raw_dataframe_dict is None
+        """
+        with open(os.path.join(directory, MEMMAP_SIDECAR), "r") as file:
+            sidecar = json.load(file)
+
+        drug_data = cls.__new__(cls)
+        drug_data.raw_dataframe_dict = None
+        drug_data.drug_list = sidecar["drug_list"]
+        drug_data.sheet_names = drug_data.drug_list
+        drug_data.num_drugs = len(drug_data.drug_list)
+        drug_data.num_replicates = sidecar["num_replicates"]
+        drug_data.gene_ids = pd.Index(sidecar["gene_ids"], name="ID_REF")
+        drug_data.replicate_mask = np.array(sidecar["replicate_mask"], dtype=bool)
+        drug_data.column_names = sidecar["column_names"]
+        drug_data.drug_column_indices = drug_data.get_drug_column_indices()
+        drug_data.significance_level = sidecar["significance_level"]
+        for name in MEMMAP_ARRAYS:
+            path = os.path.join(directory, name + ".npy")
+            setattr(drug_data, name, np.load(path, mmap_mode="r"))
+
+        return drug_data
+
+    def create_drug_tensor(self, dtype=np.float64):
+        """Aligns every sheet to one ID_REF index and stacks the values
+
+        Returns
+        -------
+        pd index
+            sorted union of the ID_REF (clone_id) of every sheet, the same
+            rows an outer merge on ID_REF gives
+        3d array
+            (gene x drug x replicate) relative gene expression levels, NaN
+            where a gene is missing from a sheet and for padded replicates
+        2d array of bools
+            (drug x replicate) True where the drug has that replicate
+        """
+        sheets = list(self.raw_dataframe_dict.values())
+        gene_ids = pd.Index(
+            pd.concat([sheet.iloc[:, 0] for sheet in sheets], ignore_index=True)
+        )
+        gene_ids = gene_ids.unique().sort_values()
+        gene_ids.name = "ID_REF"
+
+        max_replicates = max(self.num_replicates, default=0)
+        drug_tensor = np.full(
+            (len(gene_ids), self.num_drugs, max_replicates), np.nan, dtype=dtype
+        )
+        replicate_mask = np.zeros((self.num_drugs, max_replicates), dtype=bool)
+        for i, sheet in enumerate(sheets):
+            rows = gene_ids.get_indexer(sheet.iloc[:, 0])
+            num_replicates = self.num_replicates[i]
+            drug_tensor[rows, i, :num_replicates] = sheet.iloc[:, 1:].to_numpy(
+                dtype=dtype
+            )
+            replicate_mask[i, :num_replicates] = True
+
+        return gene_ids, drug_tensor, replicate_mask
+
+    def get_column_names(self):
+        """Gets the replicate column names of every sheet, in order
+
+        Returns
+        -------
+        list
+            column names (except ID_REF) of every sheet
+        """
+        column_names = []
+        for sheet in self.raw_dataframe_dict.values():
+            column_names += list(sheet.columns[1:])
+        return column_names
+
+    def get_drug_column_indices(self):
+        """Gets the columns that belong to each drug
+
+        Returns
+        -------
+        list
+            one array per drug with the indices of its replicate columns in
+            self.drug_values (ie: self.drug_table without the ID_REF column)
+        """
+        bounds = np.cumsum([0] + self.num_replicates)
+        return [np.arange(bounds[i], bounds[i + 1]) for i in range(self.num_drugs)]
+
     def create_drug_table(self):
         """This function creates a pd dataframe that holds drug-treated
         expression levels. Data is pulled from self.raw_dataframe_dict
@@ -32,19 +191,15 @@ class Drug_Data:
         Returns
         -------
         pd dataframe
-            function merges all of the dataframes in self.raw_dataframe_dict
-            according to the first column - clone_id
+            holds all of the dataframes in self.raw_dataframe_dict aligned
+            according to the first column - clone_id (like an outer merge)
             Format of the final dataframe is: first col is gene clone_ids
             rows correspond to specific gene, cols correspond to drug
             entries are relative gene expression levels (to control)
         """
-        # this solution is following a stack overflow post
-        # https://stackoverflow.com/questions/53935848/how-to-merge-all-data-frames-in-a-dictionary-in-python
-        # 'on' determines which col we use a the key for the merge,
-        # 'how' is what type of merge, we choose outer
-        my_reduce = functools.partial(pd.merge, on="ID_REF", how="outer")
-        collated_table = functools.reduce(my_reduce, self.raw_dataframe_dict.values())
-        return collated_table
+        drug_table = pd.DataFrame(self.drug_values, columns=self.column_names)
+        drug_table.insert(0, "ID_REF", self.gene_ids.to_numpy())
+        return drug_table
 
     def get_drug_list(self):
         """This function simply gets the sheet names from the dictionary
@@ -94,58 +249,19 @@ class Drug_Data:
             correspond to drugs. Entries are average (over replicates)
             effect of drug on specific gene
         """
-        # create a new dataframe that we will populate with average values
-        # we start by setting the first col to the ID_REF of the existing table
-        average_drug_table = pd.DataFrame([self.drug_table.ID_REF]).transpose()
-
-        for i in range(0, self.num_drugs):
-            # build the new column header
-            cur_drug = self.drug_list[i]
-            cur_col_header = cur_drug + "_avg"
+        # average over the replicate axis, skipping missing values
+        present = ~np.isnan(self.drug_tensor)
+        replicate_sums = np.where(present, self.drug_tensor, 0).sum(axis=2)
+        replicate_counts = present.sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            average_values = replicate_sums / replicate_counts
 
-            # get the dataframe for the current drug
-            cur_drug_table = self.raw_dataframe_dict[cur_drug]
-
-            # average the values in the columns and update the average_drug_table
-            average_drug_table[cur_col_header] = cur_drug_table.iloc[:, 1:].mean(axis=1)
+        col_headers = [drug + "_avg" for drug in self.drug_list]
+        average_drug_table = pd.DataFrame(average_values, columns=col_headers)
+        average_drug_table.insert(0, "ID_REF", self.gene_ids.to_numpy())
 
         return average_drug_table
 
-    def create_significance_filters(self, drug_dataframe, significance_cutoff):
-        """this function creates a dataframe where rows correspond to gene id
-        and cols correponds to treatment, entries are true/false depending on
-        whether gene expression level in drug_dataframe is greater than
-        significance_cutoff (in abs values)
-
-        Parameters
-        ----------
-        drug_dataframe : pd dataframe
-            dataframe where first col is clone_id, cols correspond to drugs
-            rows correspond to genes, entries are relative gene expression
-            levels
-        significance_cutoff : double
-            value for which we say a drug has a significant effect on a gene
-
-        Returns
-        -------
-        dataframe
-            values of dataframe are True/False - depending on if values are
-            above/below the significance level
-            first column in clone_ids
-        """
-        # drug_dataframe will be a dataframe that has the first col
-        # as ID_REF and the rest of the columns will hold gene expression
-        # levels
-
-        drug_values = drug_dataframe.iloc[:, 1:]  # get everything except the clone id
-        clone_ids = drug_dataframe.iloc[:, 0]
-
-        sig_drug_values = np.abs(drug_values) >= significance_cutoff
-
-        # re append the values to the clone ids
-        sig_drug_dataframe = pd.concat([clone_ids, sig_drug_values], axis=1)
-        return sig_drug_dataframe
-
 
 if __name__ == "__main__":
     absolutePath = os.path.abspath(__file__)
@@ -1,30 +1,256 @@
 import os
+import io
 import sys
+import csv
+import gzip
+import json
+import stat
+import hashlib
+import tempfile
+import numpy as np
 import pandas as pd
-from Bio.KEGG.REST import kegg_info, kegg_list, kegg_get
+from Bio.KEGG.REST import kegg_info, kegg_list
 from Bio.KEGG.KGML import KGML_parser
 from Bio.Graphics.KGML_vis import KGMLCanvas
-import GEOparse
 
 # TODO Check that combine sheets works properly
 
+# pathway lists by (organism, cache_dir), see get_possible_pathways
+pathway_list_cache = {}
 
-def readXLSX(path):
+# os.umask can only be read by setting it, done once here since changing it
+# is not thread safe, see write_atomic
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def readXLSX(path, use_cache=True, hash_contents=False):
     """Reads XLSX file into Pandas ExcelFile
 
     Reads the XLSX file at `path` and returns a pandas ExcelFile
 
+    Parsing a large workbook with openpyxl is slow, so the parsed sheets are
+    cached in a .npz file next to `path` (`path` + ".cache.npz"). The cache is
+    keyed by the file size and modification time (and optionally a hash of
+    the contents) and is rebuilt whenever the workbook changes.
+
     Parameters
     ----------
     path : os.path
         A path to xlsx file
+    use_cache : bool, optional
+        read from/write to the cache, False always parses the workbook
+    hash_contents : bool, optional
+        also key the cache by a hash of the file contents, slower but safe
+        against files that change without their mtime changing
 
     Returns
     -------
     out : pd.ExcelFile
         A pandas ExcelFile with the same data as `path`
     """
-    return pd.read_excel(path, None)
+    if not use_cache:
+        return pd.read_excel(path, None)
+
+    cache_path = get_xlsx_cache_path(path)
+    cache_key = get_file_cache_key(path, hash_contents)
+
+    sheets = read_xlsx_cache(cache_path, cache_key)
+    if sheets is None:
+        sheets = pd.read_excel(path, None)
+        try:
+            write_xlsx_cache(cache_path, cache_key, sheets)
+        except OSError:
+            # eg: read only directory, we just don't cache
+            pass
+    return sheets
+
+
+def get_xlsx_cache_path(path):
+    """Path of the cache file for the workbook at `path`"""
+    return str(path) + ".cache.npz"
+
+
+def get_file_cache_key(path, hash_contents=False):
+    """Creates a key that changes whenever the file at `path` changes
+
+    Parameters
+    ----------
+    path : string
+        path to the file
+    hash_contents : bool, optional
+        include a sha256 hash of the file contents in the key
+
+    Returns
+    -------
+    dictionary
+        file name, size and modification time (and content hash)
+    """
+    stat = os.stat(path)
+    cache_key = {
+        "name": os.path.basename(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    if hash_contents:
+        cache_key["sha256"] = hash_file(path)
+    return cache_key
+
+
+def hash_file(path, algorithm="sha256"):
+    """Hashes the contents of the file at `path` in blocks
+
+    Returns
+    -------
+    string
+        hex digest of the file contents
+    """
+    file_hash = hashlib.new(algorithm)
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def write_xlsx_cache(cache_path, cache_key, sheets):
+    """Writes parsed sheets to a columnar .npz cache file
+
+    Every column is stored as its own array. Text columns are stored as
+    unicode arrays with a separate missing value mask. Sheets with columns
+    that can't be stored losslessly (eg: mixed types) are not cached.
+
+    Parameters
+    ----------
+    cache_path : string
+        path of the cache file, replaced atomically
+    cache_key : dictionary
+        key from get_file_cache_key, stored with the data
+    sheets : dictionary
+        keys are sheet names and values are pd.Dataframes of sheets
+
+    Returns
+    -------
+    bool
+        True if the cache was written
+    """
+    arrays = {}
+    sheet_info = []
+    for i, (sheet_name, sheet) in enumerate(sheets.items()):
+        if not isinstance(sheet.index, pd.RangeIndex) or sheet.index.start != 0:
+            return False
+        column_info = []
+        for j, column in enumerate(sheet.columns):
+            if not isinstance(column, (str, int, float)):
+                return False
+            values = sheet.iloc[:, j]
+            array_name = "sheet%d_col%d" % (i, j)
+            if values.dtype.kind in "biuf":
+                arrays[array_name] = values.to_numpy()
+            else:
+                missing = values.isna().to_numpy()
+                present = values[~missing]
+                if not all(isinstance(value, str) for value in present):
+                    return False
+                arrays[array_name] = np.array(
+                    values.where(~missing, "").tolist(), dtype=str
+                )
+                arrays[array_name + "_missing"] = missing
+            column_info.append({"name": column, "dtype": str(values.dtype)})
+        sheet_info.append(
+            {"name": sheet_name, "num_rows": len(sheet), "columns": column_info}
+        )
+
+    meta = {"key": cache_key, "sheets": sheet_info}
+    arrays["meta"] = np.array(json.dumps(meta))
+    write_npz_atomic(cache_path, arrays)
+    return True
+
+
+def write_npz_atomic(path, arrays):
+    """Writes arrays to an .npz file, replacing `path` atomically
+
+    Parameters
+    ----------
+    path : string
+        path of the .npz file
+    arrays : dictionary
+        keys are array names and values are np arrays
+    """
+    write_atomic(path, lambda file: np.savez(file, **arrays))
+
+
+def write_json_atomic(path, obj):
+    """Writes a json serializable object to `path` atomically"""
+    write_atomic(path, lambda file: file.write(json.dumps(obj).encode()))
+
+
+def write_atomic(path, write):
+    """Calls write(file) on a temp file, then moves it to `path`
+
+    The temp file is in the same folder as `path`, so a crash never leaves
+    a half written file at `path`. mkstemp creates the temp file readable by
+    its owner only, it gets the mode of the file it replaces, or the mode
+    open would give a new file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write(file)
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~UMASK
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def read_xlsx_cache(cache_path, cache_key):
+    """Reads sheets written by write_xlsx_cache
+
+    Parameters
+    ----------
+    cache_path : string
+        path of the cache file
+    cache_key : dictionary
+        key from get_file_cache_key for the current workbook
+
+    Returns
+    -------
+    dictionary
+        keys are sheet names and values are pd.Dataframes of sheets, None if
+        there is no cache or it is stale
+    """
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with np.load(cache_path, allow_pickle=False) as cache:
+            meta = json.loads(str(cache["meta"]))
+            if meta["key"] != cache_key:
+                return None
+
+            sheets = {}
+            for i, sheet_info in enumerate(meta["sheets"]):
+                columns = {}
+                for j, column_info in enumerate(sheet_info["columns"]):
+                    array_name = "sheet%d_col%d" % (i, j)
+                    values = cache[array_name]
+                    if array_name + "_missing" in cache.files:
+                        values = values.astype(object)
+                        values[cache[array_name + "_missing"]] = np.nan
+                    columns[j] = pd.Series(values, dtype=column_info["dtype"])
+                sheet = pd.DataFrame(
+                    columns, index=pd.RangeIndex(sheet_info["num_rows"])
+                )
+                sheet.columns = [column["name"] for column in sheet_info["columns"]]
+                sheets[sheet_info["name"]] = sheet
+    except (OSError, ValueError, KeyError):
+        # unreadable cache, fall back to parsing the workbook
+        return None
+    return sheets
 
 
 def combineSheets(xls):
@@ -50,19 +276,44 @@ def combineSheets(xls):
     return combinedSheet
 
 
-def draw_kegg_map(path, map_id):
-    """Render a local PDF of a KEGG map with the passed map ID"""
+def draw_kegg_map(path, map_id, kgml_dir=None, base_url=None):
+    """Render a local PDF of a KEGG map with the passed map ID
+
+    The KGML file is fetched like fetch_KGML_file (cached, conditional,
+    retried), the background image is still downloaded by biopython
+
+    Parameters
+    ----------
+    path : string
+        folder of the PDF
+    map_id : string
+        KEGG pathway identifier, eg: mtu01200
+    kgml_dir : string, optional
+        folder of the KGML files and their HTTP cache, input_files/KEGG_data
+        by default, only the PDF is written to path
+    base_url : string, optional
+        url of the KEGG REST api, see kgml_mirror.KGML_Mirror
+    """
+    if kgml_dir is None:
+        absolutePath = os.path.abspath(__file__)
+        fileDirectory = os.path.dirname(absolutePath)
+        parentDirectory = os.path.dirname(fileDirectory)
+        kgml_dir = os.path.join(parentDirectory, "input_files/KEGG_data")
+    kgml_path = fetch_KGML_file(kgml_dir, map_id, base_url)
     # Get the background image first
-    pathway = KGML_parser.read(kegg_get(map_id, "kgml"))
+    pathway = read_KGML(kgml_path)
     canvas = KGMLCanvas(pathway, import_imagemap=True)
     img_filename = "%s.pdf" % map_id
     canvas.draw(path + img_filename)
 
 
-def fetch_KGML_file(path, map_id):
-    """this function uses biopython modules to fetch the kgml file
-    associated with map_id and saves that kgml file as an xml file
-    in the specified path
+def fetch_KGML_file(path, map_id, base_url=None):
+    """this function fetches the kgml file associated with map_id and
+    saves that kgml file as an xml file in the specified path
+
+    The download is conditional on the cached ETag/Last-Modified headers,
+    retried on connection errors and written atomically, see
+    kgml_mirror.KGML_Mirror to fetch many maps at once
 
     Parameters
     ----------
@@ -70,26 +321,47 @@ def fetch_KGML_file(path, map_id):
         path to the KEGG_data folder
     map_id : string
         KEGG pathway identifier, eg: mtu01200 for central carbon metabolism
+    base_url : string, optional
+        url of the KEGG REST api, see kgml_mirror.KGML_Mirror
+
+    Returns
+    -------
+    string
+        path of the KGML file
+
+    Raises
+    ------
+    FileNotFoundError
+        when KEGG has no KGML file for map_id
     """
-    pathway = kegg_get(map_id, "kgml")
-    kgml_text = pathway.read()
-    file_name = map_id + ".xml"
-    with open(path + file_name, "w") as file:
-        file.write(kgml_text)
-    file.close()
+    # imported here, kgml_mirror imports this module
+    from kgml_mirror import KGML_Mirror
+
+    mirror = KGML_Mirror(path, base_url=base_url)
+    if mirror.fetch_map(map_id, refresh=True) == "missing":
+        raise FileNotFoundError("KEGG has no KGML file for " + map_id)
+    return mirror.get_map_path(map_id)
 
 
 # TODO Clean up Docstrings
-def get_possible_pathways(organism):
+def get_possible_pathways(organism, cache_dir=None, refresh=False):
     """Helper function, if we want to see possible pathways for
     a specific organism, this function will display them along
     with a short description
 
+    The list is downloaded once per organism and kept in memory, with a
+    cache_dir it is also kept on disk (see kgml_mirror.KGML_Mirror) and
+    only downloaded again when KEGG says it changed
+
     Parameters
     ----------
     organism : string
         KEGG identifier for an organism. mtu is mycobacterium tuberculosis
         hsa is homo sapiens (human)
+    cache_dir : string, optional
+        folder of the on disk cache
+    refresh : bool, optional
+        ask KEGG whether the list changed instead of using the cache
 
     Returns
     -------
@@ -97,9 +369,20 @@ def get_possible_pathways(organism):
         returns a string that holds the KEGG identifiers for all pathways
         for the specified organism
     """
-    pathways_text = kegg_list("pathway", organism)
-    pathways = pathways_text.read()
+    key = (organism, cache_dir)
+    if key in pathway_list_cache and not refresh:
+        return pathway_list_cache[key]
+
+    if cache_dir is None:
+        pathways = kegg_list("pathway", organism).read()
+    else:
+        # imported here, kgml_mirror imports this module
+        from kgml_mirror import KGML_Mirror
 
+        mirror = KGML_Mirror(cache_dir, cache_dir)
+        pathways = mirror.fetch_pathway_list(organism, refresh)
+
+    pathway_list_cache[key] = pathways
     return pathways
 
 
@@ -121,39 +404,140 @@ def read_KGML(path):
     return KEGG_info
 
 
-def generate_cloneID_to_orf_table(path):
+def generate_cloneID_to_orf_table(
+    path, save_location=None, columns=("ID", "ORF"), platform=None
+):
     """Creates a csv that contains a dictionary between clone_ids and orfs
 
-    Reads in a GPL file that contains information about a series of
-    experiments, gets the table that ties well_ids (ID) to gene names (ORF)
-    saves the resulting table
+    Streams a GPL (or GSE family) SOFT file, keeps the ID (well id) and ORF
+    (gene name) cols of one platform table and writes them to a csv, one row
+    at a time. Memory use does not depend on the size of the file, so the
+    sample tables of a family file are skipped without being loaded. Only
+    one platform is written, since clone ids of different platforms can
+    collide.
 
     Parameters
     ----------
     path : string
-        path to the desired GPL file
+        path to the SOFT file, gzipped or not
+    save_location : string, optional
+        path of the csv, input_files/clone_to_orf.csv by default, replaced
+        atomically
+    columns : list
+        platform table cols to keep
+    platform : string, optional
+        platform to read (eg: GPL1396), the first platform of the file when
+        not given
 
     Returns
     -------
-    None
-        Because of a costly GEOparse.get_GEO, we simply run this function to
-        generate the table of clone_ids to orfs, then we fetch from the
-        generated csv file later
-    """
-    # TODO Reorganize above docstring
-    gse = GEOparse.get_GEO(filepath=path)
-    platform_table = gse.table
-    clones_and_orfs = platform_table[["ID", "ORF"]]
+    int
+        number of rows written
 
-    absolutePath = os.path.abspath(__file__)
-    fileDirectory = os.path.dirname(absolutePath)
-    parentDirectory = os.path.dirname(fileDirectory)
-
-    # TODO Move const strings to function parameters
-    save_location = os.path.join(parentDirectory, "input_files/clone_to_orf.csv")
-    clones_and_orfs.to_csv(save_location, index=False)
+    Raises
+    ------
+    ValueError
+        when the file has no rows for the platform (the csv is not written)
+    """
+    if save_location is None:
+        absolutePath = os.path.abspath(__file__)
+        fileDirectory = os.path.dirname(absolutePath)
+        parentDirectory = os.path.dirname(fileDirectory)
+        save_location = os.path.join(parentDirectory, "input_files/clone_to_orf.csv")
+
+    num_rows = [0]
+    first_platform = [None]
+
+    def write(file):
+        text_file = io.TextIOWrapper(file, encoding="utf-8", newline="")
+        writer = csv.writer(text_file, lineterminator="\n")
+        writer.writerow(columns)
+        for platform_id, row in read_soft_platform_tables(path, columns, platform):
+            if first_platform[0] is None:
+                first_platform[0] = platform_id
+            elif platform_id != first_platform[0]:
+                # the next platform of a multi platform family file
+                break
+            writer.writerow(row)
+            num_rows[0] += 1
+        text_file.flush()
+        text_file.detach()
+        if num_rows[0] == 0:
+            raise ValueError("no platform table rows for " + str(platform or path))
+
+    write_atomic(save_location, write)
+    return num_rows[0]
+
+
+def read_soft_platform_tables(path, columns, platform=None):
+    """Streams the rows of the platform tables of a SOFT file
+
+    Only the lines of the platform table sections are split, everything
+    else (headers, sample tables) is skipped line by line
 
-    return None
+    Parameters
+    ----------
+    path : string
+        path to the SOFT file, gzipped or not
+    columns : list
+        names of the platform table cols to keep
+    platform : string, optional
+        only read the table of this platform
+
+    Yields
+    ------
+    string
+        platform id (eg: GPL1396) of the row
+    list
+        values of `columns` in the row, as strings
+
+    Raises
+    ------
+    ValueError
+        when a platform table lacks one of `columns`
+    """
+    platform_id = None
+    positions = None
+    in_table = False
+    with open_soft_file(path) as file:
+        for line in file:
+            line = line.rstrip("\r\n")
+            if in_table:
+                if line.startswith("!platform_table_end"):
+                    in_table = False
+                elif positions is None:
+                    # the first line of a table is its header
+                    header = line.split("\t")
+                    missing = [column for column in columns if column not in header]
+                    if missing:
+                        raise ValueError(
+                            "platform "
+                            + str(platform_id)
+                            + " has no cols "
+                            + str(missing)
+                        )
+                    positions = [header.index(column) for column in columns]
+                else:
+                    values = line.split("\t")
+                    values += [""] * (len(header) - len(values))
+                    yield platform_id, [values[i] for i in positions]
+            elif line.startswith("^"):
+                platform_id = None
+                if line[1:].upper().startswith("PLATFORM"):
+                    platform_id = line.split("=", 1)[1].strip()
+            elif line.startswith("!platform_table_begin"):
+                if platform_id is not None and platform in (None, platform_id):
+                    in_table = True
+                    positions = None
+
+
+def open_soft_file(path):
+    """Opens a SOFT file as text, gunzipping it if it is gzipped"""
+    with open(path, "rb") as file:
+        is_gzipped = file.read(2) == b"\x1f\x8b"
+    if is_gzipped:
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
 
 
 def read_cloneID_to_orf_table(path):
@@ -0,0 +1,164 @@
+import pandas as pd
+import numpy as np
+import os
+from fileIO import readXLSX, read_cloneID_to_orf_table
+from drug_data import Drug_Data
+
+
+class Gene_Index:
+    """Hashed lookups between TB genes, well ids and rows of the drug_table
+
+    Built once from the clone_ORF_lookup table (and optionally the drug_table
+    of a Drug_Data object) so that repeated lookups are O(1) instead of a
+    linear scan of the tables. When a key appears more than once, the first
+    occurrence is used, like list.index.
+
+    Attributes
+    ----------
+    clone_ORF_lookup : dataframe
+        dataframe that maps well ids (first col) to TB genes (second col)
+    drug_table : dataframe
+        Drug_Data.drug_table, first col is the clone/well id, can be None
+    clone_ids : array
+        clone/well id of each row of the drug_table
+    orf_to_well_id : pd series
+        well ids indexed by TB gene name (no organism prefix)
+    well_id_to_orf : pd series
+        TB gene names indexed by well id
+    well_id_to_row : pd series
+        row of the drug_table indexed by well id, empty without a drug_table
+    """
+
+    def __init__(self, clone_ORF_lookup, drug_table=None, clone_ids=None):
+        """Builds the lookups
+
+        Parameters
+        ----------
+        clone_ORF_lookup : dataframe
+            dataframe that maps well ids (first col) to TB genes (second col)
+        drug_table : dataframe, optional
+            Drug_Data.drug_table, rows are looked up by its first col
+        clone_ids : array, optional
+            clone/well id of each drug_table row, eg: Drug_Data.gene_ids,
+            used instead of the first col of drug_table
+        """
+        self.clone_ORF_lookup = clone_ORF_lookup
+        self.drug_table = drug_table
+        if clone_ids is None and drug_table is not None:
+            clone_ids = drug_table.iloc[:, 0]
+        self.clone_ids = clone_ids
+
+        well_ids = clone_ORF_lookup.iloc[:, 0].to_numpy()
+        orfs = clone_ORF_lookup.iloc[:, 1].to_numpy()
+        self.orf_to_well_id = first_occurrence_series(orfs, well_ids)
+        self.well_id_to_orf = first_occurrence_series(well_ids, orfs)
+
+        if clone_ids is None:
+            self.well_id_to_row = first_occurrence_series([], [])
+        else:
+            self.well_id_to_row = first_occurrence_series(
+                np.asarray(clone_ids), np.arange(len(clone_ids))
+            )
+
+    def well_id_of_gene(self, gene):
+        """Looks up the well id of a gene
+
+        Parameters
+        ----------
+        gene : string
+            KEGG gene name, prefixed by the organism (eg: mtu:Rv0001)
+
+        Returns
+        -------
+        well id
+            the well id of the gene, None if the gene has no well
+        """
+        return self.orf_to_well_id.get(gene[4:])
+
+    def gene_of_well_id(self, well_id):
+        """Looks up the TB gene name (no organism prefix) of a well id"""
+        return self.well_id_to_orf.get(well_id)
+
+    def row_of_well_id(self, well_id):
+        """Looks up the drug_table row of a well id, None if it is not there"""
+        return self.well_id_to_row.get(well_id)
+
+    def well_ids_of_genes(self, genes):
+        """Looks up the well ids of many genes at once
+
+        Parameters
+        ----------
+        genes : list
+            KEGG gene names, prefixed by the organism (eg: mtu:Rv0001)
+
+        Returns
+        -------
+        list
+            well ids of the genes in the same order, genes without a well
+            are skipped
+        """
+        orfs = [gene[4:] for gene in genes]
+        return bulk_lookup(self.orf_to_well_id, orfs).tolist()
+
+    def rows_of_well_ids(self, well_ids):
+        """Looks up the drug_table rows of many well ids at once
+
+        Returns
+        -------
+        1d array
+            rows of the well ids in the same order, well ids that are not in
+            the drug_table are skipped
+        """
+        return bulk_lookup(self.well_id_to_row, well_ids).astype(np.intp)
+
+    def rows_of_genes(self, genes):
+        """Looks up the drug_table rows of many genes at once
+
+        Parameters
+        ----------
+        genes : list
+            KEGG gene names, prefixed by the organism (eg: mtu:Rv0001)
+
+        Returns
+        -------
+        1d array
+            rows of the genes in the same order, genes without a well or
+            whose well is not in the drug_table are skipped
+        """
+        return self.rows_of_well_ids(self.well_ids_of_genes(genes))
+
+
+def first_occurrence_series(keys, values):
+    """Creates a series of values with a unique (hashed) index of keys
+
+    When a key is repeated, only its first value is kept
+    """
+    keys = pd.Index(keys)
+    keep = ~keys.duplicated(keep="first")
+    return pd.Series(np.asarray(values)[keep], index=keys[keep])
+
+
+def bulk_lookup(series, keys):
+    """Looks up many keys in a uniquely indexed series, skipping missing keys"""
+    if len(keys) == 0:
+        return series.to_numpy()[:0]
+    positions = series.index.get_indexer(keys)
+    return series.to_numpy()[positions[positions >= 0]]
+
+
+if __name__ == "__main__":
+    absolutePath = os.path.abspath(__file__)
+    fileDirectory = os.path.dirname(absolutePath)
+    parentDirectory = os.path.dirname(fileDirectory)
+    path_drug_data = os.path.join(
+        parentDirectory, "input_files/Multidrug_6hr_Responses_trimmed.xlsx"
+    )
+    path_cloneID_ORF = os.path.join(parentDirectory, "input_files/clone_to_orf.csv")
+
+    drug_data = Drug_Data(readXLSX(path_drug_data))
+    clone_ORF_lookup = read_cloneID_to_orf_table(path_cloneID_ORF)
+
+    gene_index = Gene_Index(clone_ORF_lookup, clone_ids=drug_data.gene_ids)
+    well_ids = drug_data.drug_table.iloc[:, 0].tolist()
+    genes = ["mtu:" + str(gene_index.gene_of_well_id(w)) for w in well_ids]
+    print(gene_index.rows_of_genes(genes))
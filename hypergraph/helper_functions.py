@@ -1,3 +1,8 @@
+import numpy as np
+from scipy import sparse
+from gene_index import Gene_Index
+
+
 def compute_L1(DE_dataframe, indices_from_pathway):
     temp = DE_dataframe.iloc[indices_from_pathway, 1:]
 
@@ -44,20 +49,83 @@ def reactions_to_genes(self, network):
     return reactions_to_genes
 
 
-def get_well_ids_of_genes_in_network(self, clone_ORF_lookup, genes_to_reactions_dict):
-        # in this section, we are looking up the well_ids to tie back to the
-        # drug_data in order to get the effect on the reactions
-        genes_in_network = []
-        for key in genes_to_reactions_dict.keys():
-            genes_in_network.append(key)
+def get_well_ids_of_genes_in_network(
+    self, clone_ORF_lookup, genes_to_reactions_dict, gene_index=None
+):
+    # in this section, we are looking up the well_ids to tie back to the
+    # drug_data in order to get the effect on the reactions
+    # pass a prebuilt gene_index to skip building one from clone_ORF_lookup
+    if gene_index is None:
+        gene_index = Gene_Index(clone_ORF_lookup)
+
+    genes_in_network = []
+    for key in genes_to_reactions_dict.keys():
+        genes_in_network.append(key)
+
+    # gene is prefixed by mtu:, genes without a well id are skipped
+    well_id_in_network_list = gene_index.well_ids_of_genes(genes_in_network)
+
+    return well_id_in_network_list
+
+
+def create_gene_effects(
+    network, drug_data, clone_ORF_lookup=None, gene_index=None, combinations=None
+):
+    """Log2 fold changes of the network genes under drug conditions
+
+    Parameters
+    ----------
+    network : KEGG_Network
+        network whose genes get the effects
+    drug_data : Drug_Data
+        drug responses, averaged over replicates
+    clone_ORF_lookup : dataframe, optional
+        maps well ids to TB genes, used to build a Gene_Index
+    gene_index : Gene_Index, optional
+        prebuilt gene index with drug_data's clone ids
+    combinations : list, optional
+        drug combinations (lists of indices into drug_data.drug_list),
+        the effect of a combination is the sum of its drugs' effects.
+        Every single drug is a condition when not given
+
+    Returns
+    -------
+    2d array
+        (len(network.gene_list) x num conditions), 0 for genes that are
+        not in the drug data
+    """
+    if gene_index is None:
+        gene_index = Gene_Index(clone_ORF_lookup, clone_ids=drug_data.gene_ids)
+
+    average_values = drug_data.average_drug_table.iloc[:, 1:].to_numpy(dtype=np.float64)
+    average_values = np.nan_to_num(average_values)
+    if combinations is not None:
+        membership = create_membership_matrix(len(drug_data.drug_list), combinations)
+        average_values = average_values @ membership
+
+    gene_effects = np.zeros((len(network.gene_list), average_values.shape[1]))
+    for i, gene in enumerate(network.gene_list):
+        well_id = gene_index.well_id_of_gene(gene)
+        row = None if well_id is None else gene_index.row_of_well_id(well_id)
+        if row is not None:
+            gene_effects[i] = average_values[row]
+    return gene_effects
+
+
+def create_row_mean_matrix(matrix):
+    """Row normalizes a sparse 0/1 matrix, so that a product with it
+    averages over the nonzero cols of each row (empty rows stay 0)"""
+    matrix = sparse.csr_matrix(matrix)
+    counts = np.asarray(matrix.sum(axis=1)).ravel()
+    with np.errstate(divide="ignore"):
+        inverse_counts = np.where(counts > 0, 1.0 / counts, 0.0)
+    return sparse.csr_matrix(sparse.diags(inverse_counts) @ matrix)
 
-        well_id_in_network_list = []
-        for gene in genes_in_network:
-            try:
-                # gene is prefixed by mtu:, clone_ORF_lookup excludes this prefix
-                index = clone_ORF_lookup.iloc[:, 1].tolist().index(gene[4:])
-                well_id_in_network_list.append(clone_ORF_lookup.iloc[index, 0])
-            except ValueError:
-                pass
 
-        return well_id_in_network_list
+def create_membership_matrix(num_drugs, combinations):
+    """(num drugs x num combinations) matrix, 1 where a drug is in a
+    combination"""
+    membership = np.zeros((num_drugs, len(combinations)))
+    for col, combination in enumerate(combinations):
+        membership[list(combination), col] += 1.0
+    return membership
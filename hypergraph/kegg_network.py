@@ -1,33 +1,226 @@
 import numpy as np
-from fileIO import read_KGML
+import json
+from functools import cached_property
+from scipy import sparse
+from fileIO import read_KGML, hash_file, write_npz_atomic
 import os
+import copy
 
 
 class KEGG_Network:
     """A Graph That Encodes the Metabolic Graph"""
 
+    # lazily computed attributes (see functools.cached_property) and the
+    # attributes that are computed from them, used by invalidate
+    DEPENDENT_ATTRIBUTES = {
+        "pathway": (
+            "reactions",
+            "reaction_entries",
+            "relations",
+            "genes",
+            "compounds",
+            "maps",
+        ),
+        "reactions": ("reaction_list", "reaction_arrays", "S_matrix_fields"),
+        "relations": ("relation_list",),
+        "genes": (
+            "gene_list",
+            "gene_entry_names",
+            "gene_entry_reactions",
+            "reaction_gene_matrix",
+        ),
+        "gene_list": ("reaction_gene_matrix",),
+        "compounds": ("compound_list",),
+        "compound_list": ("S_matrix_fields",),
+        "reaction_arrays": (
+            "reaction_ids",
+            "reaction_names",
+            "reaction_types",
+            "reaction_substrates",
+            "reaction_products",
+        ),
+        "S_matrix_fields": (
+            "S_matrix",
+            "S_reaction_ids",
+            "S_reaction_names",
+            "S_reversed",
+            "reaction_gene_matrix",
+        ),
+        "S_matrix": ("adjacency_matrix",),
+    }
+
     def __init__(self, pathway_object):
+        """Wraps a parsed KGML pathway
+
+        Only the name is read here, every other attribute is computed the
+        first time it is used and then cached (see invalidate), so a network
+        that is only used for its gene_list never builds its S matrix
+
+        Parameters
+        ----------
+        pathway_object : Bio.KEGG.KGML.KGML_pathway.Pathway
+            the parsed pathway, see fileIO.read_KGML
+        """
         self.pathway = pathway_object
         self.name = pathway_object.name
-        # TODO: Do we need variables for this when its in pathway?
-        # different types of edges
-        self.reactions = self.pathway.reactions  # iterable of KGML_pathway.Reaction
-        self.reaction_list = self.generate_reaction_list()
-        self.reaction_entries = (
-            self.pathway.reaction_entries
-        )  # seems to relate to images
-        self.relations = self.pathway.relations  # seems to be empty?
-        self.relation_list = self.generate_relation_list()
-        # different types of nodes
-        self.genes = self.pathway.genes  # unsure of difference to compounds
-        self.gene_list = self.generate_gene_list()
-
-        self.compounds = self.pathway.compounds
-        self.compound_list = self.generate_compound_list()
-
-        self.maps = self.pathway.maps
-
-        self.adjacency_matrix = self.create_simple_S_matrix()
+
+    @cached_property
+    def pathway(self):
+        # only reached by networks loaded with read_cache (or invalidated),
+        # networks built from a pathway object set it in __init__
+        source_path = vars(self).get("source_path")
+        if source_path is None:
+            raise AttributeError("pathway")
+        return read_KGML(source_path)
+
+    # TODO: Do we need variables for this when its in pathway?
+    # different types of edges
+    @cached_property
+    def reactions(self):
+        # iterable of KGML_pathway.Reaction
+        return self.pathway.reactions
+
+    @cached_property
+    def reaction_list(self):
+        return self.generate_reaction_list()
+
+    @cached_property
+    def reaction_entries(self):
+        # seems to relate to images
+        return self.pathway.reaction_entries
+
+    @cached_property
+    def relations(self):
+        # seems to be empty?
+        return self.pathway.relations
+
+    @cached_property
+    def relation_list(self):
+        return self.generate_relation_list()
+
+    # different types of nodes
+    @cached_property
+    def genes(self):
+        # unsure of difference to compounds
+        return self.pathway.genes
+
+    @cached_property
+    def gene_list(self):
+        return self.generate_gene_list()
+
+    @cached_property
+    def compounds(self):
+        return self.pathway.compounds
+
+    @cached_property
+    def compound_list(self):
+        return self.generate_compound_list()
+
+    @cached_property
+    def maps(self):
+        return self.pathway.maps
+
+    # per reaction arrays, in the order of self.reactions
+    @cached_property
+    def reaction_arrays(self):
+        return self.generate_reaction_arrays()
+
+    @cached_property
+    def reaction_ids(self):
+        return self.reaction_arrays[0]
+
+    @cached_property
+    def reaction_names(self):
+        return self.reaction_arrays[1]
+
+    @cached_property
+    def reaction_types(self):
+        return self.reaction_arrays[2]
+
+    @cached_property
+    def reaction_substrates(self):
+        return self.reaction_arrays[3]
+
+    @cached_property
+    def reaction_products(self):
+        return self.reaction_arrays[4]
+
+    # name and reactions of each gene entry, in the order of self.genes
+    @cached_property
+    def gene_entry_names(self):
+        return [entry.name for entry in self.genes]
+
+    @cached_property
+    def gene_entry_reactions(self):
+        return [entry.reaction for entry in self.genes]
+
+    # rows of the S matrix follow self.compound_list, cols follow
+    # self.S_reaction_ids (reversible reactions get a second, reversed col)
+    @cached_property
+    def S_matrix_fields(self):
+        return self.create_sparse_S_matrix()
+
+    @cached_property
+    def S_matrix(self):
+        return self.S_matrix_fields[0]
+
+    @cached_property
+    def S_reaction_ids(self):
+        return self.S_matrix_fields[1]
+
+    @cached_property
+    def S_reaction_names(self):
+        return self.S_matrix_fields[2]
+
+    @cached_property
+    def S_reversed(self):
+        return self.S_matrix_fields[3]
+
+    @cached_property
+    def adjacency_matrix(self):
+        return self.S_matrix.toarray()
+
+    # rows follow the S matrix cols, cols follow self.gene_list
+    @cached_property
+    def reaction_gene_matrix(self):
+        return self.create_reaction_gene_matrix()
+
+    def invalidate(self, *names):
+        """Drops cached attributes so they are recomputed on their next use
+
+        Attributes computed from a dropped attribute are dropped too, eg:
+        invalidate("compound_list") also drops the S matrix
+
+        Parameters
+        ----------
+        *names : strings
+            attributes to drop, all of the computed attributes (everything
+            but the pathway) when none are given
+        """
+        if not names:
+            names = [name for name in self.DEPENDENT_ATTRIBUTES if name != "pathway"]
+        if "pathway" in names and "source_path" not in vars(self):
+            raise ValueError("pathway can only be invalidated with a source_path")
+
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            vars(self).pop(name, None)
+            pending.extend(self.DEPENDENT_ATTRIBUTES.get(name, ()))
+
+    def copy(self):
+        """Shallow copy that shares every array, list and parsed object
+
+        Nothing is copied up front. Networks never change their attributes
+        in place, they replace them (see invalidate), so replacing an
+        attribute on the copy leaves the original untouched (copy on write)
+
+        Returns
+        -------
+        KEGG_Network
+            the copy
+        """
+        return copy.copy(self)
 
     def generate_reaction_list(self):
         reaction_list = []
@@ -35,6 +228,179 @@ class KEGG_Network:
             reaction_list.append(entry)
         return reaction_list
 
+    def generate_reaction_arrays(self):
+        """generates parallel lists that describe each reaction
+
+        Returns
+        -------
+        list
+            KGML reaction ids
+        list
+            KGML reaction names (eg: rn:R00200)
+        list
+            reaction types, reversible or irreversible
+        list
+            list of substrate compound names for each reaction
+        list
+            list of product compound names for each reaction
+        """
+        reaction_ids = []
+        reaction_names = []
+        reaction_types = []
+        reaction_substrates = []
+        reaction_products = []
+        for reaction in self.reactions:
+            reaction_ids.append(reaction.id)
+            reaction_names.append(reaction.name)
+            reaction_types.append(reaction.type)
+            reaction_substrates.append(
+                [name for entry in reaction.substrates for name in entry._names]
+            )
+            reaction_products.append(
+                [name for entry in reaction.products for name in entry._names]
+            )
+        return (
+            reaction_ids,
+            reaction_names,
+            reaction_types,
+            reaction_substrates,
+            reaction_products,
+        )
+
+    @classmethod
+    def from_KGML(cls, path, cache_dir=None):
+        """Reads a KGML file into a KEGG_Network through the network cache
+
+        The first read parses the file and writes the network to the cache,
+        later reads of the same file contents load the cache without running
+        the KGML parser (see read_cache)
+
+        Parameters
+        ----------
+        path : string
+            path to the .xml file
+        cache_dir : string, optional
+            folder for the cache file, defaults to the folder of `path`
+
+        Returns
+        -------
+        KEGG_Network
+            network for the KGML file
+        """
+        content_hash = hash_file(path)
+        cache_path = get_network_cache_path(path, cache_dir)
+
+        network = cls.read_cache(cache_path, content_hash, path)
+        if network is None:
+            network = cls(read_KGML(path))
+            network.source_path = path
+            try:
+                network.write_cache(cache_path, content_hash)
+            except OSError:
+                # eg: read only directory, we just don't cache
+                pass
+        return network
+
+    def write_cache(self, cache_path, content_hash):
+        """Writes the parsed network to a compact .npz file
+
+        Stores the name, gene/compound lists, per reaction arrays, gene
+        entries and the sparse S matrix with its col ordering
+
+        Parameters
+        ----------
+        cache_path : string
+            path of the cache file, replaced atomically
+        content_hash : string
+            hash of the KGML file contents, see fileIO.hash_file
+        """
+        S_matrix = self.S_matrix.tocsc()
+        meta = {
+            "content_hash": content_hash,
+            "name": self.name,
+            "S_shape": list(S_matrix.shape),
+        }
+        substrate_indptr, substrate_names = flatten_lists(self.reaction_substrates)
+        product_indptr, product_names = flatten_lists(self.reaction_products)
+        arrays = {
+            "meta": np.array(json.dumps(meta)),
+            "gene_list": np.array(self.gene_list, dtype=str),
+            "compound_list": np.array(self.compound_list, dtype=str),
+            "reaction_ids": np.array(self.reaction_ids, dtype=np.int64),
+            "reaction_names": np.array(self.reaction_names, dtype=str),
+            "reaction_types": np.array(self.reaction_types, dtype=str),
+            "substrate_indptr": substrate_indptr,
+            "substrate_names": substrate_names,
+            "product_indptr": product_indptr,
+            "product_names": product_names,
+            "gene_entry_names": np.array(self.gene_entry_names, dtype=str),
+            "gene_entry_reactions": np.array(self.gene_entry_reactions, dtype=str),
+            "S_data": S_matrix.data,
+            "S_indices": S_matrix.indices,
+            "S_indptr": S_matrix.indptr,
+            "S_reaction_ids": np.array(self.S_reaction_ids, dtype=np.int64),
+            "S_reaction_names": np.array(self.S_reaction_names, dtype=str),
+            "S_reversed": np.asarray(self.S_reversed, dtype=bool),
+        }
+        write_npz_atomic(cache_path, arrays)
+
+    @classmethod
+    def read_cache(cls, cache_path, content_hash, source_path):
+        """Loads a network written by write_cache, without parsing any XML
+
+        The Bio.KEGG objects (pathway, reactions, genes, ...) are not cached,
+        they are parsed from `source_path` the first time one is used
+
+        Parameters
+        ----------
+        cache_path : string
+            path of the cache file
+        content_hash : string
+            hash of the current KGML file contents
+        source_path : string
+            path to the KGML file the cache was built from
+
+        Returns
+        -------
+        KEGG_Network
+            the cached network, None if there is no cache or it is stale
+        """
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with np.load(cache_path, allow_pickle=False) as cache:
+                meta = json.loads(str(cache["meta"]))
+                if meta["content_hash"] != content_hash:
+                    return None
+
+                network = cls.__new__(cls)
+                network.source_path = source_path
+                network.name = meta["name"]
+                network.gene_list = cache["gene_list"].tolist()
+                network.compound_list = cache["compound_list"].tolist()
+                network.reaction_ids = cache["reaction_ids"].tolist()
+                network.reaction_names = cache["reaction_names"].tolist()
+                network.reaction_types = cache["reaction_types"].tolist()
+                network.reaction_substrates = unflatten_lists(
+                    cache["substrate_indptr"], cache["substrate_names"]
+                )
+                network.reaction_products = unflatten_lists(
+                    cache["product_indptr"], cache["product_names"]
+                )
+                network.gene_entry_names = cache["gene_entry_names"].tolist()
+                network.gene_entry_reactions = cache["gene_entry_reactions"].tolist()
+                network.S_matrix = sparse.csc_matrix(
+                    (cache["S_data"], cache["S_indices"], cache["S_indptr"]),
+                    shape=tuple(meta["S_shape"]),
+                )
+                network.S_reaction_ids = cache["S_reaction_ids"].tolist()
+                network.S_reaction_names = cache["S_reaction_names"].tolist()
+                network.S_reversed = cache["S_reversed"]
+        except (OSError, ValueError, KeyError):
+            # unreadable cache, fall back to parsing the KGML file
+            return None
+        return network
+
     def generate_relation_list(self):
         relation_list = []
         for entry in self.relations:
@@ -44,81 +410,133 @@ class KEGG_Network:
     def create_simple_S_matrix(self):
         """creates the S matrix based on the reactions from the KGML pathway.
 
-        Utilizes self.reactions and self.compound_list
+        Dense view of create_sparse_S_matrix, substrates get a value of -1,
+        while products get a value of +1.
 
-        We will construct a list of substrates and products that are in
-        parallel - where the same index will denote a reaction/edge
+        Returns
+        -------
+        2d matrix
 
-        We will then iterate through those lists, constructing the simple edge
-        S matrix. Substrates will get a value of -1, while products get a value
-        of +1.
+        """
+        S_matrix = self.create_sparse_S_matrix()[0]
+        return S_matrix.toarray()
 
-        The S matrix will be built one column at a time (cols in S matrix
-        correspond to reactions/edges)
+    def create_sparse_S_matrix(self):
+        """creates the sparse S matrix based on the reactions from the KGML
+        pathway in a single pass.
+
+        Utilizes self.reactions and self.compound_list
+
+        Rows correspond to self.compound_list (a compound appearing in several
+        entries has several rows), cols correspond to reactions/edges. If a
+        reaction is reversible it gets a second col with the substrates and
+        products swapped, right after the forward col. Substrates get a value
+        of -1, while products get a value of +1 (products win if a compound
+        is on both sides).
 
         Returns
         -------
-        2d matrix
-
+        scipy.sparse.csc_matrix
+            the S matrix, (num compounds x num edges)
+        list
+            KGML reaction id of each col
+        list
+            KGML reaction name of each col
+        1d array of bools
+            True for cols that are the reverse direction of a reaction
         """
+        compound_to_rows = self.generate_compound_to_rows()
 
-        # we iterate throgh the reactions, building product list
-        # and substrate list, note, if reaction is reversible then we add
-        # substrates to the product list and products to the substrates list
-        # as well (ie: the opposite direction)
-        substrate_list = []
-        product_list = []
-        for reaction in self.reactions:
-            substrate_list.append(reaction.substrates)
-            product_list.append(reaction.products)
+        rows = []
+        cols = []
+        values = []
+        reaction_ids = []
+        reaction_names = []
+        reversed_cols = []
 
+        # we iterate through the reactions, if a reaction is reversible then
+        # we add a second edge with the substrates and products swapped
+        for reaction in self.reactions:
+            directions = [(reaction.substrates, reaction.products, False)]
             if reaction.type == "reversible":
-                product_list.append(reaction.substrates)
-                substrate_list.append(reaction.products)
-
-        # pre-processing on the substrates and products
-        # note: these lists are after duplication for reversible reactions
-        # sub_name_expanded and prod_name_expanded are in parallel - corresp to
-        # reactions
-        sub_name_expanded_list = []
-        for substrate in substrate_list:
-            sub_name_list = [sub._names for sub in substrate]  # extract the names
-            temp_list = []
-            for element in sub_name_list:
-                temp_list += element
-            sub_name_expanded_list.append(temp_list)
-
-        prod_name_expanded_list = []
-        for product in product_list:
-            prod_name_list = [prod._names for prod in product]
-            temp_list = []
-            for element in prod_name_list:
-                temp_list += element
-            prod_name_expanded_list.append(temp_list)
-
-        # create the simple edge S matrix:
-        num_edges = len(sub_name_expanded_list)
-        num_compounds = len(self.compound_list)
-        simple_S_matrix = np.zeros((num_compounds, 1))  # first col of zeros for shape
-        for i in range(0, num_edges):
-            # get the subs/prods for the reaction
-            substrates = sub_name_expanded_list[i]
-            products = prod_name_expanded_list[i]
-
-            # initialize empty col array
-            col = np.zeros((num_compounds, 1))
-
-            # find the index of the substrates in the compound list
-            indices_of_subs = np.where(np.isin(self.compound_list, substrates))[0]
-            indices_of_prods = np.where(np.isin(self.compound_list, products))[0]
-
-            col[indices_of_subs] = -1
-            col[indices_of_prods] = 1
-
-            simple_S_matrix = np.hstack((simple_S_matrix, col))
-        simple_S_matrix = simple_S_matrix[:, 1:]  # get rid of col of zeros
-
-        return simple_S_matrix
+                directions.append((reaction.products, reaction.substrates, True))
+
+            for substrates, products, is_reversed in directions:
+                col = len(reaction_ids)
+                col_values = {}
+                for substrate in substrates:
+                    for name in substrate._names:
+                        for row in compound_to_rows.get(name, ()):
+                            col_values[row] = -1.0
+                for product in products:
+                    for name in product._names:
+                        for row in compound_to_rows.get(name, ()):
+                            col_values[row] = 1.0
+
+                rows.extend(col_values.keys())
+                values.extend(col_values.values())
+                cols.extend([col] * len(col_values))
+                reaction_ids.append(reaction.id)
+                reaction_names.append(reaction.name)
+                reversed_cols.append(is_reversed)
+
+        shape = (len(self.compound_list), len(reaction_ids))
+        S_matrix = sparse.csc_matrix((values, (rows, cols)), shape=shape)
+
+        return S_matrix, reaction_ids, reaction_names, np.array(reversed_cols)
+
+    def create_reaction_gene_matrix(self):
+        """creates a sparse matrix linking the S matrix cols to the genes
+        that catalyze them
+
+        A gene entry catalyzes every reaction named in its reaction field
+        (eg: rn:R00200), a reaction with several names is linked to the
+        genes of each name. Both directions of a reversible reaction get the
+        same genes.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            (num S matrix cols x len(self.gene_list)), 1 where the gene
+            catalyzes the reaction, a gene repeated in gene_list uses its
+            first col
+        """
+        gene_cols = {}
+        for col, gene in enumerate(self.gene_list):
+            gene_cols.setdefault(gene, col)
+
+        reaction_name_to_cols = {}
+        for names, reactions in zip(self.gene_entry_names, self.gene_entry_reactions):
+            cols = [gene_cols[name] for name in names.split(" ")]
+            for reaction_name in reactions.split():
+                reaction_name_to_cols.setdefault(reaction_name, set()).update(cols)
+
+        rows = []
+        cols = []
+        for row, names in enumerate(self.S_reaction_names):
+            reaction_cols = set()
+            for reaction_name in names.split():
+                reaction_cols.update(reaction_name_to_cols.get(reaction_name, ()))
+            rows.extend([row] * len(reaction_cols))
+            cols.extend(sorted(reaction_cols))
+
+        shape = (len(self.S_reaction_names), len(self.gene_list))
+        values = np.ones(len(rows))
+        return sparse.csr_matrix((values, (rows, cols)), shape=shape)
+
+    def generate_compound_to_rows(self):
+        """generates a dictionary from compound name to its rows in the S matrix
+
+        Returns
+        -------
+        dictionary
+            keys are compound names, values are lists of indices into
+            self.compound_list
+        """
+        compound_to_rows = {}
+        for row, compound in enumerate(self.compound_list):
+            compound_to_rows.setdefault(compound, []).append(row)
+        return compound_to_rows
 
     def hill_function(self, x, k, n):
         """Calculates the value of the Hill Function for a given metabolite.
@@ -175,6 +593,27 @@ class KEGG_Network:
         return compound_list
 
 
+def get_network_cache_path(path, cache_dir=None):
+    """Path of the network cache file for the KGML file at `path`"""
+    if cache_dir is None:
+        return str(path) + ".network.npz"
+    return os.path.join(cache_dir, os.path.basename(path) + ".network.npz")
+
+
+def flatten_lists(lists):
+    """Flattens a list of lists of strings into (indptr, values) arrays"""
+    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(values) for values in lists])
+    values = np.array([value for values in lists for value in values], dtype=str)
+    return indptr, values
+
+
+def unflatten_lists(indptr, values):
+    """Inverse of flatten_lists"""
+    values = values.tolist()
+    return [values[indptr[i] : indptr[i + 1]] for i in range(len(indptr) - 1)]
+
+
 if __name__ == "__main__":
 
     absolutePath = os.path.abspath(__file__)
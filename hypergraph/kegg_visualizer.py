@@ -2,13 +2,22 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+import json
 import networkx as nx
+from functools import cached_property
 from fileIO import read_KGML
 from kegg_network import KEGG_Network
 import helper_functions
 from networkx.drawing.nx_agraph import graphviz_layout
 from fileIO import readXLSX, read_cloneID_to_orf_table
 from drug_data import Drug_Data
+from csr_graph import CSR_Graph
+from fileIO import write_json_atomic
+
+
+# node positions shared by every KEGG_Visualizer, keyed by
+# (structure hash of the graph, layout prog), see KEGG_Visualizer.get_layout
+layout_cache = {}
 
 
 class KEGG_Visualizer:
@@ -28,30 +37,43 @@ class KEGG_Visualizer:
         List of hex values to color nodes
     reaction_df : dataframe
         dataframe containing edge information from network.reactions
-    reaction_graph : networkx digraph
+    reaction_csr_graph : CSR_Graph
         directed graph with hyper edges expanded to simple edges
+    reaction_graph : networkx digraph
+        networkx export of reaction_csr_graph, built on first use
     reaction_id_to_name_dict : dictionary
         Dictionary to map KEGG ids to common reaction names
     relation_color_map : list
         List of hex values to color nodes in relation graph
+    relation_csr_graph : CSR_Graph
+        directed graph of network.relations
     relation_graph : networkx digraph
-        directed graph to plot network.relations
+        networkx export of relation_csr_graph, built on first use, to plot
+        network.relations
     relation_name_to_entry_dict : dictionary
         Dictionary to map relation names to entries within relation
     substrate_id_to_name_dict : dictionary
         dictionary to map KEGG ids to substrate names
+    layout_dir : string
+        folder where node layouts are cached, None for memory only
     """
     
-    def __init__(self, network, clone_id_to_gene):
+    def __init__(self, network, clone_id_to_gene, layout_dir=None):
         """ Initializes a new KEGG_Visualizer object
         
         Parameters
         ----------
         network : KEGG_Network
             Custom KEGG_Network object that holds summary information of KEGG network
+        clone_id_to_gene : dictionary
+            maps clone ids of the drug data to TB gene names
+        layout_dir : string, optional
+            folder to cache node layouts in (as json), layouts are only
+            cached in memory when not given
         """
         self.network = network
         self.clone_id_to_gene = clone_id_to_gene
+        self.layout_dir = layout_dir
         self.relation_df, self.relation_entry_to_name_dict = self.create_relation_df()
         self.relation_name_to_entry_dict = helper_functions.dictionary_reverser(self.relation_entry_to_name_dict)
         
@@ -64,8 +86,10 @@ class KEGG_Visualizer:
 
         self.expanded_reaction_df = self.expand_reaction_df(self.reaction_df)
 
-        self.relation_graph = self.generate_relation_graph(self.relation_df)
-        self.reaction_graph = self.generate_reaction_graph(self.expanded_reaction_df)
+        self.relation_csr_graph = self.generate_relation_graph(self.relation_df)
+        self.reaction_csr_graph = self.generate_reaction_graph(
+            self.expanded_reaction_df
+        )
 
         # color  maps will only be set if drug data is added
         self.relation_color_map = None
@@ -102,7 +126,7 @@ class KEGG_Visualizer:
         return relation_df, entry_to_name_dict
 
     def generate_relation_graph(self, relation_df):
-        """Generates networkx digraph based on edges in relation_df
+        """Generates a CSR_Graph based on edges in relation_df
         
         Parameters
         ----------
@@ -112,16 +136,13 @@ class KEGG_Visualizer:
         
         Returns
         -------
-        networkx graph
-            Network x graph as described by edges: entry1 -> entry2
+        CSR_Graph
+            graph as described by edges: entry1 -> entry2, labeled by the
+            relation subtype (use .to_networkx() for a networkx graph)
         """
-        G = nx.DiGraph()
-        for i in range(0, relation_df.shape[0]):
-            edge = relation_df.iloc[i, 0:2].values.tolist()
-            label = relation_df.iloc[i, 3]
-            G.add_edge(*edge, label=label)
-
-        return G
+        return CSR_Graph.from_edge_df(
+            relation_df, source_col=0, target_col=1, label_col=3
+        )
 
     def create_reaction_df(self):
         """Creates dataframe to hold edges based on network.reactions
@@ -172,6 +193,11 @@ class KEGG_Visualizer:
     def expand_reaction_df(self, reaction_df):
         """Expands the hyper edges from the reaction dataframe
         eg: n1, n2 ---> n3 becomes n1 -> h1, n2 -> h1, h1 -> n3 
+
+        Vectorized: every reaction is repeated once per output row, then the
+        leading/trailing nodes of each output row are gathered from the
+        flattened node lists. Rows and virtual hyper node ids (h0, h1, ...)
+        come out in the same order as walking the reactions one at a time.
         
         Parameters
         ----------
@@ -183,68 +209,123 @@ class KEGG_Visualizer:
         -------
         dataframe
             Dataframe containing edge information, with hyper edges expanded to simple edges
-        """
-        new_table = []  # create a new table to hold expanded hyperedges
-        hyper_edge_counter = 0  # keep count of how many hyperedges (for unique naming)
-
-        # We look at each existing edge (regardless of if hyper edge or not)
-        for i in range(0, reaction_df.shape[0]):
-
-            # get the leading nodes, trailing nodes
-            leading_nodes = reaction_df.iloc[i, 1]
-            trailing_nodes = reaction_df.iloc[i, 2]
-            num_leading_nodes = len(leading_nodes)
-            num_trailing_nodes = len(trailing_nodes)
-
-            # get the unique id for the reaction and the reaction type
-            reaction_id = reaction_df.iloc[i, 0]
-            reaction_type = reaction_df.iloc[i, 3]
-
-            # determine if we have a hyperedge
-            if num_leading_nodes > 1 or num_trailing_nodes > 1:
-                is_hyper_edge = True
-                virutal_hyper_node = 'h' + str(hyper_edge_counter)
-                hyper_edge_counter += 1
-            else:
-                is_hyper_edge = False
-
-            # if it's not a hyperedge, we essentially recreate the row
-            if not is_hyper_edge:
-                new_row = [reaction_id, leading_nodes[0], trailing_nodes[0], reaction_type + str(is_hyper_edge)]
-                new_table.append(new_row)
-
-                if (reaction_type == 'reversible'):
-                    new_rev_row = reaction_id, trailing_nodes[0], leading_nodes[0], reaction_type + str(is_hyper_edge)
-                    new_table.append(new_rev_row)
-
-            # if it is a hyperedge, we split and add a virtual node
-            elif is_hyper_edge:
-                # we add new row for each 'branch' of hyperedge
-                for j in range(0, num_leading_nodes):
-                    leading_node = leading_nodes[j]
-                    for k in range(0, num_trailing_nodes):
-                        trailing_node = trailing_nodes[k]
-
-                        new_row_leading = [reaction_id, leading_node, virutal_hyper_node, reaction_type + str(is_hyper_edge)]
-                        new_row_trailing = [reaction_id, virutal_hyper_node, trailing_node, reaction_type + str(is_hyper_edge)]
-                        new_table.append(new_row_leading)
-                        new_table.append(new_row_trailing)
-
-                        # if the reaction is reversible, add the reverse
-                        if (reaction_type == 'reversible'):
-                            new_row_leading_rev = [reaction_id, virutal_hyper_node, leading_node, reaction_type + str(is_hyper_edge)]
-                            new_row_trailing_rev = [reaction_id, trailing_node, virutal_hyper_node, reaction_type + str(is_hyper_edge)]
-
-                            new_table.append(new_row_leading_rev)
-                            new_table.append(new_row_trailing_rev)
 
-        new_df = pd.DataFrame(new_table, columns=['reaction_id', 'substrate', 'product', 'reaction_type'])
+        Raises
+        ------
+        ValueError
+            when a reaction has no substrates or no products
+        """
+        columns = ["reaction_id", "substrate", "product", "reaction_type"]
+        if reaction_df.shape[0] == 0:
+            return pd.DataFrame([], columns=columns)
+
+        reaction_ids = reaction_df.iloc[:, 0].to_numpy()
+        leading_nodes = reaction_df.iloc[:, 1].tolist()
+        trailing_nodes = reaction_df.iloc[:, 2].tolist()
+        reaction_types = reaction_df.iloc[:, 3].tolist()
+
+        num_leading = np.array([len(nodes) for nodes in leading_nodes], dtype=np.intp)
+        num_trailing = np.array([len(nodes) for nodes in trailing_nodes], dtype=np.intp)
+        # a reaction without substrates or products has no edges to expand,
+        # the gather below would silently take the nodes of the next reaction
+        has_empty_side = (num_leading == 0) | (num_trailing == 0)
+        if has_empty_side.any():
+            raise ValueError(
+                "reactions without substrates or products: "
+                + str(reaction_ids[has_empty_side].tolist())
+            )
+        is_hyper_edge = (num_leading > 1) | (num_trailing > 1)
+        is_reversible = np.array(
+            [reaction_type == "reversible" for reaction_type in reaction_types]
+        )
+
+        # each hyper edge gets the next virtual node, in reaction order
+        hyper_edge_numbers = np.cumsum(is_hyper_edge) - 1
+        virtual_hyper_nodes = np.array(
+            [
+                "h" + str(number) if hyper else None
+                for number, hyper in zip(hyper_edge_numbers, is_hyper_edge)
+            ],
+            dtype=object,
+        )
+        edge_labels = np.array(
+            [
+                reaction_type + str(hyper)
+                for reaction_type, hyper in zip(reaction_types, is_hyper_edge)
+            ],
+            dtype=object,
+        )
+
+        # a simple edge gives 1 row (2 if reversible), a hyper edge gives 2
+        # rows (4 if reversible) for each leading x trailing pair
+        num_pairs = np.where(is_hyper_edge, num_leading * num_trailing, 1)
+        rows_per_pair = np.where(is_hyper_edge, 2, 1) * np.where(is_reversible, 2, 1)
+        num_rows = num_pairs * rows_per_pair
+
+        # position of every output row within its reaction
+        reaction_of_row = np.repeat(np.arange(len(num_rows)), num_rows)
+        row_starts = np.cumsum(num_rows) - num_rows
+        local_row = np.arange(num_rows.sum()) - row_starts[reaction_of_row]
+        pair = local_row // rows_per_pair[reaction_of_row]
+        slot = local_row % rows_per_pair[reaction_of_row]
+        trailing_count = num_trailing[reaction_of_row]
+        leading_position = pair // trailing_count
+        trailing_position = pair % trailing_count
+
+        # gather the nodes of each pair from the flattened node lists
+        leading_flat = np.empty(num_leading.sum(), dtype=object)
+        leading_flat[:] = [node for nodes in leading_nodes for node in nodes]
+        trailing_flat = np.empty(num_trailing.sum(), dtype=object)
+        trailing_flat[:] = [node for nodes in trailing_nodes for node in nodes]
+        leading_offsets = np.cumsum(num_leading) - num_leading
+        trailing_offsets = np.cumsum(num_trailing) - num_trailing
+        leading_node = leading_flat[leading_offsets[reaction_of_row] + leading_position]
+        trailing_node = trailing_flat[
+            trailing_offsets[reaction_of_row] + trailing_position
+        ]
+        hyper_node = virtual_hyper_nodes[reaction_of_row]
+
+        # simple edges: L -> T, (T -> L)
+        # hyper edges: L -> h, h -> T, (h -> L, T -> h)
+        hyper_row = is_hyper_edge[reaction_of_row]
+        simple_forward = ~hyper_row & (slot == 0)
+        simple_reverse = ~hyper_row & (slot == 1)
+        sources = np.select(
+            [
+                simple_forward,
+                simple_reverse,
+                hyper_row & (slot == 0),
+                hyper_row & (slot == 3),
+            ],
+            [leading_node, trailing_node, leading_node, trailing_node],
+            default=hyper_node,
+        )
+        targets = np.select(
+            [
+                simple_forward,
+                simple_reverse,
+                hyper_row & (slot == 1),
+                hyper_row & (slot == 2),
+            ],
+            [trailing_node, leading_node, trailing_node, leading_node],
+            default=hyper_node,
+        )
+
+        new_df = pd.DataFrame(
+            {
+                "reaction_id": reaction_ids[reaction_of_row].tolist(),
+                "substrate": sources.tolist(),
+                "product": targets.tolist(),
+                "reaction_type": edge_labels[reaction_of_row].tolist(),
+            },
+            columns=columns,
+        )
 
         return new_df
 
     def generate_reaction_graph(self, expanded_reaction_df):
-        """Creates a networkx graph based on edges described by
-        expanded_reaction_df
+        """Creates a CSR_Graph based on edges described by
+        expanded_reaction_df, in one vectorized step
         
         Parameters
         ----------
@@ -254,34 +335,66 @@ class KEGG_Visualizer:
         
         Returns
         -------
-        networkx graph
+        CSR_Graph
             A graph described by the edges in network.reactions
+            (use .to_networkx() for a networkx graph)
         """
-        G = nx.DiGraph()
-        for i in range(0, expanded_reaction_df.shape[0]):
-            edge = expanded_reaction_df.iloc[i, 1:3].values.tolist()
-            edge_label = expanded_reaction_df.iloc[i, 3]
-            G.add_edge(*edge, label=edge_label)
-
-        return G
-
-    def plot_graph(self, graph_type):
+        return CSR_Graph.from_edge_df(
+            expanded_reaction_df, source_col=1, target_col=2, label_col=3
+        )
+
+    @cached_property
+    def relation_graph(self):
+        # networkx export, only built when plotting/annotating
+        return self.relation_csr_graph.to_networkx()
+
+    @cached_property
+    def reaction_graph(self):
+        # networkx export, only built when plotting/annotating, virtual
+        # hyper edge nodes have the node attribute virtual=True
+        graph = self.reaction_csr_graph.to_networkx()
+        nx.set_node_attributes(
+            graph,
+            dict(zip(self.reaction_csr_graph.nodes, self.reaction_virtual_nodes)),
+            "virtual",
+        )
+        return graph
+
+    @cached_property
+    def reaction_virtual_nodes(self):
+        # bool array over reaction_csr_graph.nodes, True for the virtual
+        # hyper edge nodes added by expand_reaction_df, ie: the nodes that
+        # are not a substrate or product of any reaction
+        entry_ids = set()
+        for nodes in (
+            self.reaction_df.iloc[:, 1].tolist() + self.reaction_df.iloc[:, 2].tolist()
+        ):
+            entry_ids.update(nodes)
+        return np.array(
+            [node not in entry_ids for node in self.reaction_csr_graph.nodes],
+            dtype=bool,
+        )
+
+    def plot_graph(self, graph_type, prog="neato"):
         """Plots the graph specified by graph_type
         
         Parameters
         ----------
         graph_type : string
             Specify which graph to plot: relation or reaction
+        prog : string
+            graphviz program for the layout, or 'kgml' to use the
+            coordinates in the KGML file (see get_layout)
         """
         if graph_type == 'relation':
-            self.plot_relation_graph()
+            self.plot_relation_graph(prog)
         elif graph_type == 'reaction':
-            self.plot_reaction_graph()
+            self.plot_reaction_graph(prog)
         else:
             print('unrecognized graph type, use relation or reaction')
 
-    def plot_relation_graph(self):
-        """ Function for plotting relation graphs
+    def plot_relation_graph(self, prog="neato"):
+        """Function for plotting relation graphs
         Call through self.plot_graph()
         """
 
@@ -319,7 +432,7 @@ class KEGG_Visualizer:
         #         colors.append('#383b38')
 
         # section for node position and size
-        my_pos = graphviz_layout(self.relation_graph, prog='neato')
+        my_pos = self.get_layout("relation", prog)
         # my_pos = nx.spring_layout(self.relation_graph, k=0.1, iterations=20, seed=100)
         my_node_size = 350
 
@@ -356,8 +469,8 @@ class KEGG_Visualizer:
 
         plt.show()
 
-    def plot_reaction_graph(self):
-        """ Function for plotting reaction graph
+    def plot_reaction_graph(self, prog="neato"):
+        """Function for plotting reaction graph
         Call through self.plot_graph()
         """
         # setting up the figure (to enable adding a title)
@@ -366,15 +479,15 @@ class KEGG_Visualizer:
         # ax.set_title(self.network.name)
         #ax.set_title('Central Carbon Metabolism - BDQ 1hr')
         # section for node position and size
-        my_pos = graphviz_layout(self.reaction_graph, prog='neato')
+        my_pos = self.get_layout("reaction", prog)
         my_node_size = 300
         my_node_size_list = []
 
         # go through the nodes, if a node is a virtual hyper edge node
         # then we set the size to be very small
         custom_node_colors = []
-        for node in self.reaction_graph.nodes:
-            if str(node)[0] == 'h':  # if we have a virtual hyperedge node
+        for node, is_virtual in self.reaction_graph.nodes(data="virtual"):
+            if is_virtual:  # if we have a virtual hyperedge node
                 my_node_size_list.append(20)
                 custom_node_colors.append('#000000')
             else:
@@ -411,6 +524,107 @@ class KEGG_Visualizer:
 
         plt.show()
 
+    def get_layout(self, graph_type, prog="neato"):
+        """Node positions for plotting, computed once per graph structure
+
+        Graphviz layouts are cached in memory (layout_cache, shared between
+        visualizers) and on disk in self.layout_dir, keyed by the structure
+        hash of the graph and prog, so overlaying many drugs on the same
+        graph only runs graphviz once
+
+        Parameters
+        ----------
+        graph_type : string
+            relation or reaction
+        prog : string
+            graphviz program (eg: neato, dot), or 'kgml' to use the x/y
+            graphics coordinates of the KGML entries (never cached, it
+            costs nothing)
+
+        Returns
+        -------
+        dictionary
+            keys are nodes, values are (x, y) positions
+        """
+        if graph_type == "relation":
+            csr_graph = self.relation_csr_graph
+        elif graph_type == "reaction":
+            csr_graph = self.reaction_csr_graph
+        else:
+            raise ValueError("unrecognized graph type, use relation or reaction")
+
+        if prog == "kgml":
+            return self.create_kgml_layout(csr_graph)
+
+        key = (csr_graph.structure_hash(), prog)
+        if key in layout_cache:
+            return layout_cache[key]
+
+        layout_path = None
+        if self.layout_dir is not None:
+            layout_path = os.path.join(self.layout_dir, key[0] + "_" + prog + ".json")
+        if layout_path is not None and os.path.exists(layout_path):
+            with open(layout_path) as file:
+                positions = {node: (x, y) for node, x, y in json.load(file)}
+        else:
+            graph = (
+                self.relation_graph if graph_type == "relation" else self.reaction_graph
+            )
+            positions = graphviz_layout(graph, prog=prog)
+            if layout_path is not None:
+                os.makedirs(self.layout_dir, exist_ok=True)
+                write_json_atomic(
+                    layout_path, [[node, x, y] for node, (x, y) in positions.items()]
+                )
+
+        layout_cache[key] = positions
+        return positions
+
+    def create_kgml_layout(self, csr_graph):
+        """Node positions from the graphics of the KGML entries
+
+        The KGML y axis points down, so y is negated. Nodes without
+        graphics (eg: virtual hyper edge nodes) are placed at the centroid
+        of their neighbors that have positions
+
+        Parameters
+        ----------
+        csr_graph : CSR_Graph
+            graph whose nodes are KGML entry ids (and virtual nodes)
+
+        Returns
+        -------
+        dictionary
+            keys are nodes, values are (x, y) positions
+        """
+        entries = self.network.pathway.entries
+        num_nodes = csr_graph.number_of_nodes()
+        xy = np.full((num_nodes, 2), np.nan)
+        for i, node in enumerate(csr_graph.nodes):
+            entry = entries.get(node)
+            if entry is not None and len(entry.graphics) > 0:
+                graphics = entry.graphics[0]
+                if graphics.x is not None and graphics.y is not None:
+                    xy[i] = (graphics.x, -graphics.y)
+
+        # centroid of the placed neighbors, in or out
+        placed = ~np.isnan(xy[:, 0])
+        sources = np.concatenate([csr_graph.edge_sources, csr_graph.edge_targets])
+        targets = np.concatenate([csr_graph.edge_targets, csr_graph.edge_sources])
+        use = placed[targets] & ~placed[sources]
+        counts = np.bincount(sources[use], minlength=num_nodes)
+        sums = np.zeros((num_nodes, 2))
+        np.add.at(sums, sources[use], xy[targets[use]])
+        fill = ~placed & (counts > 0)
+        xy[fill] = sums[fill] / counts[fill, None]
+
+        # nodes with no placed neighbors go to the center of the map
+        unplaced = np.isnan(xy[:, 0])
+        if unplaced.any():
+            xy[unplaced] = np.nanmean(xy, axis=0) if (~unplaced).any() else 0.0
+
+        return {node: (float(x), float(y)) for node, (x, y) in zip(csr_graph.nodes, xy)}
+
     def add_drug_data(self, drug_data, graph_type):
         """ Color the graph nodes based on drug_data up/down regulation
         specify graph_type for relation or reaction graph
@@ -475,67 +689,104 @@ class KEGG_Visualizer:
         return None
 
     def annotate_reaction_graph(self, drug_data):
-        """Empty for now, need to tie together mtu##### and rn#####
-        kgml files
+        """Colors the edges of self.reaction_graph based on up/down
+        regulation of the genes of their reactions, sets
+        self.reaction_color_map
         
         Parameters
         ----------
         drug_data : dataframe
-            One timepoint gene differential expression data
+            One timepoint gene differential expression data,
+            first col is the id_ref, second col is the expression
         
         Returns
         -------
-        TYPE
-            Description
+        None
         """
+        color_maps = self.annotate_reaction_graph_batch(drug_data.iloc[:, 0:2])
+        self.reaction_color_map = color_maps[drug_data.columns[1]]
 
-        # indices_of_network_genes_in_drug_data = helper_functions.extract_indices_from_pathway(drug_data, self.network)
-        # first col is the id_ref
-        up_reg_df = drug_data[drug_data.iloc[:, 1] >= 0.1]
-        down_reg_df = drug_data[drug_data.iloc[:, 1] <= -0.1]
-        # nan_reg_df = drug_data[drug_data.iloc[:, 1].isna()]
+        return None
+
+    def annotate_reaction_graph_batch(self, drug_table):
+        """Colors the edges of self.reaction_graph for every drug col of
+        a drug table at once
         
-        regulation_dict = {}
-        for clone_id in up_reg_df.iloc[:, 0]:
-            regulation_dict[self.clone_id_to_gene[clone_id]] = 'up'
-        for clone_id in down_reg_df.iloc[:, 0]:
-            regulation_dict[self.clone_id_to_gene[clone_id]] = 'down'
+        Parameters
+        ----------
+        drug_table : dataframe
+            first col is the id_ref (clone id), every other col is the
+            differential expression under one drug, eg: Drug_Data.drug_table
 
-        #  print(regulation_dict)
-        # print(self.reaction_name_to_id_dict)
+        Returns
+        -------
+        dictionary
+            keys are the drug cols of drug_table, values are lists of hex
+            colors, one per edge of self.reaction_graph (in edge order)
+        """
+        values = drug_table.iloc[:, 1:].to_numpy(dtype=float)
+        clone_ids = drug_table.iloc[:, 0].to_numpy()
+
+        # a gene is down if any of its clones is down, otherwise up if any
+        # of its clones is up (same as filling a dict with up then down)
+        up_reg = values >= 0.1
+        down_reg = values <= -0.1
+        regulated = (up_reg | down_reg).any(axis=1)
+        genes = [self.clone_id_to_gene[clone_id] for clone_id in clone_ids[regulated]]
+        gene_codes, gene_names = pd.factorize(np.array(genes, dtype=object))
+        gene_up = np.zeros((len(gene_names), values.shape[1]), dtype=bool)
+        gene_down = np.zeros((len(gene_names), values.shape[1]), dtype=bool)
+        np.logical_or.at(gene_up, gene_codes, up_reg[regulated])
+        np.logical_or.at(gene_down, gene_codes, down_reg[regulated])
+
+        # regulated gene of each edge, -1 for none
+        edge_gene_codes = pd.Index(gene_names, dtype=object).get_indexer(
+            pd.Index(self.edge_genes, dtype=object)
+        )
+        has_gene = edge_gene_codes >= 0
+        edge_up = np.zeros((len(edge_gene_codes), values.shape[1]), dtype=bool)
+        edge_down = np.zeros((len(edge_gene_codes), values.shape[1]), dtype=bool)
+        edge_up[has_gene] = gene_up[edge_gene_codes[has_gene]]
+        edge_down[has_gene] = gene_down[edge_gene_codes[has_gene]]
+
+        colors = np.select(
+            [edge_down, edge_up], ["#d66969", "#a0e2a8"], default="#b5b5b5"
+        )
+
+        return {
+            drug: colors[:, i].tolist() for i, drug in enumerate(drug_table.columns[1:])
+        }
+
+    @cached_property
+    def reaction_name_to_gene_dict(self):
+        # maps reaction names (no rn: prefix) to one gene (no organism
+        # prefix), when a gene is in several reactions only its last
+        # reaction is kept, and a reaction keeps its last gene
         gene_to_reaction_name_dict = {}
         for gene in self.network.genes:
             for gene_name in gene.name.split(' '):
                 for reaction in gene.reaction.split(' '):
-                    gene_to_reaction_name_dict[gene_name[4:]] = reaction[3:] 
-        
-        reaction_name_to_gene_dict = helper_functions.dictionary_reverser(gene_to_reaction_name_dict)
-        # print(reaction_name_to_gene_dict)
-
-        # print(self.expanded_reaction_df)
-        df_edge_list = list(self.expanded_reaction_df.iloc[:, 1:3].itertuples(index=False, name=None))
-        colors = []
-        for edge in self.reaction_graph.edges:
-            index_of_edge_in_list = df_edge_list.index(edge)
-            reaction_id = self.expanded_reaction_df.iloc[index_of_edge_in_list, 0]
-            # print(edge)
-            # print(reaction_id)
-            reaction_name_with_prefix = self.reaction_id_to_name_dict[reaction_id]
-            reaction_name = reaction_name_with_prefix[3:]
-            # print(reaction_name)
-
-            genes = reaction_name_to_gene_dict.get(reaction_name)
-            
-            if regulation_dict.get(genes) == 'up':
-                colors.append('#a0e2a8')
-            elif regulation_dict.get(genes) == 'down':
-                colors.append('#d66969')
-            else:
-                colors.append('#b5b5b5')
-
-        self.reaction_color_map = colors
-            
-        return None
+                    gene_to_reaction_name_dict[gene_name[4:]] = reaction[3:]
+
+        return helper_functions.dictionary_reverser(gene_to_reaction_name_dict)
+
+    @cached_property
+    def edge_reaction_ids(self):
+        # reaction id of each edge of self.reaction_graph (in edge order),
+        # from the first row of expanded_reaction_df with that edge
+        graph = self.reaction_csr_graph
+        rows = graph.edge_rows[graph.out_edges]
+        return self.expanded_reaction_df.iloc[rows, 0].tolist()
+
+    @cached_property
+    def edge_genes(self):
+        # gene of the reaction of each edge of self.reaction_graph, None if
+        # the reaction has no gene
+        genes = []
+        for reaction_id in self.edge_reaction_ids:
+            reaction_name = self.reaction_id_to_name_dict[reaction_id][3:]
+            genes.append(self.reaction_name_to_gene_dict.get(reaction_name))
+        return genes
 
 
 if __name__ == '__main__':
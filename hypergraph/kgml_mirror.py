@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from fileIO import write_atomic, write_json_atomic
+
+KEGG_REST_URL = "https://rest.kegg.jp"
+
+# statuses that are worth asking again for
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class KGML_Mirror:
+
+    """Downloads KGML files from the KEGG REST api into a local folder
+
+    Maps are fetched concurrently by a bounded pool of threads, each thread
+    keeps one connection open and reuses it for all of its requests. The
+    ETag and Last-Modified headers of every response are kept in a cache
+    folder, so refreshing a mirror only downloads the maps that changed
+    (the server answers 304 for the others). Files are written atomically,
+    a file in the mirror is always complete, so an interrupted run is
+    resumed by running it again.
+
+    Attributes
+    ----------
+    output_dir : string
+        folder of the KGML files (<map id>.xml, like fetch_KGML_file)
+    cache_dir : string
+        folder of the response headers and cached api responses
+    base_url : string
+        url of the KEGG REST api (KEGG_REST_URL when not given), eg: a
+        local stub server in tests
+    n_workers : int
+        number of download threads
+    retries : int
+        number of times a failed request is retried
+    backoff : float
+        seconds to wait before the first retry, doubled after each retry
+    timeout : float
+        socket timeout in seconds
+    errors : dictionary
+        keys are map ids that failed in the last mirror call, values are
+        the errors
+    """
+
+    def __init__(
+        self,
+        output_dir,
+        cache_dir=None,
+        base_url=None,
+        n_workers=4,
+        retries=3,
+        backoff=0.5,
+        timeout=30.0,
+    ):
+        self.output_dir = output_dir
+        if cache_dir is None:
+            cache_dir = os.path.join(output_dir, ".kgml_cache")
+        self.cache_dir = cache_dir
+        if base_url is None:
+            base_url = KEGG_REST_URL
+        self.base_url = base_url.rstrip("/")
+        self.n_workers = n_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.errors = {}
+        self._local = threading.local()
+
+        url = urlsplit(self.base_url)
+        self._scheme = url.scheme
+        self._host = url.hostname
+        self._port = url.port
+        self._base_path = url.path
+
+    def mirror(self, map_ids, refresh=False):
+        """Downloads the KGML files of many maps concurrently
+
+        Parameters
+        ----------
+        map_ids : list
+            KEGG pathway identifiers, eg: mtu01200
+        refresh : bool
+            ask the server whether maps already in the mirror changed,
+            otherwise they are skipped
+
+        Returns
+        -------
+        dictionary
+            keys are map ids, values are 'downloaded', 'not modified',
+            'skipped', 'missing' (KEGG has no KGML for the map) or 'failed'
+            (see errors)
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.errors = {}
+
+        def fetch(map_id):
+            try:
+                return self.fetch_map(map_id, refresh)
+            except (OSError, http.client.HTTPException) as error:
+                self.errors[map_id] = error
+                return "failed"
+
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            statuses = list(executor.map(fetch, map_ids))
+        return dict(zip(map_ids, statuses))
+
+    def mirror_organism(self, organism, refresh=False):
+        """Downloads the KGML files of every pathway of an organism"""
+        return self.mirror(self.list_pathways(organism, refresh), refresh)
+
+    def fetch_map(self, map_id, refresh=False):
+        """Downloads the KGML file of one map, see mirror for the statuses"""
+        path = self.get_map_path(map_id)
+        if os.path.exists(path) and not refresh:
+            return "skipped"
+        status, _ = self.fetch("/get/" + map_id + "/kgml", path)
+        return status
+
+    def list_pathways(self, organism, refresh=False):
+        """Lists the pathway ids of an organism, eg: mtu00010
+
+        The list is cached, refresh asks the server whether it changed
+        """
+        text = self.fetch_pathway_list(organism, refresh)
+        map_ids = []
+        for line in text.splitlines():
+            if line.strip():
+                map_id = line.split("\t", 1)[0]
+                map_ids.append(map_id.split(":", 1)[-1])
+        return map_ids
+
+    def fetch_pathway_list(self, organism, refresh=False):
+        """Text of the KEGG pathway list of an organism (see
+        fileIO.get_possible_pathways), cached in cache_dir"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, "pathway_list_" + organism + ".txt")
+        if not os.path.exists(path) or refresh:
+            status, _ = self.fetch("/list/pathway/" + organism, path)
+            if status == "missing":
+                raise FileNotFoundError("no pathway list for " + organism)
+        with open(path, "r") as file:
+            return file.read()
+
+    def get_map_path(self, map_id):
+        """Path of the KGML file of a map in the mirror"""
+        return os.path.join(self.output_dir, map_id + ".xml")
+
+    def fetch(self, request_path, path):
+        """GETs base_url + request_path into the file at `path`
+
+        The request is conditional when the file exists and its response
+        headers are cached. Connection errors and busy server answers are
+        retried with exponential backoff
+
+        Returns
+        -------
+        string
+            'downloaded', 'not modified' or 'missing'
+        int
+            the HTTP status of the last response
+        """
+        # fetch_map can be called without mirror, make sure the headers
+        # have somewhere to go
+        os.makedirs(self.cache_dir, exist_ok=True)
+        headers = {"User-Agent": "hypergraph-kgml-mirror"}
+        meta_path = self.get_meta_path(request_path)
+        meta = read_meta(meta_path) if os.path.exists(path) else {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                status, response_headers, body = self.request(
+                    self._base_path + request_path, headers
+                )
+            except (OSError, http.client.HTTPException):
+                self.close_connection()
+                if last_attempt:
+                    raise
+                self.wait(attempt)
+                continue
+
+            if status == 304:
+                return "not modified", status
+            if status == 404:
+                return "missing", status
+            if status in RETRY_STATUSES and not last_attempt:
+                self.wait(attempt, response_headers.get("Retry-After"))
+                continue
+            if status != 200:
+                message = body[:200].decode("utf-8", "replace")
+                raise OSError("GET %s answered %d %s" % (request_path, status, message))
+
+            write_atomic(path, lambda file: file.write(body))
+            write_json_atomic(
+                meta_path,
+                {
+                    "url": request_path,
+                    "etag": response_headers.get("ETag"),
+                    "last_modified": response_headers.get("Last-Modified"),
+                },
+            )
+            return "downloaded", status
+
+    def request(self, request_path, headers):
+        """Sends one GET on this thread's connection
+
+        Returns
+        -------
+        int
+            HTTP status
+        http.client.HTTPMessage
+            response headers
+        bytes
+            response body
+        """
+        connection = self.get_connection()
+        connection.request("GET", request_path, headers=headers)
+        response = connection.getresponse()
+        # the body has to be read before the connection is reused
+        body = response.read()
+        if response.will_close:
+            self.close_connection()
+        return response.status, response.headers, body
+
+    def get_connection(self):
+        """The connection of the calling thread, opened on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self._scheme == "https":
+                connection = http.client.HTTPSConnection(
+                    self._host, self._port, timeout=self.timeout
+                )
+            else:
+                connection = http.client.HTTPConnection(
+                    self._host, self._port, timeout=self.timeout
+                )
+            self._local.connection = connection
+        return connection
+
+    def close_connection(self):
+        """Closes the connection of the calling thread, the next request
+        opens a new one"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def get_meta_path(self, request_path):
+        """Path of the cached response headers of a request"""
+        key = hashlib.sha1((self.base_url + request_path).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def wait(self, attempt, retry_after=None):
+        """Sleeps before a retry, honoring a Retry-After of a few seconds"""
+        delay = self.backoff * 2**attempt
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), 60.0))
+        time.sleep(delay)
+
+
+def read_meta(meta_path):
+    """Reads cached response headers, empty if there are none"""
+    try:
+        with open(meta_path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def main(argv=None):
+    """Command line interface, see --help"""
+    absolutePath = os.path.abspath(__file__)
+    fileDirectory = os.path.dirname(absolutePath)
+    parentDirectory = os.path.dirname(fileDirectory)
+
+    parser = argparse.ArgumentParser(
+        description="Mirror KEGG KGML files of an organism or of a list of maps"
+    )
+    parser.add_argument(
+        "targets",
+        nargs="+",
+        help="an organism code (eg: mtu) or map ids (eg: mtu00010 rn01100)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=os.path.join(parentDirectory, "input_files/KEGG_data"),
+        help="folder of the KGML files",
+    )
+    parser.add_argument("--cache-dir", help="folder of the HTTP cache")
+    parser.add_argument("--base-url", default=KEGG_REST_URL)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="revalidate files already in the mirror instead of skipping them",
+    )
+    args = parser.parse_args(argv)
+
+    mirror = KGML_Mirror(
+        args.output_dir,
+        args.cache_dir,
+        args.base_url,
+        n_workers=args.workers,
+        retries=args.retries,
+    )
+    # a lone target without digits is an organism code
+    if len(args.targets) == 1 and not any(c.isdigit() for c in args.targets[0]):
+        statuses = mirror.mirror_organism(args.targets[0], args.refresh)
+    else:
+        statuses = mirror.mirror(args.targets, args.refresh)
+
+    for map_id, status in statuses.items():
+        print(map_id, status, mirror.errors.get(map_id, ""))
+    return 1 if mirror.errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,19 +1,30 @@
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from fileIO import readXLSX, read_KGML, read_cloneID_to_orf_table
 from drug_data import Drug_Data
 from kegg_network import KEGG_Network
+from gene_index import Gene_Index
 import os
 
 
 class L1_scores:
-    def __init__(self, drug_data):
+    def __init__(self, drug_data, gene_index=None):
         self.drug_data = drug_data
-        self.drug_table = self.drug_data.drug_table
-        self.significance_filters = self.drug_data.significance_filters
         self.drug_list = self.drug_data.drug_list
+        self.gene_index = gene_index
 
-    def compute_L1(self, drug_combination, network, clone_ORF_lookup):
+    # the tables are only built when the per combination path needs them,
+    # the batched path works on the (possibly memory mapped) arrays
+    @property
+    def drug_table(self):
+        return self.drug_data.drug_table
+
+    @property
+    def significance_filters(self):
+        return self.drug_data.significance_filters
+
+    def compute_L1(self, drug_combination, network, clone_ORF_lookup=None):
         """Computes the L1 score for a single drug combination and network
 
         Parameters
@@ -22,6 +33,9 @@ class L1_scores:
             indices corresp to drugs from the drug_table
         network : kegg_network object
             Description
+        clone_ORF_lookup : dataframe, optional
+            dataframe that maps well ids to TB genes, can be left out when
+            the object was given a gene_index
 
         Returns
         -------
@@ -29,38 +43,10 @@ class L1_scores:
             Description
         """
 
-        # convert kegg_network genes to well_ids
-        well_id_list = []
-        for gene in network.gene_list:
-            # gene_lower = gene.lower()
-            # table_lower = [x.lower() for x in clone_ORF_lookup.iloc[:, 1]]
-            try:
-                well_id_index = clone_ORF_lookup.iloc[:, 1].tolist().index(gene[4:])
-                well_id_list.append(clone_ORF_lookup.iloc[well_id_index, 0])
-            except ValueError:
-                # ie: gene isn't in the list, we pass
-                # print(gene)
-                pass
-
-        # print(well_id_list)
-
-        # apply filter to drug values to ignore insignificant values
-        drug_values = self.drug_table.iloc[:, 1:]
-        clone_ids = self.drug_table.iloc[:, 0]
-        sig_drug_mask = self.significance_filters.iloc[:, 1:]
-        sig_drug_values = drug_values[sig_drug_mask]
-        sig_drug_table = pd.concat([clone_ids, sig_drug_values], axis=1)
-
-        # find which genes occur the specified pathway
-        genes_in_network_index_list = []
-        for well_id in well_id_list:
-            try:
-                gene_in_network_idex = clone_ids.tolist().index(well_id)
-                genes_in_network_index_list.append(gene_in_network_idex)
-            except ValueError:
-                pass
-
-        # print(genes_in_network_index_list)
+        genes_in_network_index_list = self.get_network_gene_indices(
+            network, clone_ORF_lookup
+        )
+        sig_drug_values = self.create_sig_drug_values()
 
         # compute the sum for the drug combo
         # start with non-abs-val sum over rows (accounts for overlap)
@@ -74,6 +60,304 @@ class L1_scores:
 
         return L1_score
 
+    def compute_L1_batch(
+        self, drug_combinations, network, clone_ORF_lookup=None, chunk_size=4096
+    ):
+        """Computes the L1 score for many drug combinations against one network
+
+        The gene to row resolution and the significance masking are done once,
+        every combination is then scored with array operations over the
+        masked drug matrix. Scores are identical to calling compute_L1 once
+        per combination.
+
+        Parameters
+        ----------
+        drug_combinations : iterable of lists of col indices
+            each entry is a drug combination as passed to compute_L1,
+            combinations may have different sizes
+        network : kegg_network object
+            network whose genes are scored
+        clone_ORF_lookup : dataframe, optional
+            dataframe that maps well ids to TB genes, can be left out when
+            the object was given a gene_index
+        chunk_size : int, optional
+            number of combinations scored per array operation, bounds memory
+
+        Returns
+        -------
+        dataframe
+            cols are: drug_combination (tuple of col indices), L1_score
+            rows are in the same order as drug_combinations
+        """
+        drug_combinations = [tuple(combo) for combo in drug_combinations]
+
+        genes_in_network_index_list = self.get_network_gene_indices(
+            network, clone_ORF_lookup
+        )
+        sig_values_in_network = self.create_sig_values_in_network(
+            genes_in_network_index_list
+        )
+
+        scores = np.zeros(len(drug_combinations))
+        for positions, combos in group_combinations_by_size(drug_combinations):
+            for start in range(0, len(positions), chunk_size):
+                stop = start + chunk_size
+                scores[positions[start:stop]] = combination_scores(
+                    sig_values_in_network, combos[start:stop]
+                )
+
+        return pd.DataFrame(
+            {"drug_combination": drug_combinations, "L1_score": scores},
+            columns=["drug_combination", "L1_score"],
+        )
+
+    def compute_L1_pathways(
+        self, drug_combinations, networks, clone_ORF_lookup=None, chunk_size=4096
+    ):
+        """Computes the L1 score of every (network, drug combination) pair
+
+        The absolute row sums of each combination are computed once for the
+        union of the genes of all networks, then a sparse (pathway x gene)
+        membership matrix turns them into one score per pathway, so extra
+        pathways cost one more row of a sparse-dense product.
+
+        Parameters
+        ----------
+        drug_combinations : iterable of lists of col indices
+            each entry is a drug combination as passed to compute_L1,
+            combinations may have different sizes
+        networks : list of kegg_network objects
+            pathways to score
+        clone_ORF_lookup : dataframe, optional
+            dataframe that maps well ids to TB genes, can be left out when
+            the object was given a gene_index
+        chunk_size : int, optional
+            number of combinations scored per array operation, bounds memory
+
+        Returns
+        -------
+        dataframe
+            cols are: pathway (network.name), drug_combination (tuple of col
+            indices), L1_score. Rows are grouped by pathway in the order of
+            networks, then in the order of drug_combinations
+        """
+        drug_combinations = [tuple(combo) for combo in drug_combinations]
+        membership_matrix = self.create_pathway_membership_matrix(
+            networks, clone_ORF_lookup
+        )
+
+        # only the genes that belong to at least one pathway are needed
+        genes_in_any_network = np.flatnonzero(membership_matrix.getnnz(axis=0))
+        membership_matrix = membership_matrix[:, genes_in_any_network]
+        sig_values = self.create_sig_values_in_network(genes_in_any_network)
+
+        scores = np.zeros((len(networks), len(drug_combinations)))
+        for positions, combos in group_combinations_by_size(drug_combinations):
+            for start in range(0, len(positions), chunk_size):
+                stop = start + chunk_size
+                row_sums = combination_row_sums(sig_values, combos[start:stop])
+                scores[:, positions[start:stop]] = (
+                    membership_matrix @ np.abs(row_sums).T
+                )
+
+        return pd.DataFrame(
+            {
+                "pathway": np.repeat(
+                    [network.name for network in networks], len(drug_combinations)
+                ),
+                "drug_combination": drug_combinations * len(networks),
+                "L1_score": scores.ravel(),
+            },
+            columns=["pathway", "drug_combination", "L1_score"],
+        )
+
+    def create_pathway_membership_matrix(self, networks, clone_ORF_lookup=None):
+        """Creates a sparse (pathway x drug_table row) membership matrix
+
+        Parameters
+        ----------
+        networks : list of kegg_network objects
+            one row per network
+        clone_ORF_lookup : dataframe, optional
+            dataframe that maps well ids to TB genes, can be left out when
+            the object was given a gene_index
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            entries count how many times compute_L1 sums a drug_table row for
+            the network (a row shared by several network genes counts twice)
+        """
+        pathway_rows = []
+        gene_rows = []
+        for i, network in enumerate(networks):
+            genes_in_network_index_list = self.get_network_gene_indices(
+                network, clone_ORF_lookup
+            )
+            gene_rows += genes_in_network_index_list
+            pathway_rows += [i] * len(genes_in_network_index_list)
+
+        # duplicate (pathway, row) entries are summed
+        shape = (len(networks), len(self.drug_data.gene_ids))
+        return sparse.csr_matrix(
+            (np.ones(len(gene_rows)), (pathway_rows, gene_rows)), shape=shape
+        )
+
+    def get_network_gene_indices(self, network, clone_ORF_lookup=None):
+        """Finds the rows of the drug_table that hold the genes of a network
+
+        Parameters
+        ----------
+        network : kegg_network object
+            network whose genes we look up
+        clone_ORF_lookup : dataframe, optional
+            dataframe that maps well ids to TB genes, can be left out when
+            the object was given a gene_index
+
+        Returns
+        -------
+        list
+            row indices into the drug_table, one per network gene that has
+            a well id in the drug_table
+        """
+        gene_index = self.get_gene_index(clone_ORF_lookup)
+        return gene_index.rows_of_genes(network.gene_list).tolist()
+
+    def get_gene_index(self, clone_ORF_lookup=None):
+        """Returns the Gene_Index for clone_ORF_lookup and the drug_table
+
+        The index is built once and reused until a different clone_ORF_lookup
+        is passed in
+
+        Parameters
+        ----------
+        clone_ORF_lookup : dataframe, optional
+            dataframe that maps well ids to TB genes
+
+        Returns
+        -------
+        Gene_Index
+            hashed lookups between genes, well ids and drug_table rows
+        """
+        if clone_ORF_lookup is not None and (
+            self.gene_index is None
+            or self.gene_index.clone_ORF_lookup is not clone_ORF_lookup
+        ):
+            self.gene_index = Gene_Index(
+                clone_ORF_lookup, clone_ids=self.drug_data.gene_ids
+            )
+        if self.gene_index is None:
+            raise ValueError("a clone_ORF_lookup or gene_index is required")
+        return self.gene_index
+
+    def create_sig_drug_values(self):
+        """Applies the significance filters to the drug values
+
+        Returns
+        -------
+        dataframe
+            drug values without the clone id col, insignificant values are NaN
+        """
+        drug_values = self.drug_table.iloc[:, 1:]
+        sig_drug_mask = self.significance_filters.iloc[:, 1:]
+        return drug_values[sig_drug_mask]
+
+    def create_sig_values_in_network(self, genes_in_network_index_list):
+        """Gets the significant drug values of the genes in a network
+
+        Works on Drug_Data.drug_values and Drug_Data.significance_mask, only
+        the network rows are copied
+
+        Parameters
+        ----------
+        genes_in_network_index_list : list
+            rows of the drug_table, from get_network_gene_indices
+
+        Returns
+        -------
+        2d array
+            (network gene x drug col) values, insignificant values are 0 so
+            they do not contribute to the sums
+        """
+        rows = np.asarray(genes_in_network_index_list, dtype=np.intp)
+        drug_values = np.asarray(self.drug_data.drug_values[rows], dtype=np.float64)
+        sig_drug_mask = self.drug_data.significance_mask[rows]
+        return np.where(sig_drug_mask, drug_values, 0.0)
+
+
+def combination_scores(sig_values, drug_combinations):
+    """Computes the L1 scores of equally sized drug combinations at once
+
+    Parameters
+    ----------
+    sig_values : 2d array
+        rows correspond to genes in a network, cols correspond to drugs,
+        insignificant values are 0
+    drug_combinations : 2d array of ints
+        each row holds the col indices of one drug combination
+
+    Returns
+    -------
+    1d array
+        the L1 score of each drug combination
+    """
+    row_sums = combination_row_sums(sig_values, drug_combinations)
+    return np.abs(row_sums).sum(axis=1)
+
+
+def combination_row_sums(sig_values, drug_combinations):
+    """Sums the drug cols of equally sized drug combinations, per gene
+
+    Parameters
+    ----------
+    sig_values : 2d array
+        rows correspond to genes, cols correspond to drugs
+    drug_combinations : 2d array of ints
+        each row holds the col indices of one drug combination
+
+    Returns
+    -------
+    2d array
+        (drug combination x gene) sums, rows are contiguous
+    """
+    drug_combinations = np.asarray(drug_combinations, dtype=np.intp)
+    if drug_combinations.shape[0] == 0:
+        return np.zeros((0, sig_values.shape[0]))
+
+    # drugs x genes, so each combination's row sums are contiguous
+    drug_major_values = np.ascontiguousarray(sig_values.T)
+
+    # row sums are accumulated one drug at a time, in combination order
+    row_sums = drug_major_values[drug_combinations[:, 0]]
+    for j in range(1, drug_combinations.shape[1]):
+        row_sums = row_sums + drug_major_values[drug_combinations[:, j]]
+
+    return row_sums
+
+
+def group_combinations_by_size(drug_combinations):
+    """Groups drug combinations of the same size, so they can be scored together
+
+    Parameters
+    ----------
+    drug_combinations : list of tuples
+        drug combinations, possibly of different sizes
+
+    Returns
+    -------
+    list
+        (positions in drug_combinations, 2d array of the combinations) per size
+    """
+    positions_by_size = {}
+    for i, combo in enumerate(drug_combinations):
+        positions_by_size.setdefault(len(combo), []).append(i)
+
+    groups = []
+    for positions in positions_by_size.values():
+        combos = np.array([drug_combinations[i] for i in positions], dtype=np.intp)
+        groups.append((np.array(positions), combos))
+    return groups
+
 
 if __name__ == "__main__":
     absolutePath = os.path.abspath(__file__)
@@ -96,6 +380,7 @@ if __name__ == "__main__":
     network = KEGG_Network(pathway_obj)
 
     clone_ORF_lookup = read_cloneID_to_orf_table(path_cloneID_ORF)
+    gene_index = Gene_Index(clone_ORF_lookup, clone_ids=drug_data.gene_ids)
 
     print(clone_ORF_lookup)
 
@@ -103,6 +388,6 @@ if __name__ == "__main__":
 
     # testing implementation
     drug_combo = [10, 23, 24, 25]
-    test = L1_scores(drug_data)
-    score = test.compute_L1(drug_combo, network, clone_ORF_lookup)
+    test = L1_scores(drug_data, gene_index)
+    score = test.compute_L1(drug_combo, network)
     print(score)
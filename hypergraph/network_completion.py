@@ -51,66 +51,230 @@ class Network_Completion:
             dataframe that contains extra required edges for the sources
             and sinks into the network
         """
-        # get unique substrates
-        substrate_set = set()
-        for entry in self.edge_df.substrate:
-            for sub in entry:
-                substrate_set.add(sub)
-
-        # get unique products
-        product_set = set()
-        for entry in self.edge_df['product']:
-            for prod in entry:
-                product_set.add(prod)
-
-        # get a list of all compounds in the network
-        all_compounds = substrate_set.union(product_set)
+        substrates = flatten_compounds(self.edge_df["substrate"])
+        products = flatten_compounds(self.edge_df["product"])
 
         # if a substrate doesn't appear in products
         # then it never has an incoming edge, so it needs a source
-        nodes_that_need_source = []
-        for sub in substrate_set:
-            if sub not in product_set:
-                nodes_that_need_source.append([sub])
-
-        # construct a dictionary to append to the edge list
-        # for 'reactions' that correspond to sources
-        # we asssume column names here
-        temp_products = nodes_that_need_source  # these substrates need sources
-        temp_substrates = [[-1]] * len(nodes_that_need_source)  # [-1] will correspond to the source
-        temp_reaction_id = [-1] * len(nodes_that_need_source)
-        temp_reaction_type = ['source'] * len(nodes_that_need_source)
-        source_dict = {
-            'reaction_id': temp_reaction_id, 'substrate': temp_substrates,
-            'product': temp_products, 'reaction_type': temp_reaction_type}
-
-        source_df = pd.DataFrame(source_dict)
-
         # if a product doesn't appear in the substrate
         # then it never has an outgoing edge, so it needs a sink
-        nodes_that_need_sink = []
-        for prod in product_set:
-            if prod not in substrate_set:
-                nodes_that_need_sink.append([prod])
-
-        # construct a dictionary to append to the edge list
-        # for 'reactions' that correspond to sinks
-        # we asssume column names here
-        temp_products = [[-2]] * len(nodes_that_need_sink)  # [-2] will be out sink
-        temp_substrates = nodes_that_need_sink  # these nodes need a sink
-        temp_reaction_id = [-2] * len(nodes_that_need_sink)
-        temp_reaction_type = ['sink'] * len(nodes_that_need_sink)
-        sink_dict = {
-            'reaction_id': temp_reaction_id, 'substrate': temp_substrates,
-            'product': temp_products, 'reaction_type': temp_reaction_type}
-
-        sink_df = pd.DataFrame(sink_dict)
+        # (both in order of first appearance)
+        nodes_that_need_source = substrates[~substrates.isin(products)]
+        nodes_that_need_sink = products[~products.isin(substrates)]
+
+        source_df = create_source_df(nodes_that_need_source)
+        sink_df = create_sink_df(nodes_that_need_sink)
 
         # construct partially completed network
         partially_completed_network = pd.concat([self.edge_df, source_df, sink_df], axis=0)
         return partially_completed_network
 
 
+class Incremental_Completion:
+
+    """Keeps the sources and sinks of a network up to date as reactions
+    are added or removed
+
+    Each compound has an in degree (number of times it is a product) and
+    an out degree (number of times it is a substrate). Adding or removing
+    reactions only updates the counters of the compounds in those
+    reactions, so the cost is proportional to the change, not the network.
+
+    Attributes
+    ----------
+    edge_rows : dictionary
+        keys are reaction ids, values are (reaction_id, substrates,
+        products, reaction_type) rows, in the order they were added
+    in_degree : dictionary
+        keys are compounds, values are how many times they are a product
+    out_degree : dictionary
+        keys are compounds, values are how many times they are a substrate
+    sources : dictionary
+        compounds that need a source (substrates that are never a
+        product), used as an ordered set
+    sinks : dictionary
+        compounds that need a sink (products that are never a substrate),
+        used as an ordered set
+    """
+
+    def __init__(self, edge_df=None):
+        """Initializer for the Incremental_Completion class
+
+        Parameters
+        ----------
+        edge_df : pandas DataFrame, optional
+            reactions to start with, cols are reaction_id, substrate,
+            product, reaction_type (eg: KEGG_Visualizer.reaction_df)
+        """
+        self.edge_rows = {}
+        self.in_degree = {}
+        self.out_degree = {}
+        self.sources = {}
+        self.sinks = {}
+        if edge_df is not None:
+            self.add_reactions(edge_df)
+
+    def add_reactions(self, edge_df):
+        """Adds the reactions in edge_df, raises ValueError if a reaction
+        id was already added
+
+        Parameters
+        ----------
+        edge_df : pandas DataFrame
+            cols are reaction_id, substrate, product, reaction_type
+        """
+        reaction_ids = edge_df["reaction_id"].tolist()
+        duplicated = find_duplicates(reaction_ids)
+        if duplicated:
+            raise ValueError("reactions are repeated in edge_df: " + str(duplicated))
+        repeated = [r for r in reaction_ids if r in self.edge_rows]
+        if repeated:
+            raise ValueError("reactions were already added: " + str(repeated))
+
+        for row in zip(
+            reaction_ids,
+            edge_df["substrate"],
+            edge_df["product"],
+            edge_df["reaction_type"],
+        ):
+            self.edge_rows[row[0]] = row
+        self.update_degrees(edge_df["substrate"], edge_df["product"], 1)
+
+    def remove_reactions(self, reaction_ids):
+        """Removes reactions, raises KeyError if one was never added and
+        ValueError if one is repeated, before anything is removed
+
+        Parameters
+        ----------
+        reaction_ids : list
+            ids of the reactions to remove
+        """
+        reaction_ids = list(reaction_ids)
+        duplicated = find_duplicates(reaction_ids)
+        if duplicated:
+            raise ValueError("reactions are repeated: " + str(duplicated))
+        missing = [r for r in reaction_ids if r not in self.edge_rows]
+        if missing:
+            raise KeyError("reactions were never added: " + str(missing))
+
+        rows = [self.edge_rows[reaction_id] for reaction_id in reaction_ids]
+        for reaction_id in reaction_ids:
+            del self.edge_rows[reaction_id]
+        self.update_degrees([row[1] for row in rows], [row[2] for row in rows], -1)
+
+    def update_degrees(self, substrate_lists, product_lists, sign):
+        """Adds sign * the compound counts of the reactions to the degrees,
+        then rechecks only the compounds that changed"""
+        substrate_counts = count_compounds(substrate_lists)
+        product_counts = count_compounds(product_lists)
+        for compound, count in substrate_counts.items():
+            self.out_degree[compound] = self.out_degree.get(compound, 0) + sign * count
+        for compound, count in product_counts.items():
+            self.in_degree[compound] = self.in_degree.get(compound, 0) + sign * count
+
+        for compound in list(substrate_counts.keys()) + list(product_counts.keys()):
+            in_degree = self.in_degree.get(compound, 0)
+            out_degree = self.out_degree.get(compound, 0)
+            update_ordered_set(
+                self.sources, compound, out_degree > 0 and in_degree == 0
+            )
+            update_ordered_set(self.sinks, compound, in_degree > 0 and out_degree == 0)
+            if in_degree == 0 and out_degree == 0:
+                self.in_degree.pop(compound, None)
+                self.out_degree.pop(compound, None)
+
+    def partial_complete_network(self):
+        """Builds the partially completed edge dataframe, in the same format
+        as Network_Completion.partial_complete_network
+
+        Returns
+        -------
+        pandas DataFrame
+            the current reactions, then a source edge for every compound in
+            self.sources and a sink edge for every compound in self.sinks
+        """
+        edge_df = pd.DataFrame(
+            list(self.edge_rows.values()),
+            columns=["reaction_id", "substrate", "product", "reaction_type"],
+        )
+        source_df = create_source_df(list(self.sources))
+        sink_df = create_sink_df(list(self.sinks))
+        return pd.concat([edge_df, source_df, sink_df], axis=0)
+
+
+def flatten_compounds(compound_lists):
+    """Unique compounds of a col of compound lists, in order of first
+    appearance
+
+    Returns
+    -------
+    pandas Series
+        the unique compounds
+    """
+    flat = pd.Series(compound_lists, dtype=object).explode().dropna()
+    return pd.Series(pd.unique(flat.to_numpy()), dtype=object)
+
+
+def count_compounds(compound_lists):
+    """Counts how many times each compound appears in a col of compound
+    lists
+
+    Returns
+    -------
+    dictionary
+        keys are compounds, values are counts
+    """
+    flat = pd.Series(list(compound_lists), dtype=object).explode().dropna()
+    if len(flat) == 0:
+        return {}
+    return flat.value_counts(sort=False).to_dict()
+
+
+def find_duplicates(values):
+    """Values that appear more than once, in order of first appearance"""
+    seen = set()
+    duplicates = {}
+    for value in values:
+        if value in seen:
+            duplicates[value] = None
+        seen.add(value)
+    return list(duplicates)
+
+
+def update_ordered_set(ordered_set, key, keep):
+    """Adds key to (or removes it from) a dict used as an ordered set"""
+    if keep:
+        ordered_set.setdefault(key, None)
+    else:
+        ordered_set.pop(key, None)
+
+
+def create_source_df(nodes_that_need_source):
+    """Edge dataframe of 'reactions' that correspond to sources,
+    [-1] will correspond to the source (we assume column names here)"""
+    nodes_that_need_source = list(nodes_that_need_source)
+    source_dict = {
+        "reaction_id": [-1] * len(nodes_that_need_source),
+        "substrate": [[-1]] * len(nodes_that_need_source),
+        "product": [[node] for node in nodes_that_need_source],
+        "reaction_type": ["source"] * len(nodes_that_need_source),
+    }
+    return pd.DataFrame(source_dict)
+
+
+def create_sink_df(nodes_that_need_sink):
+    """Edge dataframe of 'reactions' that correspond to sinks,
+    [-2] will be our sink (we assume column names here)"""
+    nodes_that_need_sink = list(nodes_that_need_sink)
+    sink_dict = {
+        "reaction_id": [-2] * len(nodes_that_need_sink),
+        "substrate": [[node] for node in nodes_that_need_sink],
+        "product": [[-2]] * len(nodes_that_need_sink),
+        "reaction_type": ["sink"] * len(nodes_that_need_sink),
+    }
+    return pd.DataFrame(sink_dict)
+
+
 if __name__ == '__main__':
     absolutePath = os.path.abspath(__file__)
     fileDirectory = os.path.dirname(absolutePath)
@@ -154,5 +318,5 @@ if __name__ == '__main__':
     net_comp = Network_Completion(network, edge_obj)
     # expand the hyper edges wihtin the network
     expanded_df = net_vis.expand_reaction_df(net_comp.partial_complete_network)
-    # create a networkx graph based on expanded network
+    # create a CSR_Graph based on expanded network
     G = net_vis.generate_reaction_graph(expanded_df)
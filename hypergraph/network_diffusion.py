@@ -0,0 +1,207 @@
+import numpy as np
+import os
+from scipy import sparse
+from fileIO import readXLSX, read_KGML, read_cloneID_to_orf_table
+from drug_data import Drug_Data
+from kegg_network import KEGG_Network
+from network_integration import Network_Integration
+from helper_functions import create_gene_effects, create_row_mean_matrix
+
+
+class Network_Diffusion:
+
+    """Random walks with restart over a hypergraph of metabolites
+
+    The hypergraph is given by a signed incidence matrix (metabolites x
+    edges, negative for the tail/substrates, positive for the head/products),
+    eg: KEGG_Network.S_matrix or Ubergraph.toSparse(). A walker at a
+    metabolite picks one of its edges, then one metabolite of that edge:
+
+        undirected: any incident edge, then any metabolite of the edge
+        directed: an edge it is a substrate of, then one of its products
+
+    so the transition matrix is P = Dv^-1 A De^-1 B^T with A, B the 0/1
+    incidences used to leave and enter edges. Personalized PageRank runs
+    every restart vector (eg: one per drug) at once, each power iteration
+    step is one sparse x dense matrix product. Mass with nowhere to go is
+    sent back to the restart vector.
+
+    Attributes
+    ----------
+    transition_matrix : scipy.sparse.csr_matrix
+        (metabolites x metabolites) P, rows sum to at most 1
+    node_to_edge : scipy.sparse.csr_matrix
+        (edges x metabolites) averages metabolite scores over each edge
+    edge_to_node : scipy.sparse.csr_matrix
+        (metabolites x edges) spreads each edge's weight evenly over its
+        metabolites
+    gene_mean_matrix : scipy.sparse.csr_matrix
+        (edges x genes) averages gene effects over the genes of each edge,
+        None without a reaction x gene matrix
+    """
+
+    def __init__(self, incidence, reaction_gene_matrix=None, directed=False):
+        """Builds the sparse operators
+
+        Parameters
+        ----------
+        incidence : 2d array or scipy sparse matrix
+            signed (metabolites x edges) incidence
+        reaction_gene_matrix : scipy sparse matrix, optional
+            (edges x genes) 0/1 catalysis matrix, eg:
+            KEGG_Network.reaction_gene_matrix
+        directed : bool
+            walk from substrates to products only
+        """
+        incidence = sparse.csr_matrix(incidence)
+        members = (incidence != 0).astype(np.float64)
+        if directed:
+            leave = (incidence < 0).astype(np.float64)
+            enter = (incidence > 0).astype(np.float64)
+        else:
+            leave = members
+            enter = members
+
+        # pick an edge the metabolite can leave by, then a metabolite of it
+        self.transition_matrix = sparse.csr_matrix(
+            create_row_mean_matrix(leave) @ create_row_mean_matrix(enter.T)
+        )
+        self.node_to_edge = create_row_mean_matrix(members.T)
+        self.edge_to_node = sparse.csr_matrix(create_row_mean_matrix(members.T).T)
+        self.gene_mean_matrix = None
+        if reaction_gene_matrix is not None:
+            self.gene_mean_matrix = create_row_mean_matrix(reaction_gene_matrix)
+
+    @classmethod
+    def from_network(cls, network, directed=False):
+        """Diffusion over the S matrix of a KEGG_Network, with its genes"""
+        return cls(network.S_matrix, network.reaction_gene_matrix, directed)
+
+    @classmethod
+    def from_ubergraph(cls, ubergraph, directed=False):
+        """Diffusion over the incidence matrix of an Ubergraph"""
+        return cls(ubergraph.toSparse(), directed=directed)
+
+    def personalized_pagerank(self, restart, alpha=0.15, tol=1e-10, max_iter=1000):
+        """Personalized PageRank for many restart vectors at once
+
+        Solves X = alpha R + (1 - alpha) P^T X by power iteration, where
+        each col of R is a restart vector normalized to sum to 1 (in
+        absolute value, so signed effects keep their sign)
+
+        Parameters
+        ----------
+        restart : 1d or 2d array
+            (metabolites x num restart vectors) restart weights
+        alpha : float
+            restart probability
+        tol : float
+            stop when no entry changes by more than tol
+        max_iter : int
+            maximum number of iterations
+
+        Returns
+        -------
+        2d array
+            (metabolites x num restart vectors) stationary scores
+        """
+        R = np.asarray(restart, dtype=np.float64)
+        if R.ndim == 1:
+            R = R[:, None]
+        totals = np.abs(R).sum(axis=0)
+        R = np.divide(R, totals, out=np.zeros_like(R), where=totals > 0)
+
+        transition_T = sparse.csr_matrix(self.transition_matrix.T)
+        # share of each metabolite's mass that has nowhere to go, eg: dead
+        # ends, or edges without products in the directed walk
+        leak = 1.0 - np.asarray(self.transition_matrix.sum(axis=1)).ravel()
+
+        X = R.copy()
+        for _ in range(max_iter):
+            walked = transition_T @ X
+            # mass that leaks restarts
+            walked += R * (leak @ X)
+            X_new = alpha * R + (1.0 - alpha) * walked
+            converged = np.abs(X_new - X).max() <= tol if X.size else True
+            X = X_new
+            if converged:
+                break
+        return X
+
+    def power_iteration(self, x0, num_steps):
+        """Spreads x0 along the walk for num_steps steps (no restart)
+
+        Returns
+        -------
+        2d array
+            (metabolites x num cols of x0) scores after num_steps steps
+        """
+        X = np.asarray(x0, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[:, None]
+        transition_T = sparse.csr_matrix(self.transition_matrix.T)
+        for _ in range(num_steps):
+            X = transition_T @ X
+        return X
+
+    def diffuse_gene_effects(self, gene_effects, alpha=0.15, signed=False, **kwargs):
+        """Propagates gene level drug effects through the network
+
+        Each edge gets the mean effect of its genes, each metabolite the
+        effects of its edges spread evenly over their metabolites, and that
+        is used as the restart vector of every drug col
+
+        Parameters
+        ----------
+        gene_effects : 2d array
+            (genes x drugs) effects, eg: helper_functions.create_gene_effects
+        alpha : float
+            restart probability
+        signed : bool
+            keep the sign of the effects, use their magnitude otherwise
+        **kwargs
+            passed on to personalized_pagerank
+
+        Returns
+        -------
+        2d array
+            (metabolites x drugs) metabolite scores
+        2d array
+            (edges x drugs) edge scores, mean of their metabolites' scores
+        """
+        if self.gene_mean_matrix is None:
+            raise ValueError("a reaction_gene_matrix is needed for gene effects")
+        effects = np.nan_to_num(np.asarray(gene_effects, dtype=np.float64))
+        if not signed:
+            effects = np.abs(effects)
+        edge_effects = self.gene_mean_matrix @ effects
+        restart = self.edge_to_node @ edge_effects
+        node_scores = self.personalized_pagerank(restart, alpha, **kwargs)
+        return node_scores, self.node_to_edge @ node_scores
+
+
+if __name__ == "__main__":
+    import time
+
+    absolutePath = os.path.abspath(__file__)
+    fileDirectory = os.path.dirname(absolutePath)
+    parentDirectory = os.path.dirname(fileDirectory)
+    path_drug_data = os.path.join(
+        parentDirectory, "input_files/Multidrug_6hr_Responses.xlsx"
+    )
+    path_cloneID_ORF = os.path.join(parentDirectory, "input_files/clone_to_orf.csv")
+    path_KEGG = os.path.join(parentDirectory, "input_files/KEGG_data/")
+
+    drug_data = Drug_Data(readXLSX(path_drug_data))
+    clone_ORF_lookup = read_cloneID_to_orf_table(path_cloneID_ORF)
+
+    # genes of the mtu central carbon map on the global reaction map
+    mtu_network = KEGG_Network(read_KGML(path_KEGG + "mtu01200.xml"))
+    rn_network = KEGG_Network(read_KGML(path_KEGG + "rn01100.xml"))
+    combined_network = Network_Integration(mtu_network, rn_network).combined_network
+
+    start = time.time()
+    diffusion = Network_Diffusion.from_network(combined_network)
+    gene_effects = create_gene_effects(combined_network, drug_data, clone_ORF_lookup)
+    node_scores, edge_scores = diffusion.diffuse_gene_effects(gene_effects)
+    print(node_scores.shape, edge_scores.shape, time.time() - start)
@@ -1,3 +1,5 @@
+import pandas as pd
+import numpy as np
 from kegg_network import KEGG_Network
 from fileIO import read_KGML, read_cloneID_to_orf_table, readXLSX
 from kegg_visualizer import KEGG_Visualizer
@@ -9,6 +11,13 @@ import os
 class Network_Integration:
 
     """Class for combining reaction networks organism networks
+
+    The baseline network is never modified, the combined network is a copy
+    on write of it (see KEGG_Network.copy) that shares its reactions and S
+    matrix and gets the organism's genes. Organism genes are joined to the
+    baseline reactions through a hashed index of the KEGG reaction names
+    (eg: rn:R00200), so one parsed baseline can be integrated with many
+    organisms (see integrate_many).
     
     Attributes
     ----------
@@ -18,18 +27,60 @@ class Network_Integration:
         organism-specific network, has genes
     rn_network : KEGG_Network
         baseline network, no genes
+    reaction_gene_df : pandas DataFrame
+        one row per (baseline reaction, organism gene) pair, cols are
+        reaction_index (position in rn_network.reactions), reaction_name
+        and gene
     """
     
-    def __init__(self, org_network, rn_network):
+    def __init__(self, org_network, rn_network, reaction_name_index=None):
+        """Combines the networks
+
+        Parameters
+        ----------
+        org_network : KEGG_Network
+            organism-specific network, has genes
+        rn_network : KEGG_Network
+            baseline network, no genes, left unchanged
+        reaction_name_index : pandas DataFrame, optional
+            create_reaction_name_index(rn_network), pass it when integrating
+            the same baseline many times
+        """
         self.org_network = org_network
         self.rn_network = rn_network
 
-        rn_network_with_genes = rn_network
+        if reaction_name_index is None:
+            reaction_name_index = create_reaction_name_index(rn_network)
+        self.reaction_gene_df = join_genes_to_reactions(
+            org_network, reaction_name_index
+        )
+
+        rn_network_with_genes = rn_network.copy()
+        # drop the baseline's gene attributes (and what is built from them)
+        rn_network_with_genes.invalidate("genes")
         rn_network_with_genes.genes = org_network.genes
-        rn_network_with_genes.gene_list = org_network.generate_gene_list
+        rn_network_with_genes.gene_list = org_network.gene_list
+        rn_network_with_genes.gene_entry_names = org_network.gene_entry_names
+        rn_network_with_genes.gene_entry_reactions = org_network.gene_entry_reactions
+        rn_network_with_genes.reaction_genes = self.create_reaction_genes()
 
         self.combined_network = rn_network_with_genes
 
+    def create_reaction_genes(self):
+        """Lists the organism genes of each baseline reaction
+
+        Returns
+        -------
+        list
+            one list of genes per reaction of rn_network (in the order of
+            rn_network.reactions), empty for reactions the organism lacks
+        """
+        reaction_genes = [[] for _ in range(len(self.rn_network.reaction_names))]
+        grouped = self.reaction_gene_df.groupby("reaction_index", sort=False)["gene"]
+        for reaction_index, genes in grouped:
+            reaction_genes[reaction_index] = list(pd.unique(genes.to_numpy()))
+        return reaction_genes
+
     def get_combined_network(self):
         """getter for combined network
         
@@ -40,6 +91,92 @@ class Network_Integration:
         """
         return self.combined_network
 
+    @classmethod
+    def integrate_many(cls, org_networks, rn_network):
+        """Integrates one baseline network with many organism networks
+
+        The baseline's reaction name index is built once and shared, and
+        the baseline itself is never copied beyond a shallow copy per
+        organism
+
+        Parameters
+        ----------
+        org_networks : list
+            organism-specific KEGG_Networks
+        rn_network : KEGG_Network
+            baseline network, no genes
+
+        Returns
+        -------
+        list
+            a Network_Integration per organism network, in the same order
+        """
+        reaction_name_index = create_reaction_name_index(rn_network)
+        # S_matrix is a cached_property, build it before copying so every
+        # shallow copy shares the baseline's matrix instead of building its own
+        _ = rn_network.S_matrix
+
+        return [
+            cls(org_network, rn_network, reaction_name_index)
+            for org_network in org_networks
+        ]
+
+
+def create_reaction_name_index(network):
+    """Creates the hashed index from KEGG reaction names to reactions
+
+    A KGML reaction can have several names (eg: 'rn:R01061 rn:R01063'),
+    it gets a row for each
+
+    Parameters
+    ----------
+    network : KEGG_Network
+        network whose reactions are indexed
+
+    Returns
+    -------
+    pandas DataFrame
+        indexed by reaction_name, col reaction_index is the position of
+        the reaction in network.reactions
+    """
+    names = pd.Series(network.reaction_names, dtype=object).str.split()
+    index = names.explode().dropna()
+    return pd.DataFrame(
+        {"reaction_index": index.index.to_numpy(dtype=np.intp)},
+        index=pd.Index(index.to_numpy(), name="reaction_name"),
+    )
+
+
+def join_genes_to_reactions(org_network, reaction_name_index):
+    """Joins the genes of an organism network to indexed reactions
+
+    Parameters
+    ----------
+    org_network : KEGG_Network
+        organism-specific network, has genes
+    reaction_name_index : pandas DataFrame
+        see create_reaction_name_index
+
+    Returns
+    -------
+    pandas DataFrame
+        cols are reaction_index, reaction_name and gene, sorted by
+        reaction_index (gene order is kept within a reaction)
+    """
+    gene_df = pd.DataFrame(
+        {
+            "gene": pd.Series(org_network.gene_entry_names, dtype=object).str.split(),
+            "reaction_name": pd.Series(
+                org_network.gene_entry_reactions, dtype=object
+            ).str.split(),
+        }
+    )
+    gene_df = gene_df.explode("gene").explode("reaction_name").dropna()
+
+    joined = gene_df.join(reaction_name_index, on="reaction_name", how="inner")
+    joined = joined.sort_values("reaction_index", kind="stable")
+    return joined[["reaction_index", "reaction_name", "gene"]].reset_index(drop=True)
+
 
 if __name__ == '__main__':
     absolutePath = os.path.abspath(__file__)
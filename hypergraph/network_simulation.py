@@ -0,0 +1,263 @@
+import numpy as np
+import os
+from scipy import sparse
+from fileIO import readXLSX, read_KGML, read_cloneID_to_orf_table
+from drug_data import Drug_Data
+from kegg_network import KEGG_Network
+from helper_functions import create_row_mean_matrix, create_membership_matrix
+from helper_functions import create_gene_effects
+
+
+class Network_Simulation:
+
+    """Simulates metabolite dynamics of a KEGG_Network with Hill kinetics
+
+    The state is a (metabolites x conditions) matrix X, one col per drug
+    condition (or drug combination), and every condition is advanced by the
+    same vectorized RK4 step
+
+        dX/dt = S @ V(X)
+
+    where S is the sparse S matrix of the network (rows follow
+    network.compound_list, cols follow network.S_reaction_ids) and the rate
+    of edge j under condition c is
+
+        V[j, c] = k[j] * 2 ** E[j, c] * prod over substrates i of H(X[i, c])
+
+    with H the Hill function (see KEGG_Network.hill_function) and E the
+    mean log2 fold change of the genes that catalyze edge j. The product is
+    taken as a sparse sum of logs, so one matrix product gives the rates of
+    every edge under every condition.
+
+    Attributes
+    ----------
+    network : KEGG_Network
+        network to simulate
+    S_matrix : scipy.sparse.csr_matrix
+        (num metabolites x num edges) stoichiometry
+    substrate_matrix : scipy.sparse.csr_matrix
+        (num edges x num metabolites), 1 where the metabolite is a substrate
+    gene_mean_matrix : scipy.sparse.csr_matrix
+        (num edges x num genes), averages gene effects over the genes of
+        each edge (see KEGG_Network.reaction_gene_matrix)
+    log_rate_constants : 1d array
+        log of the rate constant of each edge
+    half_saturation : 1d array
+        Hill constant k of each metabolite
+    hill_coefficient : 1d array
+        Hill coefficient n of each metabolite
+    """
+
+    def __init__(
+        self, network, rate_constants=1.0, half_saturation=1.0, hill_coefficient=1.0
+    ):
+        """Precomputes the sparse matrices of the network
+
+        Parameters
+        ----------
+        network : KEGG_Network
+            network to simulate
+        rate_constants : float or 1d array
+            rate constant of every edge (S matrix col)
+        half_saturation : float or 1d array
+            Hill constant of every metabolite (S matrix row)
+        hill_coefficient : float or 1d array
+            Hill coefficient of every metabolite
+        """
+        self.network = network
+        self.S_matrix = network.S_matrix.tocsr()
+        num_metabolites, num_edges = self.S_matrix.shape
+
+        substrates = (network.S_matrix < 0).T.astype(np.float64)
+        self.substrate_matrix = sparse.csr_matrix(substrates)
+
+        # row normalize so that a product with the gene effects is a mean
+        self.gene_mean_matrix = create_row_mean_matrix(network.reaction_gene_matrix)
+
+        rate_constants = np.broadcast_to(rate_constants, (num_edges,))
+        with np.errstate(divide="ignore"):
+            self.log_rate_constants = np.log(rate_constants.astype(np.float64))
+        self.half_saturation = np.broadcast_to(
+            np.asarray(half_saturation, dtype=np.float64), (num_metabolites,)
+        )
+        self.hill_coefficient = np.broadcast_to(
+            np.asarray(hill_coefficient, dtype=np.float64), (num_metabolites,)
+        )
+
+    def get_log_modulation(self, gene_effects=None, num_conditions=1):
+        """Log of the rate constant times the expression change of each edge
+
+        Parameters
+        ----------
+        gene_effects : 2d array, optional
+            (len(network.gene_list) x num conditions) log2 fold changes,
+            NaN is treated as no change, no change at all when not given
+        num_conditions : int
+            number of conditions when gene_effects is not given
+
+        Returns
+        -------
+        2d array
+            (num edges x num conditions)
+        """
+        if gene_effects is None:
+            return np.repeat(self.log_rate_constants[:, None], num_conditions, axis=1)
+        gene_effects = np.nan_to_num(np.asarray(gene_effects, dtype=np.float64))
+        edge_effects = self.gene_mean_matrix @ gene_effects
+        return self.log_rate_constants[:, None] + np.log(2.0) * edge_effects
+
+    def get_rates(self, X, log_modulation):
+        """Rates of every edge under every condition
+
+        Parameters
+        ----------
+        X : 2d array
+            (num metabolites x num conditions) state
+        log_modulation : 2d array
+            (num edges x num conditions), see get_log_modulation
+
+        Returns
+        -------
+        2d array
+            (num edges x num conditions) rates
+        """
+        X = np.maximum(X, 0.0)
+        K = self.half_saturation[:, None]
+        n = self.hill_coefficient[:, None]
+        with np.errstate(divide="ignore"):
+            log_hill = np.log(self.network.hill_function(X, K, n))
+        # an edge with a missing substrate has a log rate of -inf, ie: 0
+        return np.exp(self.substrate_matrix @ log_hill + log_modulation)
+
+    def get_derivative(self, X, log_modulation):
+        """dX/dt for every condition"""
+        return self.S_matrix @ self.get_rates(X, log_modulation)
+
+    def simulate(self, x0, t_end, dt, gene_effects=None, save_every=None):
+        """Integrates the network with fixed step RK4, all conditions at once
+
+        Parameters
+        ----------
+        x0 : 1d or 2d array
+            initial metabolite amounts, (num metabolites) is used for every
+            condition, (num metabolites x num conditions) gives each its own
+        t_end : float
+            time to integrate to
+        dt : float
+            step size, the last step is shorter when dt does not divide t_end
+        gene_effects : 2d array, optional
+            (len(network.gene_list) x num conditions) log2 fold changes, see
+            create_gene_effects
+        save_every : int, optional
+            keep the state every save_every steps, only the final state is
+            returned when not given
+
+        Returns
+        -------
+        1d array
+            the times of the returned states
+        3d array
+            (num times x num metabolites x num conditions) states
+        """
+        num_conditions = 1
+        if gene_effects is not None:
+            num_conditions = np.shape(gene_effects)[1]
+        X = np.asarray(x0, dtype=np.float64)
+        if X.ndim == 1:
+            X = np.repeat(X[:, None], num_conditions, axis=1)
+        log_modulation = self.get_log_modulation(gene_effects, X.shape[1])
+
+        # the tolerance keeps eg: 1.0 / 0.1 from adding a step, when dt does
+        # not divide t_end the last step is shortened to end at t_end
+        num_steps = max(int(np.ceil(t_end / dt - 1e-9)), 0)
+        times = [0.0]
+        states = [X]
+        for step in range(1, num_steps + 1):
+            h = dt if step < num_steps else t_end - (num_steps - 1) * dt
+            k1 = self.get_derivative(X, log_modulation)
+            k2 = self.get_derivative(X + 0.5 * h * k1, log_modulation)
+            k3 = self.get_derivative(X + 0.5 * h * k2, log_modulation)
+            k4 = self.get_derivative(X + h * k3, log_modulation)
+            X = X + (h / 6.0) * (k1 + 2.0 * k2 + 2.0 * k3 + k4)
+            if save_every is not None and step % save_every == 0:
+                times.append(step * dt if step < num_steps else t_end)
+                states.append(X)
+
+        t_final = t_end if num_steps else 0.0
+        if save_every is None:
+            return np.array([t_final]), X[None]
+        if num_steps % save_every != 0:
+            times.append(t_final)
+            states.append(X)
+        return np.array(times), np.stack(states)
+
+    def create_gene_effects(
+        self, drug_data, clone_ORF_lookup=None, gene_index=None, combinations=None
+    ):
+        """Log2 fold changes of the network genes under drug conditions, see
+        helper_functions.create_gene_effects"""
+        return create_gene_effects(
+            self.network, drug_data, clone_ORF_lookup, gene_index, combinations
+        )
+
+    def simulate_combinations(
+        self, drug_effects, combinations, x0, t_end, dt, chunk_size=4096
+    ):
+        """Final states of many drug combinations, simulated in chunks
+
+        Parameters
+        ----------
+        drug_effects : 2d array
+            (len(network.gene_list) x num drugs) log2 fold changes of single
+            drugs, see create_gene_effects
+        combinations : list
+            drug combinations (lists of cols of drug_effects), the effect of
+            a combination is the sum of its drugs' effects
+        x0 : 1d array
+            initial metabolite amounts, the same for every combination
+        t_end, dt : float
+            see simulate
+        chunk_size : int
+            number of combinations integrated together
+
+        Returns
+        -------
+        2d array
+            (num metabolites x num combinations) states at t_end
+        """
+        final_states = np.empty((len(x0), len(combinations)))
+        for start in range(0, len(combinations), chunk_size):
+            chunk = combinations[start : start + chunk_size]
+            membership = create_membership_matrix(drug_effects.shape[1], chunk)
+            gene_effects = np.nan_to_num(drug_effects) @ membership
+            final_states[:, start : start + len(chunk)] = self.simulate(
+                x0, t_end, dt, gene_effects
+            )[1][-1]
+        return final_states
+
+
+if __name__ == "__main__":
+    absolutePath = os.path.abspath(__file__)
+    fileDirectory = os.path.dirname(absolutePath)
+    parentDirectory = os.path.dirname(fileDirectory)
+    path_drug_data = os.path.join(
+        parentDirectory, "input_files/Multidrug_6hr_Responses.xlsx"
+    )
+    path_cloneID_ORF = os.path.join(parentDirectory, "input_files/clone_to_orf.csv")
+    path_KEGG = os.path.join(parentDirectory, "input_files/KEGG_data/mtu01200.xml")
+
+    drug_data = Drug_Data(readXLSX(path_drug_data))
+    clone_ORF_lookup = read_cloneID_to_orf_table(path_cloneID_ORF)
+    network = KEGG_Network(read_KGML(path_KEGG))
+
+    simulation = Network_Simulation(network)
+    gene_effects = simulation.create_gene_effects(drug_data, clone_ORF_lookup)
+    x0 = np.ones(len(network.compound_list))
+    times, states = simulation.simulate(x0, 10.0, 0.01, gene_effects)
+    print(states.shape)
+    combinations = [[0, 1], [2, 8], [8, 12, 20]]
+    final_states = simulation.simulate_combinations(
+        gene_effects, combinations, x0, 10.0, 0.01
+    )
+    print(final_states.sum(axis=0))
+    print(dict(zip(drug_data.drug_list, states[-1].sum(axis=0))))
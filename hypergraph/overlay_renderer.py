@@ -0,0 +1,269 @@
+import numpy as np
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from fileIO import readXLSX, read_KGML, read_cloneID_to_orf_table
+from drug_data import Drug_Data
+from kegg_network import KEGG_Network
+from kegg_visualizer import KEGG_Visualizer
+
+# the static scene and figure of a worker process, see _init_worker
+_worker_state = {}
+
+
+class Overlay_Renderer:
+
+    """Renders drug overlays of a reaction graph to image files, headless
+
+    The node positions, node styles and edge segments are computed once,
+    each drug col then only changes the edge colors. Frames are drawn with
+    the Agg canvas (no pyplot, no display needed) and can be split across
+    a process pool, each worker builds its figure once and reuses the same
+    node and edge artists for every frame.
+
+    Attributes
+    ----------
+    net_vis : KEGG_Visualizer
+        visualizer of the network, gives the graph and the edge colors
+    positions : dictionary
+        keys are nodes, values are (x, y) positions
+    scene : dictionary
+        static arrays used to draw every frame (see create_scene)
+    """
+
+    def __init__(self, net_vis, positions=None, prog="kgml"):
+        """Precomputes the static scene
+
+        Parameters
+        ----------
+        net_vis : KEGG_Visualizer
+            visualizer of the network to render
+        positions : dictionary, optional
+            precomputed node positions, eg: from net_vis.get_layout
+        prog : string
+            layout prog used when positions is not given, see
+            KEGG_Visualizer.get_layout
+        """
+        self.net_vis = net_vis
+        if positions is None:
+            positions = net_vis.get_layout("reaction", prog)
+        self.positions = positions
+        self.scene = self.create_scene()
+
+    def create_scene(self):
+        """Computes the arrays that are the same for every frame
+
+        Returns
+        -------
+        dictionary
+            node_xy (nodes x 2), node_sizes, node_colors, edge_segments
+            (edges x 2 x 2, in reaction_graph edge order), arrow_heads
+            (edges x 3 x 2 triangles), limits and title prefix
+        """
+        graph = self.net_vis.reaction_csr_graph
+        node_xy = np.array([self.positions[node] for node in graph.nodes], dtype=float)
+
+        # virtual hyper edge nodes are drawn small and black
+        is_virtual = self.net_vis.reaction_virtual_nodes
+        node_sizes = np.where(is_virtual, 20, 300)
+        node_colors = np.where(is_virtual, "#000000", "#1f78b4")
+
+        edges = graph.out_edges
+        starts = node_xy[graph.edge_sources[edges]]
+        ends = node_xy[graph.edge_targets[edges]]
+        edge_segments = np.stack([starts, ends], axis=1)
+
+        # a triangle pointing along each edge, placed past the middle so it
+        # is not hidden by the target node
+        vectors = ends - starts
+        lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+        directions = np.divide(
+            vectors, lengths, out=np.zeros_like(vectors), where=lengths > 0
+        )
+        normals = directions[:, ::-1] * [-1.0, 1.0]
+        head_length = 0.25 * np.median(lengths) if len(lengths) else 0.0
+        tips = starts + 0.65 * vectors
+        bases = tips - head_length * directions
+        arrow_heads = np.stack(
+            [
+                tips,
+                bases + 0.4 * head_length * normals,
+                bases - 0.4 * head_length * normals,
+            ],
+            axis=1,
+        )
+
+        if len(node_xy):
+            margin = 0.05 * np.ptp(node_xy, axis=0) + 1.0
+            limits = np.stack(
+                [node_xy.min(axis=0) - margin, node_xy.max(axis=0) + margin]
+            )
+        else:
+            limits = np.array([[0.0, 0.0], [1.0, 1.0]])
+
+        return {
+            "node_xy": node_xy,
+            "node_sizes": node_sizes,
+            "node_colors": node_colors,
+            "edge_segments": edge_segments,
+            "arrow_heads": arrow_heads,
+            "limits": limits,
+            "title": self.net_vis.network.name,
+        }
+
+    def render(self, drug_table, output_dir, formats=("png",), n_workers=None, dpi=100):
+        """Renders one file per drug col of drug_table and format
+
+        The edge colors of every drug are computed here at once (see
+        KEGG_Visualizer.annotate_reaction_graph_batch), the workers only
+        draw and save
+
+        Parameters
+        ----------
+        drug_table : dataframe
+            first col is the clone id, every other col is one drug
+        output_dir : string
+            folder for the image files, created if needed
+        formats : list
+            file formats supported by matplotlib, eg: png, svg, pdf
+        n_workers : int, optional
+            size of the process pool, defaults to the cpu count, 1 renders
+            in this process
+        dpi : int
+            resolution of raster formats
+
+        Returns
+        -------
+        list
+            paths of the written files, in drug col then format order, a
+            drug whose file name is taken gets a _2, _3, ... suffix
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        color_maps = self.net_vis.annotate_reaction_graph_batch(drug_table)
+        network_name = sanitize_file_name(self.scene["title"])
+        file_names = create_unique_file_names(
+            [network_name + "_" + sanitize_file_name(drug) for drug in color_maps]
+        )
+
+        frames = []
+        for (drug, colors), file_name in zip(color_maps.items(), file_names):
+            paths = [os.path.join(output_dir, file_name + "." + fmt) for fmt in formats]
+            frames.append((str(drug), colors, paths))
+
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        n_workers = min(n_workers, len(frames))
+        if n_workers <= 1:
+            _init_worker(self.scene, dpi)
+            results = [_render_frame(*frame) for frame in frames]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_init_worker,
+                initargs=(self.scene, dpi),
+            ) as executor:
+                results = list(executor.map(_render_frame, *zip(*frames)))
+
+        return [path for paths in results for path in paths]
+
+
+def create_figure(scene):
+    """Builds the figure and the artists that are reused between frames
+
+    Returns
+    -------
+    Figure
+        the figure, on an Agg canvas
+    LineCollection
+        edge lines, recolored per frame
+    PolyCollection
+        arrow heads, recolored per frame
+    """
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_axis_off()
+    ax.set_xlim(scene["limits"][:, 0])
+    ax.set_ylim(scene["limits"][:, 1])
+
+    edges = LineCollection(scene["edge_segments"], linewidths=2, zorder=1)
+    arrows = PolyCollection(scene["arrow_heads"], linewidths=0, zorder=2)
+    ax.add_collection(edges)
+    ax.add_collection(arrows)
+    xy = scene["node_xy"]
+    ax.scatter(
+        xy[:, 0], xy[:, 1], s=scene["node_sizes"], c=scene["node_colors"], zorder=3
+    )
+    return fig, edges, arrows
+
+
+def sanitize_file_name(name):
+    """Replaces characters that are not safe in file names with _"""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", str(name))
+
+
+def create_unique_file_names(names):
+    """Appends _2, _3, ... to names that are already taken, so drugs whose
+    names sanitize to the same string don't overwrite each other's files
+
+    The comparison ignores case, for case insensitive file systems
+    """
+    taken = set()
+    unique_names = []
+    for name in names:
+        unique_name = name
+        suffix = 2
+        while unique_name.lower() in taken:
+            unique_name = name + "_" + str(suffix)
+            suffix += 1
+        taken.add(unique_name.lower())
+        unique_names.append(unique_name)
+    return unique_names
+
+
+def _init_worker(scene, dpi):
+    """Builds the figure once per worker process"""
+    fig, edges, arrows = create_figure(scene)
+    _worker_state["scene"] = scene
+    _worker_state["dpi"] = dpi
+    _worker_state["figure"] = fig
+    _worker_state["edges"] = edges
+    _worker_state["arrows"] = arrows
+
+
+def _render_frame(drug, colors, paths):
+    """Recolors the edges for one drug and saves the frame to each path"""
+    fig = _worker_state["figure"]
+    _worker_state["edges"].set_color(colors)
+    _worker_state["arrows"].set_facecolor(colors)
+    fig.axes[0].set_title(_worker_state["scene"]["title"] + " - " + drug)
+    for path in paths:
+        fig.savefig(path, dpi=_worker_state["dpi"])
+    return paths
+
+
+if __name__ == "__main__":
+    absolutePath = os.path.abspath(__file__)
+    fileDirectory = os.path.dirname(absolutePath)
+    parentDirectory = os.path.dirname(fileDirectory)
+    path_drug_data = os.path.join(
+        parentDirectory, "input_files/Multidrug_6hr_Responses.xlsx"
+    )
+    path_KEGG = os.path.join(parentDirectory, "input_files/KEGG_data/")
+    path_cloneID_ORF = os.path.join(parentDirectory, "input_files/clone_to_orf.csv")
+    output_dir = os.path.join(parentDirectory, "output_files/overlays")
+
+    cloneID_ORF = read_cloneID_to_orf_table(path_cloneID_ORF)
+    clone_id_to_gene = dict(zip(cloneID_ORF.iloc[:, 0], cloneID_ORF.iloc[:, 1]))
+    drug_data = Drug_Data(readXLSX(path_drug_data))
+    drug_table = drug_data.average_drug_table
+    drug_table = drug_table[drug_table.iloc[:, 0].isin(clone_id_to_gene.keys())]
+
+    network = KEGG_Network(read_KGML(path_KEGG + "mtu01200.xml"))
+    net_vis = KEGG_Visualizer(network, clone_id_to_gene)
+    renderer = Overlay_Renderer(net_vis, prog="kgml")
+    paths = renderer.render(drug_table, output_dir, formats=("png", "pdf"))
+    print(len(paths), "files written to", output_dir)
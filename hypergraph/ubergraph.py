@@ -1,4 +1,6 @@
 import numpy as np
+from collections import deque
+from scipy import sparse
 
 # TODO Add ability to name nodes/edges
 # TODO Add error checking
@@ -6,21 +8,36 @@ import numpy as np
 
 # Rows correspond to vertices
 # Columns correspond to edges
+# Negative entries are the tail (inputs) of an edge, positive entries are
+# the head (outputs), like the S matrix of a KEGG_Network
 
 
 class Ubergraph:
 
     # Construct from list of edges
     def __init__(self, *incidence):
-        self.matrix = np.column_stack(incidence)
-        self.order = np.shape(self.matrix)[0]
-        self.size = np.shape(self.matrix)[1]
+        matrix = np.column_stack(incidence)
+        self.order = np.shape(matrix)[0]
+        self.size = np.shape(matrix)[1]
+        # the incidence matrix lives in the top left corner of a buffer with
+        # spare rows/cols, the buffer doubles when full so adding nodes/edges
+        # one at a time is amortized O(1) copies
+        self._buffer = np.array(matrix)
         self.nodeNames = []
         self.edgeNames = []
+        # name -> id indexes, kept in sync with nodeNames/edgeNames
+        self._nodeIDs = {}
+        self._edgeIDs = {}
+        # sparse tails/heads used by the reach queries, see _tailsAndHeads
+        self._sparseIncidence = None
         for i in range(self.order):
-            self.nodeNames.append("v_" + str(i))
+            self._appendName(self.nodeNames, self._nodeIDs, "v_" + str(i))
         for i in range(self.size):
-            self.edgeNames.append("e_" + str(i))
+            self._appendName(self.edgeNames, self._edgeIDs, "e_" + str(i))
+
+    @property
+    def matrix(self):
+        return self._buffer[: self.order, : self.size]
 
     def getOrder(self):
         return self.order
@@ -35,36 +52,265 @@ class Ubergraph:
         return self.edgeNames[id]
 
     def getNodeID(self, name):
-        return self.nodeNames.index(name)
+        return self._nodeIDs[name]
 
     def getEdgeID(self, name):
-        return self.edgeNames.index(name)
+        return self._edgeIDs[name]
 
     def setNodeName(self, id, newName):
-        self.nodeNames[id] = newName
+        self._rename(self.nodeNames, self._nodeIDs, id, newName)
 
     def setEdgeName(self, id, newName):
-        self.edgeNames[id] = newName
+        self._rename(self.edgeNames, self._edgeIDs, id, newName)
 
     def getNode(self, id):
         return self.matrix[id, :]
 
     def setNode(self, id, incidence):
         self.matrix[id, :] = incidence
+        self._sparseIncidence = None
 
     def getEdge(self, id):
         return self.matrix[:, id]
 
     def setEdge(self, id, incidence):
         self.matrix[:, id] = incidence
+        self._sparseIncidence = None
+
+    # incidence is a (1, order) array, like a row of addEdges
+    def addEdge(self, incidence, name=None):
+        names = None if name is None else [name]
+        self.addEdges(np.reshape(incidence, (1, self.order)), names)
+
+    # incidence is a (1, size) array, like a row of addNodes
+    def addNode(self, incidence, name=None):
+        names = None if name is None else [name]
+        self.addNodes(np.reshape(incidence, (1, self.size)), names)
+
+    # each row of incidences is the incidence of a new edge over the nodes
+    def addEdges(self, incidences, names=None):
+        incidences = np.asarray(incidences)
+        numEdges = incidences.shape[0]
+        if names is None:
+            names = ["e_" + str(self.size + i) for i in range(numEdges)]
+        self._checkNewNames(self._edgeIDs, names, numEdges)
+
+        self._reserve(self.order, self.size + numEdges, incidences.dtype)
+        self._buffer[: self.order, self.size : self.size + numEdges] = incidences.T
+        self.size = self.size + numEdges
+        self._sparseIncidence = None
+        for name in names:
+            self._appendName(self.edgeNames, self._edgeIDs, name)
+
+    # each row of incidences is the incidence of a new node over the edges
+    def addNodes(self, incidences, names=None):
+        incidences = np.asarray(incidences)
+        numNodes = incidences.shape[0]
+        if names is None:
+            names = ["v_" + str(self.order + i) for i in range(numNodes)]
+        self._checkNewNames(self._nodeIDs, names, numNodes)
+
+        self._reserve(self.order + numNodes, self.size, incidences.dtype)
+        self._buffer[self.order : self.order + numNodes, : self.size] = incidences
+        self.order = self.order + numNodes
+        self._sparseIncidence = None
+        for name in names:
+            self._appendName(self.nodeNames, self._nodeIDs, name)
+
+    # sparse copy of the incidence matrix
+    def toSparse(self):
+        return sparse.csc_matrix(self.matrix)
+
+    # B-connectivity: an edge fires once every node of its tail is reached,
+    # then its head is reached. Edges with an empty tail always fire.
+    # Returns (reached nodes, fired edges) as bool arrays. Each edge keeps a
+    # counter of unreached tail nodes, so once the sparse tails/heads are
+    # built (first query after a change) this is linear in the number of
+    # nonzero incidences
+    def forwardReach(self, seeds):
+        tails, heads = self._tailsAndHeads()
+        reached, fired, _, _ = self._propagate(tails, heads, self._nodeIDsOf(seeds))
+        return reached, fired
+
+    # F-connectivity: the forward reach of the reversed graph, where an
+    # edge fires once its whole head is reached, then its tail is reached.
+    # The tail of an edge with a head node outside the reached set is not
+    # reached, so this is not every node that can take part in producing
+    # targets
+    def backwardReach(self, targets):
+        tails, heads = self._tailsAndHeads()
+        reached, fired, _, _ = self._propagate(heads, tails, self._nodeIDsOf(targets))
+        return reached, fired
+
+    # can target be produced from seeds (is it B-connected to them)
+    def isProducible(self, target, seeds):
+        return bool(self.forwardReach(seeds)[0][self._nodeIDsOf([target])[0]])
+
+    # names of the nodes that can be produced from seeds
+    def producibleNodes(self, seeds):
+        reached = self.forwardReach(seeds)[0]
+        return [self.nodeNames[id] for id in np.flatnonzero(reached)]
+
+    # edge ids of a B-hyperpath from seeds to target, in an order they can
+    # fire in, None if target can't be produced. Each node is produced by
+    # the first edge that reached it during forward propagation
+    def forwardHyperpath(self, seeds, target):
+        tails, heads = self._tailsAndHeads()
+        propagation = self._propagate(tails, heads, self._nodeIDsOf(seeds))
+        return self._tracePath(tails, propagation, self._nodeIDsOf([target])[0])
+
+    # edge ids of a hyperpath from source back to targets in the reversed
+    # graph, in an order they can fire in the reversed graph
+    def backwardHyperpath(self, targets, source):
+        tails, heads = self._tailsAndHeads()
+        propagation = self._propagate(heads, tails, self._nodeIDsOf(targets))
+        return self._tracePath(heads, propagation, self._nodeIDsOf([source])[0])
 
-    def addEdge(self, incidence):
-        self.matrix = np.concatenate((self.matrix, incidence.T), axis=1)
-        self.size = self.size + 1
+    # forward reach from many seed sets at once, one propagation round per
+    # step of the longest hyperpath, every round is two sparse products.
+    # Returns (order x number of seed sets) and (size x number of seed
+    # sets) bool arrays
+    def forwardReachMany(self, seedSets):
+        tails, heads = self._tailsAndHeads()
+        return self._propagateMany(tails, heads, seedSets)
 
-    def addNode(self, incidence):
-        self.matrix = np.concatenate((self.matrix, incidence), axis=0)
-        self.order = self.order + 1
+    # backward reach from many target sets at once
+    def backwardReachMany(self, targetSets):
+        tails, heads = self._tailsAndHeads()
+        return self._propagateMany(heads, tails, targetSets)
+
+    # (order x size) sparse 0/1 matrices of the tails and heads of the
+    # edges, each as a (csr, csc) pair. Built from the dense buffer on first
+    # use and cached until the incidence changes through addEdges, addNodes,
+    # setNode or setEdge (writes into the arrays returned by getNode/getEdge
+    # or matrix bypass this)
+    def _tailsAndHeads(self):
+        if self._sparseIncidence is None:
+            incidence = self.toSparse()
+            tails = (incidence < 0).astype(np.int64)
+            heads = (incidence > 0).astype(np.int64)
+            self._sparseIncidence = (
+                (tails.tocsr(), tails.tocsc()),
+                (heads.tocsr(), heads.tocsc()),
+            )
+        return self._sparseIncidence
+
+    def _nodeIDsOf(self, nodes):
+        # ints are node ids, anything else is a node name
+        return [
+            node if isinstance(node, (int, np.integer)) else self._nodeIDs[node]
+            for node in nodes
+        ]
+
+    # queue based propagation with per edge counters of unreached inputs.
+    # Returns (reached nodes, fired edges, producer, firing step), producer
+    # is the edge that first reached each node (-1 for seeds/unreached) and
+    # firing step is the order the edges fired in (-1 for unfired)
+    def _propagate(self, inputs, outputs, seeds):
+        inputs, inputsByEdge = inputs
+        outputs = outputs[1]
+        remaining = np.diff(inputsByEdge.indptr)
+        reached = np.zeros(self.order, dtype=bool)
+        producer = np.full(self.order, -1, dtype=np.intp)
+        firingStep = np.full(self.size, -1, dtype=np.intp)
+        numFired = 0
+
+        queue = deque()
+        for node in seeds:
+            if not reached[node]:
+                reached[node] = True
+                queue.append(node)
+
+        ready = deque(np.flatnonzero(remaining == 0))
+        while ready or queue:
+            # fire every edge whose inputs are all reached
+            while ready:
+                edge = ready.popleft()
+                firingStep[edge] = numFired
+                numFired += 1
+                start, end = outputs.indptr[edge], outputs.indptr[edge + 1]
+                for node in outputs.indices[start:end]:
+                    if not reached[node]:
+                        reached[node] = True
+                        producer[node] = edge
+                        queue.append(node)
+            if queue:
+                node = queue.popleft()
+                start, end = inputs.indptr[node], inputs.indptr[node + 1]
+                for edge in inputs.indices[start:end]:
+                    remaining[edge] -= 1
+                    if remaining[edge] == 0:
+                        ready.append(edge)
+        return reached, firingStep >= 0, producer, firingStep
+
+    # walk back from target through the producing edges, returns the edges
+    # in the order they fired, so each edge comes after the producers of
+    # its inputs
+    def _tracePath(self, inputs, propagation, target):
+        reached, _, producer, firingStep = propagation
+        if not reached[target]:
+            return None
+        inputs = inputs[1]
+        edges = set()
+        needed = [target]
+        while needed:
+            edge = producer[needed.pop()]
+            if edge < 0 or edge in edges:
+                continue
+            edges.add(edge)
+            needed.extend(inputs.indices[inputs.indptr[edge] : inputs.indptr[edge + 1]])
+        return sorted((int(edge) for edge in edges), key=lambda edge: firingStep[edge])
+
+    def _propagateMany(self, inputs, outputs, seedSets):
+        inputs = inputs[1]
+        outputs = outputs[0]
+        inputCounts = np.diff(inputs.indptr)[:, None]
+        reached = np.zeros((self.order, len(seedSets)), dtype=bool)
+        for col, seeds in enumerate(seedSets):
+            reached[self._nodeIDsOf(seeds), col] = True
+
+        while True:
+            # an edge fires when all of its inputs are reached
+            fired = (inputs.T @ reached.astype(np.int64)) == inputCounts
+            newReached = reached | ((outputs @ fired.astype(np.int64)) > 0)
+            if np.array_equal(newReached, reached):
+                return reached, fired
+            reached = newReached
+
+    # make room for an (order, size) matrix of dtype in the buffer
+    def _reserve(self, order, size, dtype):
+        rows, cols = self._buffer.shape
+        dtype = np.result_type(self._buffer.dtype, dtype)
+        if order <= rows and size <= cols and dtype == self._buffer.dtype:
+            return
+        if order > rows:
+            rows = max(order, 2 * rows)
+        if size > cols:
+            cols = max(size, 2 * cols)
+        buffer = np.zeros((rows, cols), dtype=dtype)
+        buffer[: self.order, : self.size] = self.matrix
+        self._buffer = buffer
+
+    def _appendName(self, names, ids, name):
+        if name in ids:
+            raise ValueError("name already in use: " + str(name))
+        ids[name] = len(names)
+        names.append(name)
+
+    def _checkNewNames(self, ids, names, count):
+        if len(names) != count:
+            raise ValueError("expected " + str(count) + " names")
+        if len(set(names)) != count or any(name in ids for name in names):
+            raise ValueError("names must be unique")
+
+    def _rename(self, names, ids, id, newName):
+        if newName == names[id]:
+            return
+        if newName in ids:
+            raise ValueError("name already in use: " + str(newName))
+        del ids[names[id]]
+        ids[newName] = id
+        names[id] = newName
 
     # print matrix
     def print(self):
@@ -92,3 +338,8 @@ if __name__ == "__main__":
     print(uber.getNodeName(2))
     print(uber.getNodeID("Pebus"))
     print(uber.getEdgeName(1))
+    uber.addEdges(np.array([[1, 0, 0, -1, 0], [0, 1, -1, 0, 0]]), ["r_1", "r_2"])
+    uber.print()
+    print(uber.getEdgeID("r_2"))
+    print(uber.producibleNodes(["v_1"]))
+    print(uber.forwardHyperpath(["v_1"], "v_0"))
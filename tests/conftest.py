@@ -0,0 +1,34 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# modules in hypergraph/ import each other by module name
+absolutePath = os.path.abspath(__file__)
+fileDirectory = os.path.dirname(absolutePath)
+parentDirectory = os.path.dirname(fileDirectory)
+sys.path.insert(0, os.path.join(parentDirectory, "hypergraph"))
+
+from drug_data import Drug_Data
+
+
+def get_input_path(relative_path):
+    """Path of a file in input_files"""
+    return os.path.join(parentDirectory, "input_files", relative_path)
+
+
+def make_drug_data(clone_ids, num_sheets=4, seed=0):
+    """Builds a small Drug_Data object with random expression levels"""
+    rng = np.random.default_rng(seed)
+    excel = {}
+    for i in range(num_sheets):
+        values = rng.normal(scale=1.5, size=(len(clone_ids), 2)).round(3)
+        sheet = pd.DataFrame(
+            {
+                "ID_REF": clone_ids,
+                "GSM%d_a" % i: values[:, 0],
+                "GSM%d_b" % i: values[:, 1],
+            }
+        )
+        excel["drug_%d" % i] = sheet
+    return Drug_Data(excel)
@@ -0,0 +1,64 @@
+import itertools
+import numpy as np
+import pandas as pd
+from combination_screener import Combination_Screener
+from drug_data import Drug_Data
+from fileIO import read_KGML, read_cloneID_to_orf_table
+from kegg_network import KEGG_Network
+from tests.conftest import get_input_path
+
+
+def make_screener(num_drugs=9, seed=1):
+    """Builds a screener over random drug data for the mtu00010 genes"""
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml")))
+    clone_ORF_lookup = read_cloneID_to_orf_table(get_input_path("clone_to_orf.csv"))
+    orfs = [gene[4:] for gene in network.gene_list]
+    clone_ids = clone_ORF_lookup[clone_ORF_lookup.iloc[:, 1].isin(orfs)].iloc[:, 0]
+
+    rng = np.random.default_rng(seed)
+    excel = {}
+    for i in range(num_drugs):
+        num_replicates = 1 + i % 3
+        sheet = pd.DataFrame({"ID_REF": clone_ids.tolist()})
+        for j in range(num_replicates):
+            sheet["GSM%d_%d" % (i, j)] = rng.normal(scale=1.5, size=len(sheet))
+        excel["drug_%d" % i] = sheet
+
+    drug_data = Drug_Data(excel)
+    return Combination_Screener(drug_data, network, clone_ORF_lookup), network
+
+
+def test_screen_matches_exhaustive_scores():
+    """Tests the screened top k against scoring every combination"""
+    screener, network = make_screener()
+    drug_data = screener.drug_data
+
+    expected = []
+    for combo in itertools.combinations(range(drug_data.num_drugs), 3):
+        cols = [col for drug in combo for col in drug_data.drug_column_indices[drug]]
+        expected.append((screener.l1_scores.compute_L1(cols, network), combo))
+    expected.sort(key=lambda item: (-item[0], item[1]))
+
+    best, histogram = screener.screen(
+        3, top_k=5, n_workers=1, chunk_size=7, histogram_bins=10
+    )
+    assert list(best.drug_combination) == [combo for _, combo in expected[:5]]
+    assert np.allclose(best.L1_score, [score for score, _ in expected[:5]])
+    assert histogram.sum() == len(expected)
+
+    pooled, pooled_histogram = screener.screen(
+        3, top_k=5, n_workers=2, chunk_size=7, histogram_bins=10
+    )
+    pd.testing.assert_frame_equal(pooled, best)
+    assert np.array_equal(pooled_histogram, histogram)
+
+
+def test_search_matches_screen():
+    """Tests that branch and bound finds the same top k as the full screen"""
+    screener, _ = make_screener(num_drugs=12, seed=2)
+    for k in [1, 2, 4]:
+        best, _ = screener.screen(k, top_k=6, n_workers=1)
+        searched, num_pruned = screener.search(k, top_k=6)
+        pd.testing.assert_frame_equal(searched, best)
+        assert num_pruned >= 0
+    assert num_pruned > 0
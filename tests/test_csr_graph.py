@@ -0,0 +1,31 @@
+import networkx as nx
+import numpy as np
+from csr_graph import CSR_Graph
+
+
+def test_csr_graph_matches_networkx():
+    """Tests the CSR graph against a DiGraph built one edge at a time"""
+    sources = [1, "h0", 1, 2, 3, "h0", 1, 4]
+    targets = ["h0", 2, "h0", 3, 1, 3, 5, 1]
+    labels = ["a", "b", "c", "d", "e", "f", "g", "h"]
+    graph = CSR_Graph(sources, targets, labels)
+
+    G = nx.DiGraph()
+    for u, v, label in zip(sources, targets, labels):
+        G.add_edge(u, v, label=label)
+
+    # the repeated edge 1 -> h0 keeps its position and the last label
+    assert graph.number_of_edges() == 7
+    assert graph.edges() == list(G.edges)
+    exported = graph.to_networkx()
+    assert list(exported.nodes) == list(G.nodes)
+    assert list(exported.edges(data=True)) == list(G.edges(data=True))
+
+    for node in G.nodes:
+        assert graph.successors(node) == list(G.successors(node))
+        assert graph.predecessors(node) == list(G.predecessors(node))
+        assert graph.out_degree(node) == G.out_degree(node)
+        assert graph.in_degree(node) == G.in_degree(node)
+        assert graph.bfs(node) == list(nx.bfs_tree(G, node))
+        assert graph.bfs(node, reverse=True) == list(nx.bfs_tree(G, node, reverse=True))
+    assert np.array_equal(graph.out_degree(), [G.out_degree(n) for n in G.nodes])
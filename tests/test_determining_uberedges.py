@@ -0,0 +1,73 @@
+import pytest
+import numpy as np
+from fileIO import read_KGML, read_cloneID_to_orf_table
+from kegg_network import KEGG_Network
+from determining_uberedges import Determining_Uberedges
+from tests.conftest import get_input_path, make_drug_data
+
+
+def test_reaction_drug_effect_matrix():
+    """Tests each aggregation against a loop over the (gene, reaction) pairs"""
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu01200.xml")))
+    clone_ORF_lookup = read_cloneID_to_orf_table(get_input_path("clone_to_orf.csv"))
+    orfs = [gene[4:] for gene in network.gene_list]
+    in_network = clone_ORF_lookup.iloc[:, 1].isin(orfs)
+    drug_data = make_drug_data(clone_ORF_lookup[in_network].iloc[:, 0].tolist())
+    drug_data.drug_values[0, 2] = np.nan
+    d_u = Determining_Uberedges(drug_data, clone_ORF_lookup, network)
+
+    drug_combos = [[1, 2], [3], [4, 6, 8], [2, 5]]
+    drug_values = drug_data.drug_values
+
+    # every gene with drug data of every reaction name of the S matrix, a
+    # name like "rn:R01061 rn:R01063" gets the genes of each reaction
+    gene_rows = {}
+    for gene in network.genes:
+        for name in gene.name.split(" "):
+            well_id = d_u.gene_index.well_id_of_gene(name)
+            row = None if well_id is None else d_u.gene_index.row_of_well_id(well_id)
+            if row is not None:
+                for reaction in gene.reaction.split(" "):
+                    gene_rows.setdefault(reaction, {})[name] = row
+    reaction_genes = {}
+    for reaction_names in network.S_reaction_names:
+        genes = {}
+        for reaction in reaction_names.split():
+            genes.update(gene_rows.get(reaction, {}))
+        if genes:
+            reaction_genes[reaction_names] = genes
+
+    aggregations = {
+        "sum": np.sum,
+        "mean": np.mean,
+        "max-abs": lambda values: values[np.argmax(np.abs(values))],
+    }
+    for aggregation, aggregate in aggregations.items():
+        effects = d_u.generate_reaction_drug_effect_matrix(drug_combos, aggregation)
+        assert sorted(effects.index) == sorted(reaction_genes)
+        assert effects.index.is_unique
+        for reaction, genes in reaction_genes.items():
+            rows = list(genes.values())
+            for col, combo in enumerate(drug_combos):
+                gene_effects = drug_values[rows][:, [c - 1 for c in combo]].sum(axis=1)
+                expected = aggregate(gene_effects)
+                if np.isnan(gene_effects).any():
+                    expected = np.nan
+                assert np.isclose(effects.loc[reaction, col], expected, equal_nan=True)
+
+    # a single gene reaction matches the per combination dict
+    reaction_drug_effect_dict = d_u.generate_reaction_drug_effect_dict(drug_combos[2])
+    effects = d_u.generate_reaction_drug_effect_matrix(drug_combos)
+    for reaction, genes in reaction_genes.items():
+        if len(genes) == 1 and reaction in reaction_drug_effect_dict:
+            assert np.isclose(
+                effects.loc[reaction, 2], reaction_drug_effect_dict[reaction]
+            )
+
+    # col 0 of the drug_table is the clone id, not a drug
+    num_drug_cols = drug_values.shape[1]
+    for bad_combo in [[0, 1], [1, num_drug_cols + 1]]:
+        with pytest.raises(ValueError):
+            d_u.generate_reaction_drug_effect_matrix([[1], bad_combo])
+        with pytest.raises(ValueError):
+            d_u.generate_reaction_drug_effect_dict(bad_combo)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from drug_data import Drug_Data
+
+
+def test_drug_tables():
+    """Tests aligning sheets with different gene order and replicates"""
+    excel = {
+        "drug_a": pd.DataFrame(
+            {"ID_REF": ["g2", "g1", "g3"], "a1": [1.0, 2.0, 3.0], "a2": [3.0, 4.0, 5.0]}
+        ),
+        "drug_b": pd.DataFrame({"ID_REF": ["g1", "g4"], "b1": [-1.5, 0.5]}),
+    }
+    drug_data = Drug_Data(excel)
+
+    assert drug_data.drug_tensor.shape == (4, 2, 2)
+    assert drug_data.replicate_mask.tolist() == [[True, True], [True, False]]
+    assert [list(cols) for cols in drug_data.drug_column_indices] == [[0, 1], [2]]
+
+    # same table as an outer merge on ID_REF
+    expected = pd.merge(excel["drug_a"], excel["drug_b"], on="ID_REF", how="outer")
+    pd.testing.assert_frame_equal(drug_data.drug_table, expected)
+
+    averages = drug_data.average_drug_table
+    assert list(averages.columns) == ["ID_REF", "drug_a_avg", "drug_b_avg"]
+    assert np.allclose(
+        averages.iloc[:, 1:].to_numpy(),
+        [[3.0, -1.5], [2.0, np.nan], [4.0, np.nan], [np.nan, 0.5]],
+        equal_nan=True,
+    )
+
+    significant = drug_data.significance_filters.iloc[:, 1:].to_numpy()
+    assert significant.tolist() == [
+        [True, True, True],
+        [True, True, False],
+        [True, True, False],
+        [False, False, False],
+    ]
+
+
+def test_memmap_roundtrip(tmp_path):
+    """Tests exporting the arrays and reopening them memory mapped"""
+    excel = {
+        "drug_a": pd.DataFrame({"ID_REF": ["g1", "g2"], "a1": [1.5, -0.5]}),
+        "drug_b": pd.DataFrame(
+            {"ID_REF": ["g2", "g3"], "b1": [2.0, -3.0], "b2": [0.0, 1.0]}
+        ),
+    }
+    drug_data = Drug_Data(excel)
+    drug_data.export_memmap(str(tmp_path))
+    reopened = Drug_Data.load_memmap(str(tmp_path))
+
+    assert isinstance(reopened.drug_values, np.memmap)
+    assert not reopened.drug_values.flags.writeable
+    assert reopened.drug_list == drug_data.drug_list
+    assert "drug_table" not in vars(reopened)
+    pd.testing.assert_frame_equal(reopened.drug_table, drug_data.drug_table)
+    pd.testing.assert_frame_equal(
+        reopened.average_drug_table, drug_data.average_drug_table
+    )
+    pd.testing.assert_frame_equal(
+        reopened.significance_filters, drug_data.significance_filters
+    )
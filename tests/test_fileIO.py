@@ -1,4 +1,5 @@
 import os
+import pytest
 import pandas as pd
 
 
@@ -42,3 +43,107 @@ def test_fileIO():
         data = pd.read_excel(xls, sheet_name=s)
         print(data)
         assert isinstance(data, pd.DataFrame)
+
+
+def test_readXLSX_cache(tmp_path):
+    """Tests that cached sheets match freshly parsed sheets"""
+    import shutil
+    from fileIO import readXLSX, get_xlsx_cache_path
+    from fileIO import get_file_cache_key, read_xlsx_cache
+
+    absolutePath = os.path.abspath(__file__)
+    fileDirectory = os.path.dirname(absolutePath)
+    parentDirectory = os.path.dirname(fileDirectory)
+    source = os.path.join(
+        parentDirectory, "input_files/Multidrug_6hr_Responses_trimmed.xlsx"
+    )
+    path = os.path.join(tmp_path, "responses.xlsx")
+    shutil.copy(source, path)
+
+    parsed = readXLSX(path)
+    assert os.path.exists(get_xlsx_cache_path(path))
+    cached = readXLSX(path)
+    assert list(cached.keys()) == list(parsed.keys())
+    for sheet_name in parsed:
+        pd.testing.assert_frame_equal(cached[sheet_name], parsed[sheet_name])
+
+    # a changed workbook invalidates the cache
+    os.utime(path, ns=(0, 0))
+    cache_path = get_xlsx_cache_path(path)
+    assert read_xlsx_cache(cache_path, get_file_cache_key(path)) is None
+    assert list(readXLSX(path).keys()) == list(parsed.keys())
+    assert read_xlsx_cache(cache_path, get_file_cache_key(path)) is not None
+
+
+def test_generate_cloneID_to_orf_table(tmp_path):
+    """Tests streaming the platform tables of a gzipped family SOFT file"""
+    import gzip
+    from fileIO import generate_cloneID_to_orf_table, read_cloneID_to_orf_table
+
+    soft_text = "\n".join(
+        [
+            "^DATABASE = GeoMiame",
+            "!Database_name = Gene Expression Omnibus (GEO)",
+            "^PLATFORM = GPL1",
+            "!Platform_title = first",
+            "#ID = well id",
+            "#ORF = gene",
+            "!platform_table_begin",
+            "ID\tSPOT\tORF",
+            "1\ta\tRv0001",
+            "2\tb\tRv0002",
+            "3\tc",
+            "!platform_table_end",
+            "^SAMPLE = GSM1",
+            "!sample_table_begin",
+            "ID_REF\tVALUE",
+            "1\t0.5",
+            "!sample_table_end",
+            "^PLATFORM = GPL2",
+            "!platform_table_begin",
+            "ORF\tID",
+            "Rv0003\t7",
+            "!platform_table_end",
+        ]
+    )
+    path = os.path.join(tmp_path, "GPL_family.soft.gz")
+    with gzip.open(path, "wt") as file:
+        file.write(soft_text + "\n")
+
+    save_location = os.path.join(tmp_path, "clone_to_orf.csv")
+    # the first platform by default, its clone ids could collide with the
+    # ids of the other platforms
+    assert generate_cloneID_to_orf_table(path, save_location) == 3
+    table = read_cloneID_to_orf_table(save_location)
+    assert list(table.columns) == ["ID", "ORF"]
+    assert table.ID.tolist() == [1, 2, 3]
+    assert table.ORF.fillna("").tolist() == ["Rv0001", "Rv0002", ""]
+
+    # another platform of the family file
+    assert generate_cloneID_to_orf_table(path, save_location, platform="GPL2") == 1
+    table = read_cloneID_to_orf_table(save_location)
+    assert table.values.tolist() == [[7, "Rv0003"]]
+
+    with pytest.raises(ValueError):
+        generate_cloneID_to_orf_table(path, save_location, platform="GPL3")
+    assert read_cloneID_to_orf_table(save_location).values.tolist() == [[7, "Rv0003"]]
+
+
+def test_write_atomic_mode(tmp_path):
+    """Tests that atomic writes get the mode of a normally created file"""
+    import stat
+    from fileIO import write_atomic, UMASK
+
+    path = os.path.join(tmp_path, "new.txt")
+    write_atomic(path, lambda file: file.write(b"new"))
+    with open(os.path.join(tmp_path, "open.txt"), "wb") as file:
+        file.write(b"open")
+    expected = stat.S_IMODE(os.stat(os.path.join(tmp_path, "open.txt")).st_mode)
+    assert stat.S_IMODE(os.stat(path).st_mode) == expected == 0o666 & ~UMASK
+
+    # a replaced file keeps its mode
+    os.chmod(path, 0o640)
+    write_atomic(path, lambda file: file.write(b"replaced"))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    with open(path, "rb") as file:
+        assert file.read() == b"replaced"
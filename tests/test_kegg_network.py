@@ -0,0 +1,85 @@
+import os
+import numpy as np
+from fileIO import read_KGML
+from kegg_network import KEGG_Network
+from tests.conftest import get_input_path
+
+
+def test_S_matrix():
+    """Tests the sparse S matrix against the reactions of the pathway"""
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml")))
+    S_matrix = network.S_matrix
+
+    num_edges = sum(
+        2 if reaction.type == "reversible" else 1 for reaction in network.reactions
+    )
+    assert S_matrix.shape == (len(network.compound_list), num_edges)
+    assert len(network.S_reaction_ids) == num_edges
+    assert np.array_equal(network.create_simple_S_matrix(), S_matrix.toarray())
+
+    # each forward col holds -1 for the substrates and +1 for the products
+    compound_list = np.array(network.compound_list)
+    for reaction in network.reactions:
+        col = network.S_reaction_ids.index(reaction.id)
+        assert not network.S_reversed[col]
+        column = S_matrix[:, col].toarray().ravel()
+        substrates = {name for entry in reaction.substrates for name in entry._names}
+        products = {name for entry in reaction.products for name in entry._names}
+        assert set(compound_list[column == -1]) == substrates - products
+        assert set(compound_list[column == 1]) == products
+        if reaction.type == "reversible":
+            assert network.S_reversed[col + 1]
+            reverse = S_matrix[:, col + 1].toarray().ravel()
+            assert set(compound_list[reverse == 1]) == substrates
+
+
+def test_from_KGML_cache(tmp_path):
+    """Tests that a cached network matches a freshly parsed one"""
+    path = get_input_path("KEGG_data/mtu00010.xml")
+    parsed = KEGG_Network.from_KGML(path, cache_dir=str(tmp_path))
+    assert os.path.exists(tmp_path / "mtu00010.xml.network.npz")
+
+    cached = KEGG_Network.from_KGML(path, cache_dir=str(tmp_path))
+    assert "pathway" not in vars(cached)
+    assert cached.name == parsed.name
+    assert cached.gene_list == parsed.gene_list
+    assert cached.compound_list == parsed.compound_list
+    assert cached.reaction_names == parsed.reaction_names
+    assert cached.reaction_substrates == parsed.reaction_substrates
+    assert cached.reaction_products == parsed.reaction_products
+    assert cached.S_reaction_ids == parsed.S_reaction_ids
+    assert np.array_equal(cached.S_reversed, parsed.S_reversed)
+    assert (cached.S_matrix != parsed.S_matrix).nnz == 0
+
+    # the KGML objects are parsed on first use
+    assert len(cached.reactions) == len(parsed.reactions)
+    assert "pathway" in vars(cached)
+
+
+def test_lazy_attributes():
+    """Tests that attributes are computed on first use and can be invalidated"""
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml")))
+    assert "S_matrix" not in vars(network)
+
+    gene_list = network.gene_list
+    assert "gene_list" in vars(network)
+    assert "S_matrix" not in vars(network)
+
+    S_matrix = network.S_matrix
+    assert np.array_equal(network.adjacency_matrix, S_matrix.toarray())
+
+    # dropping the compound list also drops everything built from it
+    network.invalidate("compound_list")
+    assert "S_matrix" not in vars(network)
+    assert "adjacency_matrix" not in vars(network)
+    assert network.gene_list is gene_list
+    assert (network.S_matrix != S_matrix).nnz == 0
+
+    # the reaction gene matrix has a col per gene_list entry
+    reaction_gene_matrix = network.reaction_gene_matrix
+    network.invalidate("gene_list")
+    assert "gene_list" not in vars(network)
+    assert "reaction_gene_matrix" not in vars(network)
+    assert "S_matrix" in vars(network)
+    assert network.gene_list == gene_list
+    assert (network.reaction_gene_matrix != reaction_gene_matrix).nnz == 0
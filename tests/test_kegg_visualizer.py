@@ -0,0 +1,161 @@
+import pytest
+import numpy as np
+import pandas as pd
+from fileIO import read_KGML
+from kegg_network import KEGG_Network
+from kegg_visualizer import KEGG_Visualizer
+from tests.conftest import get_input_path
+
+
+def test_expand_reaction_df():
+    """Tests hyper edge expansion against a hand expanded table"""
+    reaction_df = pd.DataFrame(
+        {
+            "reaction_id": [1, 2, 3],
+            "substrate": [[10], [10, 11], [12]],
+            "product": [[20], [21], [22, 23]],
+            "reaction_type": ["reversible", "irreversible", "reversible"],
+        }
+    )
+    expanded = KEGG_Visualizer.expand_reaction_df(None, reaction_df)
+
+    expected = pd.DataFrame(
+        [
+            [1, 10, 20, "reversibleFalse"],
+            [1, 20, 10, "reversibleFalse"],
+            [2, 10, "h0", "irreversibleTrue"],
+            [2, "h0", 21, "irreversibleTrue"],
+            [2, 11, "h0", "irreversibleTrue"],
+            [2, "h0", 21, "irreversibleTrue"],
+            [3, 12, "h1", "reversibleTrue"],
+            [3, "h1", 22, "reversibleTrue"],
+            [3, "h1", 12, "reversibleTrue"],
+            [3, 22, "h1", "reversibleTrue"],
+            [3, 12, "h1", "reversibleTrue"],
+            [3, "h1", 23, "reversibleTrue"],
+            [3, "h1", 12, "reversibleTrue"],
+            [3, 23, "h1", "reversibleTrue"],
+        ],
+        columns=["reaction_id", "substrate", "product", "reaction_type"],
+    )
+    pd.testing.assert_frame_equal(expanded, expected)
+
+    # a reaction without substrates has no edges, it is rejected
+    reaction_df.at[0, "substrate"] = []
+    with pytest.raises(ValueError):
+        KEGG_Visualizer.expand_reaction_df(None, reaction_df)
+
+
+def reference_reaction_colors(net_vis, drug_data):
+    """Colors the reaction graph edges one edge at a time, like the loop
+    based annotate_reaction_graph did"""
+    up_reg_df = drug_data[drug_data.iloc[:, 1] >= 0.1]
+    down_reg_df = drug_data[drug_data.iloc[:, 1] <= -0.1]
+    regulation_dict = {}
+    for clone_id in up_reg_df.iloc[:, 0]:
+        regulation_dict[net_vis.clone_id_to_gene[clone_id]] = "up"
+    for clone_id in down_reg_df.iloc[:, 0]:
+        regulation_dict[net_vis.clone_id_to_gene[clone_id]] = "down"
+
+    gene_to_reaction_name_dict = {}
+    for gene in net_vis.network.genes:
+        for gene_name in gene.name.split(" "):
+            for reaction in gene.reaction.split(" "):
+                gene_to_reaction_name_dict[gene_name[4:]] = reaction[3:]
+    reaction_name_to_gene_dict = {}
+    for gene, reactions in gene_to_reaction_name_dict.items():
+        for reaction in reactions.split(" "):
+            reaction_name_to_gene_dict[reaction] = gene
+
+    expanded_df = net_vis.expanded_reaction_df
+    df_edge_list = list(expanded_df.iloc[:, 1:3].itertuples(index=False, name=None))
+    colors = []
+    for edge in net_vis.reaction_graph.edges:
+        reaction_id = expanded_df.iloc[df_edge_list.index(edge), 0]
+        reaction_name = net_vis.reaction_id_to_name_dict[reaction_id][3:]
+        regulation = regulation_dict.get(reaction_name_to_gene_dict.get(reaction_name))
+        if regulation == "up":
+            colors.append("#a0e2a8")
+        elif regulation == "down":
+            colors.append("#d66969")
+        else:
+            colors.append("#b5b5b5")
+    return colors
+
+
+def test_annotate_reaction_graph_batch():
+    """Tests batch edge coloring against coloring one edge at a time"""
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml")))
+    genes = sorted({name[4:] for name in network.gene_list})
+    clone_id_to_gene = {"clone" + str(i): gene for i, gene in enumerate(genes)}
+    # a second clone for some genes, a gene is down if any clone is down
+    for i, gene in enumerate(genes[::3]):
+        clone_id_to_gene["extra" + str(i)] = gene
+    net_vis = KEGG_Visualizer(network, clone_id_to_gene)
+
+    rng = np.random.default_rng(0)
+    num_clones = len(clone_id_to_gene)
+    drug_table = pd.DataFrame(
+        {
+            "ID_REF": list(clone_id_to_gene),
+            "up": np.ones(num_clones),
+            "random": rng.normal(scale=0.2, size=num_clones),
+            "mixed": rng.choice([-1.0, 0.0, 1.0], size=num_clones),
+        }
+    )
+    color_maps = net_vis.annotate_reaction_graph_batch(drug_table)
+    num_edges = len(net_vis.reaction_graph.edges)
+
+    for drug in ["up", "random", "mixed"]:
+        expected = reference_reaction_colors(net_vis, drug_table[["ID_REF", drug]])
+        assert len(expected) == num_edges
+        assert color_maps[drug] == expected
+    assert {"#a0e2a8", "#d66969", "#b5b5b5"} <= set(color_maps["mixed"])
+
+    net_vis.annotate_reaction_graph(drug_table[["ID_REF", "mixed"]])
+    assert net_vis.reaction_color_map == color_maps["mixed"]
+
+
+def test_layout_cache(tmp_path, monkeypatch):
+    """Tests that graphviz layouts are computed once and reused from disk"""
+    import kegg_visualizer
+
+    calls = []
+
+    def fake_graphviz_layout(graph, prog):
+        calls.append(prog)
+        return {node: (float(i), 2.0 * i) for i, node in enumerate(graph.nodes)}
+
+    monkeypatch.setattr(kegg_visualizer, "graphviz_layout", fake_graphviz_layout)
+    monkeypatch.setattr(kegg_visualizer, "layout_cache", {})
+
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml")))
+    net_vis = KEGG_Visualizer(network, {}, layout_dir=str(tmp_path))
+    positions = net_vis.get_layout("reaction")
+    assert net_vis.get_layout("reaction") is positions
+    assert calls == ["neato"]
+
+    # a new visualizer with an empty memory cache reads the json file
+    kegg_visualizer.layout_cache.clear()
+    other_vis = KEGG_Visualizer(network, {}, layout_dir=str(tmp_path))
+    assert other_vis.get_layout("reaction") == positions
+    assert calls == ["neato"]
+
+
+def test_kgml_layout():
+    """Tests the layout taken from the KGML graphics coordinates"""
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml")))
+    net_vis = KEGG_Visualizer(network, {})
+    positions = net_vis.get_layout("reaction", prog="kgml")
+
+    graph = net_vis.reaction_csr_graph
+    assert list(positions) == graph.nodes
+    for node, (x, y) in positions.items():
+        if isinstance(node, str) and node.startswith("h"):
+            # virtual nodes sit at the centroid of their neighbors
+            neighbors = set(graph.successors(node)) | set(graph.predecessors(node))
+            neighbor_xy = np.array([positions[n] for n in neighbors])
+            assert np.allclose((x, y), neighbor_xy.mean(axis=0))
+        else:
+            graphics = network.pathway.entries[node].graphics[0]
+            assert (x, y) == (graphics.x, -graphics.y)
@@ -0,0 +1,141 @@
+import os
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fileIO import fetch_KGML_file
+from kgml_mirror import KGML_Mirror, main
+
+
+class Stub_KEGG_Handler(BaseHTTPRequestHandler):
+
+    """Serves a few maps like the KEGG REST api, with ETags"""
+
+    protocol_version = "HTTP/1.1"
+    maps = {
+        "mtu00010": b"<pathway name='path:mtu00010'/>",
+        "mtu00020": b"<pathway name='path:mtu00020'/>",
+        "mtu01200": b"<pathway name='path:mtu01200'/>",
+    }
+    pathway_list = b"path:mtu00010\tGlycolysis\npath:mtu00020\tTCA cycle\n"
+    # number of 503s left to answer per path, to test retries
+    failures = {}
+    requests = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.requests.append((self.path, self.headers.get("If-None-Match")))
+            failures = self.failures.get(self.path, 0)
+            if failures:
+                self.failures[self.path] = failures - 1
+        if failures:
+            return self.answer(503, b"busy")
+
+        parts = self.path.strip("/").split("/")
+        if parts[:2] == ["list", "pathway"] and parts[2] == "mtu":
+            body = self.pathway_list
+        elif parts[0] == "get" and parts[1] in self.maps:
+            body = self.maps[parts[1]]
+        else:
+            return self.answer(404, b"")
+
+        etag = '"%d"' % hash(body)
+        if self.headers.get("If-None-Match") == etag:
+            return self.answer(304, b"")
+        self.answer(200, body, etag)
+
+    def answer(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_kgml_mirror(tmp_path):
+    """Tests mirroring, resuming and revalidating against a stub server"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub_KEGG_Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = "http://127.0.0.1:%d" % server.server_address[1]
+    handler = Stub_KEGG_Handler
+    try:
+        handler.failures["/get/mtu00020/kgml"] = 2
+        mirror = KGML_Mirror(str(tmp_path), base_url=base_url, n_workers=2, backoff=0)
+        statuses = mirror.mirror_organism("mtu")
+        assert statuses == {"mtu00010": "downloaded", "mtu00020": "downloaded"}
+        for map_id in statuses:
+            with open(os.path.join(tmp_path, map_id + ".xml"), "rb") as file:
+                assert file.read() == handler.maps[map_id]
+
+        # a second run resumes, only missing maps are requested
+        handler.requests.clear()
+        statuses = mirror.mirror(["mtu00010", "mtu01200", "mtu99999"])
+        assert statuses == {
+            "mtu00010": "skipped",
+            "mtu01200": "downloaded",
+            "mtu99999": "missing",
+        }
+        assert sorted(path for path, _ in handler.requests) == [
+            "/get/mtu01200/kgml",
+            "/get/mtu99999/kgml",
+        ]
+
+        # refreshing sends the cached ETags, unchanged maps are not sent again
+        handler.requests.clear()
+        handler.maps["mtu00020"] = b"<pathway name='path:mtu00020' v='2'/>"
+        statuses = mirror.mirror(["mtu00010", "mtu00020"], refresh=True)
+        assert statuses == {"mtu00010": "not modified", "mtu00020": "downloaded"}
+        assert all(etag is not None for _, etag in handler.requests)
+        with open(os.path.join(tmp_path, "mtu00020.xml"), "rb") as file:
+            assert file.read() == handler.maps["mtu00020"]
+
+        # a server that stays busy fails the map, the others still finish
+        handler.failures["/get/mtu01200/kgml"] = 10
+        statuses = mirror.mirror(["mtu01200", "mtu00010"], refresh=True)
+        assert statuses == {"mtu01200": "failed", "mtu00010": "not modified"}
+        assert list(mirror.errors) == ["mtu01200"]
+        handler.failures.clear()
+
+        # command line interface
+        output_dir = os.path.join(tmp_path, "cli")
+        assert (
+            main(["mtu00010", "--output-dir", output_dir, "--base-url", base_url]) == 0
+        )
+        assert os.path.exists(os.path.join(output_dir, "mtu00010.xml"))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_fetch_KGML_file(tmp_path):
+    """Tests fetching single maps into a folder that does not exist yet"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub_KEGG_Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = "http://127.0.0.1:%d" % server.server_address[1]
+    handler = Stub_KEGG_Handler
+    try:
+        path = os.path.join(tmp_path, "KEGG_data")
+        kgml_path = fetch_KGML_file(path, "mtu00010", base_url)
+        assert kgml_path == os.path.join(path, "mtu00010.xml")
+        with open(kgml_path, "rb") as file:
+            assert file.read() == handler.maps["mtu00010"]
+
+        # the second fetch is conditional on the cached ETag
+        handler.requests.clear()
+        assert fetch_KGML_file(path, "mtu00010", base_url) == kgml_path
+        assert handler.requests == [
+            ("/get/mtu00010/kgml", '"%d"' % hash(handler.maps["mtu00010"]))
+        ]
+
+        with pytest.raises(FileNotFoundError):
+            fetch_KGML_file(path, "mtu99999", base_url)
+        assert not os.path.exists(os.path.join(path, "mtu99999.xml"))
+    finally:
+        server.shutdown()
+        server.server_close()
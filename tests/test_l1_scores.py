@@ -0,0 +1,51 @@
+import numpy as np
+from fileIO import read_KGML, read_cloneID_to_orf_table
+from kegg_network import KEGG_Network
+from l1_scores import L1_scores
+from tests.conftest import get_input_path, make_drug_data
+
+
+def test_compute_L1_batch():
+    """Tests that batched scores match the per-combination scores"""
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml")))
+    clone_ORF_lookup = read_cloneID_to_orf_table(get_input_path("clone_to_orf.csv"))
+
+    # the drug data holds the network genes and as many unrelated genes
+    orfs = [gene[4:] for gene in network.gene_list]
+    in_network = clone_ORF_lookup.iloc[:, 1].isin(orfs)
+    clone_ids = clone_ORF_lookup[in_network].iloc[:, 0].tolist()
+    clone_ids += clone_ORF_lookup[~in_network].iloc[:, 0].tolist()[: len(clone_ids)]
+    drug_data = make_drug_data(clone_ids)
+    l1 = L1_scores(drug_data)
+
+    combos = [(0, 1), (2, 5), (7,), (1, 3, 4), (0, 2, 4, 6), (6, 3)]
+    batch = l1.compute_L1_batch(combos, network, clone_ORF_lookup)
+
+    assert list(batch.drug_combination) == combos
+    assert (batch.L1_score > 0).all()
+    for combo, score in zip(combos, batch.L1_score):
+        expected = l1.compute_L1(list(combo), network, clone_ORF_lookup)
+        assert np.isclose(score, expected)
+
+
+def test_compute_L1_pathways():
+    """Tests that multi pathway scores match scoring each pathway alone"""
+    networks = [
+        KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml"))),
+        KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu01200.xml"))),
+    ]
+    clone_ORF_lookup = read_cloneID_to_orf_table(get_input_path("clone_to_orf.csv"))
+    orfs = [gene[4:] for network in networks for gene in network.gene_list]
+    in_network = clone_ORF_lookup.iloc[:, 1].isin(orfs)
+    drug_data = make_drug_data(clone_ORF_lookup[in_network].iloc[:, 0].tolist())
+    l1 = L1_scores(drug_data)
+
+    combos = [(0, 1), (2, 5, 6), (7,), (3, 4)]
+    scores = l1.compute_L1_pathways(combos, networks, clone_ORF_lookup)
+
+    assert len(scores) == len(networks) * len(combos)
+    for network in networks:
+        pathway_scores = scores[scores.pathway == network.name]
+        batch = l1.compute_L1_batch(combos, network, clone_ORF_lookup)
+        assert list(pathway_scores.drug_combination) == combos
+        assert np.allclose(pathway_scores.L1_score, batch.L1_score)
@@ -0,0 +1,74 @@
+import pytest
+import pandas as pd
+from network_completion import Network_Completion, Incremental_Completion
+
+
+def make_edge_df(rows):
+    return pd.DataFrame(
+        rows, columns=["reaction_id", "substrate", "product", "reaction_type"]
+    )
+
+
+def test_partial_complete_network():
+    """Tests source and sink edges of a small network"""
+    # 1 -> 2 -> 3, 2 + 4 -> 5, 5 -> 2
+    edge_df = make_edge_df(
+        [
+            [10, [1], [2], "irreversible"],
+            [11, [2], [3], "irreversible"],
+            [12, [2, 4], [5], "irreversible"],
+            [13, [5], [2], "irreversible"],
+        ]
+    )
+    completed = Network_Completion(None, edge_df).partial_complete_network
+
+    assert len(completed) == 7
+    sources = completed[completed.reaction_type == "source"]
+    sinks = completed[completed.reaction_type == "sink"]
+    assert sources["product"].tolist() == [[1], [4]]
+    assert sources["substrate"].tolist() == [[-1], [-1]]
+    assert sinks["substrate"].tolist() == [[3]]
+    assert sinks["product"].tolist() == [[-2]]
+
+
+def test_incremental_completion():
+    """Tests that adding and removing reactions matches a full completion"""
+    edge_df = make_edge_df(
+        [
+            [10, [1], [2], "irreversible"],
+            [11, [2], [3], "irreversible"],
+            [12, [2, 4], [5], "irreversible"],
+            [13, [5], [2], "irreversible"],
+        ]
+    )
+    completion = Incremental_Completion(edge_df.iloc[:2])
+    assert list(completion.sources) == [1]
+    assert list(completion.sinks) == [3]
+
+    completion.add_reactions(edge_df.iloc[2:])
+    completed = Network_Completion(None, edge_df).partial_complete_network
+    assert sorted(completion.sources) == [1, 4]
+    assert list(completion.sinks) == [3]
+    assert len(completion.partial_complete_network()) == len(completed)
+
+    # without 1 -> 2 compound 1 is gone, and 2 only comes from 5
+    completion.remove_reactions([10, 13])
+    assert sorted(completion.sources) == [2, 4]
+    assert sorted(completion.sinks) == [3, 5]
+    assert 1 not in completion.in_degree and 1 not in completion.out_degree
+
+    with pytest.raises(ValueError):
+        completion.add_reactions(edge_df.iloc[1:2])
+
+    # bad removals are rejected before anything changes
+    edge_rows = dict(completion.edge_rows)
+    with pytest.raises(ValueError, match="11"):
+        completion.remove_reactions([11, 11])
+    with pytest.raises(KeyError, match="10"):
+        completion.remove_reactions([11, 10])
+    assert completion.edge_rows == edge_rows
+    assert sorted(completion.sources) == [2, 4]
+    assert sorted(completion.sinks) == [3, 5]
+    with pytest.raises(ValueError, match="14"):
+        completion.add_reactions(make_edge_df([[14, [3], [6], "irreversible"]] * 2))
+    assert completion.edge_rows == edge_rows
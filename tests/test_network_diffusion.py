@@ -0,0 +1,50 @@
+import numpy as np
+from fileIO import read_KGML
+from kegg_network import KEGG_Network
+from network_diffusion import Network_Diffusion
+from ubergraph import Ubergraph
+from tests.conftest import get_input_path
+
+
+def test_personalized_pagerank():
+    """Tests the batched power iteration against a dense solve per restart vector"""
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml")))
+    diffusion = Network_Diffusion.from_network(network)
+    P = diffusion.transition_matrix.toarray()
+    rows = P.sum(axis=1)
+    assert np.allclose(rows[rows > 0], 1.0)
+
+    rng = np.random.default_rng(0)
+    restart = rng.uniform(size=(P.shape[0], 4))
+    restart[:, 3] = 0.0
+    restart[0, 3] = 1.0
+    alpha = 0.2
+    X = diffusion.personalized_pagerank(restart, alpha, tol=1e-13)
+
+    for c in range(restart.shape[1]):
+        r = restart[:, c] / restart[:, c].sum()
+        # dead ends jump back to the restart vector
+        P_c = P + np.outer(1.0 - rows, r)
+        x = alpha * np.linalg.solve(np.eye(len(r)) - (1.0 - alpha) * P_c.T, r)
+        assert np.allclose(X[:, c], x, atol=1e-10)
+    assert np.allclose(X.sum(axis=0), 1.0)
+
+    # gene effects give one col per drug
+    gene_effects = rng.normal(size=(len(network.gene_list), 3))
+    node_scores, edge_scores = diffusion.diffuse_gene_effects(gene_effects, signed=True)
+    assert node_scores.shape == (len(network.compound_list), 3)
+    assert edge_scores.shape == (network.S_matrix.shape[1], 3)
+
+
+def test_directed_ubergraph():
+    """Tests the directed walk on a small ubergraph"""
+    # v_0 -> v_1 + v_2, v_1 -> v_3
+    uber = Ubergraph(np.array([-1, 1, 1, 0]), np.array([0, -1, 0, 1]))
+    diffusion = Network_Diffusion.from_ubergraph(uber, directed=True)
+    expected = np.zeros((4, 4))
+    expected[0, 1] = expected[0, 2] = 0.5
+    expected[1, 3] = 1.0
+    assert np.allclose(diffusion.transition_matrix.toarray(), expected)
+
+    X = diffusion.power_iteration(np.array([1.0, 0.0, 0.0, 0.0]), 2)
+    assert np.allclose(X.ravel(), [0.0, 0.0, 0.0, 0.5])
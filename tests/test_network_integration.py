@@ -0,0 +1,37 @@
+from fileIO import read_KGML
+from kegg_network import KEGG_Network
+from network_integration import Network_Integration
+from tests.conftest import get_input_path
+
+
+def test_integrate_many():
+    """Tests that integration leaves the baseline network unchanged"""
+    rn_network = KEGG_Network(read_KGML(get_input_path("KEGG_data/rn01200.xml")))
+    org_networks = [
+        KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu01200.xml"))),
+        KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml"))),
+    ]
+    integrations = Network_Integration.integrate_many(org_networks, rn_network)
+    assert rn_network.gene_list == []
+
+    rn_names = [set(name.split()) for name in rn_network.reaction_names]
+    for integration, org_network in zip(integrations, org_networks):
+        combined = integration.combined_network
+        assert combined.gene_list == org_network.gene_list
+        assert combined.S_matrix is rn_network.S_matrix
+        assert combined.reactions is rn_network.reactions
+
+        # every joined gene is a gene of the organism for that reaction
+        df = integration.reaction_gene_df
+        assert len(df) > 0
+        for reaction_index, reaction_name, gene in df.itertuples(index=False):
+            assert reaction_name in rn_names[reaction_index]
+            entries = [
+                reactions
+                for names, reactions in zip(
+                    org_network.gene_entry_names, org_network.gene_entry_reactions
+                )
+                if gene in names.split()
+            ]
+            assert any(reaction_name in reactions.split() for reactions in entries)
+        assert len(combined.reaction_genes) == len(rn_network.reactions)
@@ -0,0 +1,62 @@
+import numpy as np
+from scipy.integrate import solve_ivp
+from fileIO import read_KGML
+from kegg_network import KEGG_Network
+from network_simulation import Network_Simulation
+from tests.conftest import get_input_path
+
+
+def test_simulate():
+    """Tests the batched RK4 integration against scipy, one condition at a time"""
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml")))
+    simulation = Network_Simulation(
+        network, rate_constants=0.5, half_saturation=2.0, hill_coefficient=2.0
+    )
+    rng = np.random.default_rng(0)
+    gene_effects = rng.normal(size=(len(network.gene_list), 3))
+    x0 = rng.uniform(0.5, 2.0, size=len(network.compound_list))
+
+    times, states = simulation.simulate(x0, 1.0, 0.01, gene_effects, save_every=50)
+    assert np.allclose(times, [0.0, 0.5, 1.0])
+    assert states.shape == (3, len(x0), 3)
+
+    for c in range(3):
+        log_modulation = simulation.get_log_modulation(gene_effects[:, [c]])
+
+        def derivative(t, x):
+            return simulation.get_derivative(x[:, None], log_modulation).ravel()
+
+        result = solve_ivp(derivative, (0.0, 1.0), x0, rtol=1e-10, atol=1e-12)
+        assert np.allclose(states[-1][:, c], result.y[:, -1], atol=1e-7)
+
+    # combinations are the sum of their drugs' effects
+    combinations = [[0], [0, 1], [0, 1, 2]]
+    final_states = simulation.simulate_combinations(
+        gene_effects, combinations, x0, 0.5, 0.01, chunk_size=2
+    )
+    summed = np.cumsum(gene_effects, axis=1)
+    expected = simulation.simulate(x0, 0.5, 0.01, summed)[1][-1]
+    assert np.allclose(final_states, expected)
+
+    # a dt that does not divide t_end shortens the last step to end at t_end
+    times, states = simulation.simulate(x0, 1.0, 0.3, gene_effects, save_every=2)
+    assert np.allclose(times, [0.0, 0.6, 1.0])
+    final_times, final_states = simulation.simulate(x0, 1.0, 0.3, gene_effects)
+    assert np.allclose(final_times, [1.0])
+    assert np.allclose(final_states[-1], states[-1])
+    for c in range(3):
+        log_modulation = simulation.get_log_modulation(gene_effects[:, [c]])
+
+        def derivative(t, x):
+            return simulation.get_derivative(x[:, None], log_modulation).ravel()
+
+        result = solve_ivp(derivative, (0.0, 1.0), x0, rtol=1e-10, atol=1e-12)
+        assert np.allclose(states[-1][:, c], result.y[:, -1], atol=1e-3)
+        # integrating past t_end, to 1.2, is not close
+        overshoot = solve_ivp(derivative, (0.0, 1.2), x0, rtol=1e-10, atol=1e-12)
+        assert not np.allclose(states[-1][:, c], overshoot.y[:, -1], atol=1e-3)
+    final_states = simulation.simulate_combinations(
+        gene_effects, combinations, x0, 1.0, 0.3
+    )
+    expected = simulation.simulate(x0, 1.0, 0.3, summed)[1][-1]
+    assert np.allclose(final_states, expected)
@@ -0,0 +1,57 @@
+import os
+import numpy as np
+import pandas as pd
+from fileIO import read_KGML
+from kegg_network import KEGG_Network
+from kegg_visualizer import KEGG_Visualizer
+from overlay_renderer import Overlay_Renderer
+from tests.conftest import get_input_path
+
+
+def test_render(tmp_path):
+    """Tests that one file is written per drug col and format"""
+    network = KEGG_Network(read_KGML(get_input_path("KEGG_data/mtu00010.xml")))
+    genes = sorted({name[4:] for name in network.gene_list})
+    clone_id_to_gene = {"clone" + str(i): gene for i, gene in enumerate(genes)}
+    net_vis = KEGG_Visualizer(network, clone_id_to_gene)
+
+    rng = np.random.default_rng(0)
+    drug_table = pd.DataFrame({"ID_REF": list(clone_id_to_gene)})
+    # the first and last drug names sanitize to the same file name
+    for drug in ["INH 1ug/mL", "RIF", "EMB", "INH 1ug:mL"]:
+        drug_table[drug] = rng.normal(scale=0.2, size=len(genes))
+
+    renderer = Overlay_Renderer(net_vis, prog="kgml")
+    assert len(renderer.scene["edge_segments"]) == len(net_vis.reaction_graph.edges)
+    # virtual hyper edge nodes are flagged by the visualizer
+    virtual = dict(net_vis.reaction_graph.nodes(data="virtual"))
+    assert any(virtual.values())
+    assert all(virtual[node] == str(node).startswith("h") for node in virtual)
+    assert np.array_equal(
+        renderer.scene["node_sizes"] == 20, net_vis.reaction_virtual_nodes
+    )
+
+    paths = renderer.render(
+        drug_table, str(tmp_path), formats=("png", "svg"), n_workers=1
+    )
+    assert len(paths) == 8
+    assert len(set(paths)) == 8
+    assert os.path.basename(paths[0]) == "path_mtu00010_INH_1ug_mL.png"
+    assert os.path.basename(paths[6]) == "path_mtu00010_INH_1ug_mL_2.png"
+    for path in paths:
+        assert os.path.getsize(path) > 0
+
+    # the process pool writes the same files as the serial render
+    parallel_dir = os.path.join(tmp_path, "parallel")
+    parallel_paths = renderer.render(
+        drug_table, parallel_dir, formats=("png", "svg"), n_workers=2
+    )
+    assert [os.path.basename(path) for path in parallel_paths] == [
+        os.path.basename(path) for path in paths
+    ]
+    for path, parallel_path in zip(paths, parallel_paths):
+        assert os.path.dirname(parallel_path) == parallel_dir
+        assert os.path.getsize(parallel_path) > 0
+        if path.endswith(".png"):
+            with open(path, "rb") as file, open(parallel_path, "rb") as other:
+                assert file.read() == other.read()
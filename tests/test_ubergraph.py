@@ -0,0 +1,70 @@
+import numpy as np
+from ubergraph import Ubergraph
+
+
+def test_add_edges_and_nodes():
+    """Tests growing an Ubergraph one edge at a time and in bulk"""
+    uber = Ubergraph(np.array([1, 0, 0]), np.array([-1, 1, 0]))
+    expected = uber.matrix.copy()
+
+    for i in range(50):
+        edge = np.array([[-1, 0, 1]]) * (i + 1)
+        uber.addEdge(edge, name="r_" + str(i))
+        expected = np.concatenate((expected, edge.T), axis=1)
+    uber.addEdges(np.array([[0, 2, -2], [3, 0, 0]]))
+    expected = np.concatenate((expected, np.array([[0, 3], [2, 0], [-2, 0]])), axis=1)
+    uber.addNode(np.full((1, 54), 7), name="atp")
+    expected = np.concatenate((expected, np.full((1, 54), 7)), axis=0)
+
+    assert np.array_equal(uber.matrix, expected)
+    assert uber.getOrder() == 4 and uber.getSize() == 54
+    assert np.array_equal(uber.toSparse().toarray(), expected)
+    assert uber.getEdgeID("r_10") == 12
+    assert uber.getEdgeName(53) == "e_53"
+    assert uber.getNodeID("atp") == 3
+
+    uber.setNodeName(3, "adp")
+    assert uber.getNodeID("adp") == 3
+    assert "atp" not in uber._nodeIDs
+
+
+def test_b_connectivity():
+    """Tests that a reaction needs all of its substrates"""
+    # e_0: v_0 + v_1 -> v_2, e_1: v_2 -> v_3, e_2: v_0 -> v_4, e_3: v_4 -> v_1
+    uber = Ubergraph(
+        np.array([-1, -1, 1, 0, 0]),
+        np.array([0, 0, -1, 1, 0]),
+        np.array([-1, 0, 0, 0, 1]),
+        np.array([0, 1, 0, 0, -1]),
+    )
+    reached, fired = uber.forwardReach(["v_2"])
+    assert reached.tolist() == [False, False, True, True, False]
+    assert fired.tolist() == [False, True, False, False]
+
+    # v_0 alone is not enough for e_0 until e_2, e_3 make v_1
+    assert uber.producibleNodes([0]) == ["v_0", "v_1", "v_2", "v_3", "v_4"]
+    assert not uber.isProducible("v_0", ["v_1"])
+    assert uber.forwardHyperpath(["v_0"], "v_3") == [2, 3, 0, 1]
+    assert uber.forwardHyperpath(["v_1"], "v_3") is None
+
+    # v_3 needs e_1, e_0 and everything upstream of e_0
+    reached, _ = uber.backwardReach(["v_3"])
+    assert reached.tolist() == [True, True, True, True, True]
+    assert uber.backwardHyperpath(["v_3"], "v_2") == [1]
+
+    seedSets = [["v_0"], ["v_1"], ["v_2"], [0, 1]]
+    reachedMany, firedMany = uber.forwardReachMany(seedSets)
+    for col, seeds in enumerate(seedSets):
+        reached, fired = uber.forwardReach(seeds)
+        assert np.array_equal(reachedMany[:, col], reached)
+        assert np.array_equal(firedMany[:, col], fired)
+
+    # the cached sparse incidence follows changes to the graph
+    uber.addNode(np.zeros(uber.getSize()), "v_5")
+    assert not uber.isProducible("v_5", ["v_0"])
+    uber.addEdge(np.array([0, 0, 0, -1, 0, 1]), "e_4")
+    assert uber.isProducible("v_5", ["v_0"])
+    uber.setEdge(0, np.array([-1, -1, 0, 0, 0, 0]))
+    assert not uber.isProducible("v_5", ["v_0"])
+    uber.setNode(2, np.array([1, -1, 0, 0, 0]))
+    assert uber.isProducible("v_5", ["v_0"])